@@ -2,6 +2,18 @@ from flask import Flask, render_template, redirect, url_for, flash
 from flask_login import LoginManager, login_required, current_user
 from config import config
 from models import db, User
+from tenancy import init_tenancy, login_user_id
+from compact_json import init_json_columns
+from assets import init_assets
+from fragment_cache import init_fragment_cache
+from compression import init_compression
+from instrumentation import init_instrumentation
+from metrics import init_metrics
+from profiler import init_profiler
+from scheduler import init_scheduler
+from search import init_search
+from ratelimit import init_rate_limits
+from recommender import init_recommender, recommend
 import os
 
 def create_app(config_name=None):
@@ -26,6 +38,18 @@ def create_app(config_name=None):
     # Initialize database
     db.init_app(app)
     
+    # Codec for the compressed scenario_content / session_data columns
+    init_json_columns(app)
+    
+    # Organisation per request (subdomain or header) and its shard database, before anything queries
+    init_tenancy(app)
+    
+    # Per-request SQL query counting and slow query log (opt-in)
+    init_instrumentation(app)
+    
+    # Initialize template fragment cache
+    init_fragment_cache(app)
+    
     # Initialize Flask-Login
     login_manager = LoginManager()
     login_manager.init_app(app)
@@ -35,8 +59,9 @@ def create_app(config_name=None):
     
     @login_manager.user_loader
     def load_user(user_id):
-        """Load user by ID for Flask-Login"""
-        return User.query.get(int(user_id))
+        """Load user by ID for Flask-Login (ids are per organisation, see User.get_id)"""
+        user_id = login_user_id(user_id)
+        return User.query.get(user_id) if user_id is not None else None
     
     # Create database tables
     with app.app_context():
@@ -48,12 +73,36 @@ def create_app(config_name=None):
             create_default_instructor()
             print("✅ Default instructor created")
     
+    # Full-text scenario search index (FTS5 / tsvector), kept in sync on scenario changes
+    init_search(app)
+    
+    # Next-scenario recommendations: library matrix and per-user result cache
+    init_recommender(app)
+    
     # Register blueprints
     register_blueprints(app)
     
     # Register error handlers
     register_error_handlers(app)
     
+    # Fingerprint static assets (must run after blueprints so url_for works)
+    init_assets(app)
+    
+    # Compress HTML/JSON responses (works without a reverse proxy)
+    init_compression(app)
+    
+    # Prometheus metrics: request latency, DB pool, cache and domain counters
+    init_metrics(app)
+    
+    # Token-bucket limits: fast 429s for login/register/gameplay floods (after metrics, so they're counted)
+    init_rate_limits(app)
+    
+    # Instructor-only request/worker profiling (opt-in)
+    init_profiler(app)
+    
+    # Leader-elected maintenance jobs: abandoned-session reaper, stats, archival (opt-in)
+    init_scheduler(app)
+    
     # Main routes
     @app.route('/')
     def index():
@@ -66,7 +115,8 @@ def create_app(config_name=None):
         """User dashboard - redirects based on role"""
         if current_user.role == 'instructor':
             return redirect(url_for('admin.dashboard'))
-        return render_template('dashboard.html', user=current_user)
+        return render_template('dashboard.html', user=current_user,
+                               recommendations=recommend(current_user.id))
     
     # Context processor - makes variables available to all templates
     @app.context_processor
@@ -84,10 +134,12 @@ def register_blueprints(app):
         from routes.auth import auth_bp
         from routes.scenarios import scenario_bp
         from routes.admin import admin_bp
+        from routes.teams import team_bp
         
         app.register_blueprint(auth_bp)
         app.register_blueprint(scenario_bp)
         app.register_blueprint(admin_bp)
+        app.register_blueprint(team_bp)
         
         print("✅ Blueprints registered successfully")
     except ImportError as e:
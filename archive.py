@@ -0,0 +1,155 @@
+"""
+Session archival
+Completed and abandoned sessions that ended more than
+ARCHIVE_RETENTION_DAYS ago move out of training_sessions into
+gzip-compressed JSONL files, one per month of the session's end
+(instance/archive/sessions-2025-03.jsonl.gz). Their totals are folded into
+session_summaries in the same transaction that deletes them, so averages,
+completion rates and cohort rollups come out the same.
+
+Each batch is written and fsync'd before its DB transaction commits. If
+the commit fails, the next run writes those sessions again; readers keep
+one copy per session id.
+"""
+
+import gzip
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from models import db, TrainingSession, SessionSummary, CATEGORIES
+
+ARCHIVED_STATUSES = ('completed', 'abandoned')
+DATETIME_FIELDS = ('started_at', 'completed_at', 'created_at')
+
+
+def archive_path(directory, month):
+    """File holding the sessions that ended in `month` (YYYY-MM)"""
+    return os.path.join(directory, f'sessions-{month}.jsonl.gz')
+
+
+def list_archives(directory):
+    """[(month, path, size_bytes)] for every archive file, oldest first"""
+    if not os.path.isdir(directory):
+        return []
+    archives = []
+    for name in sorted(os.listdir(directory)):
+        if name.startswith('sessions-') and name.endswith('.jsonl.gz'):
+            path = os.path.join(directory, name)
+            archives.append((name[len('sessions-'):-len('.jsonl.gz')], path, os.path.getsize(path)))
+    return archives
+
+
+def _ended_at(row):
+    return row['completed_at'] or row['started_at']
+
+
+def _encode(row):
+    return json.dumps({key: value.isoformat() if isinstance(value, datetime) else value
+                       for key, value in row.items()}, separators=(',', ':'))
+
+
+def _append(path, rows):
+    """Append rows as a new gzip member - concatenated members read back as one stream"""
+    with open(path, 'ab') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='ab') as f:
+            f.write(''.join(_encode(row) + '\n' for row in rows).encode('utf-8'))
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def _summarize(rows):
+    """Per-(user, scenario) totals of a batch, shaped for SessionSummary.add"""
+    summaries = {}
+    for row in rows:
+        key = (row['user_id'], row['scenario_id'])
+        summary = summaries.get(key)
+        if summary is None:
+            summary = summaries[key] = dict(
+                {name: 0 for name in SessionSummary.TOTALS},
+                user_id=row['user_id'], scenario_id=row['scenario_id'],
+                best_score=0, best_score_at=None, last_completed_at=None)
+
+        summary['started_count'] += 1
+        if row['status'] != 'completed':
+            continue
+
+        score = row['score'] or 0
+        summary['completed_count'] += 1
+        summary['score_total'] += score
+        summary['time_total'] += row['time_taken'] or 0
+        for category in CATEGORIES:
+            summary[f'{category}_total'] += row[f'{category}_score'] or 0
+
+        completed_at = row['completed_at']
+        if summary['best_score_at'] is None or score > summary['best_score']:
+            summary['best_score'], summary['best_score_at'] = score, completed_at
+        if completed_at and (summary['last_completed_at'] is None or completed_at > summary['last_completed_at']):
+            summary['last_completed_at'] = completed_at
+    return list(summaries.values())
+
+
+def archivable(cutoff):
+    """Filter for sessions that ended before `cutoff` and may be archived"""
+    ended = db.func.coalesce(TrainingSession.completed_at, TrainingSession.started_at)
+    return db.and_(TrainingSession.status.in_(ARCHIVED_STATUSES), ended < cutoff)
+
+
+def archive_sessions(directory, retention_days, batch_size=5000, now=None, dry_run=False, max_batches=None):
+    """Move old sessions to the archive files in batches; returns a stats dict"""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=retention_days)
+    stats = {'cutoff': cutoff, 'archived': 0, 'batches': 0, 'months': set()}
+
+    if dry_run:
+        stats['archived'] = db.session.query(db.func.count(TrainingSession.id)).filter(
+            archivable(cutoff)).scalar()
+        return stats
+
+    os.makedirs(directory, exist_ok=True)
+    table = TrainingSession.__table__
+
+    while max_batches is None or stats['batches'] < max_batches:
+        rows = db.session.execute(
+            db.select(table).where(archivable(cutoff)).order_by(table.c.id).limit(batch_size)
+        ).mappings().all()
+        if not rows:
+            break
+
+        by_month = defaultdict(list)
+        for row in rows:
+            by_month[_ended_at(row).strftime('%Y-%m')].append(row)
+        for month, month_rows in by_month.items():
+            _append(archive_path(directory, month), month_rows)
+
+        try:
+            SessionSummary.add(_summarize(rows))
+            db.session.execute(table.delete().where(table.c.id.in_([row['id'] for row in rows])))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        stats['archived'] += len(rows)
+        stats['batches'] += 1
+        stats['months'].update(by_month)
+
+    return stats
+
+
+def iter_archived(directory, months=None):
+    """Yield archived sessions as dicts (datetimes parsed), optionally only some YYYY-MM months"""
+    for month, path, _size in list_archives(directory):
+        if months is not None and month not in months:
+            continue
+        seen = set()
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                row = json.loads(line)
+                if row['id'] in seen:
+                    continue
+                seen.add(row['id'])
+                for field in DATETIME_FIELDS:
+                    if row.get(field):
+                        row[field] = datetime.fromisoformat(row[field])
+                yield row
@@ -0,0 +1,221 @@
+"""
+Static asset fingerprinting
+Content-hashes files in static/, rewrites url_for('static') to the hashed
+names and serves them with immutable caching and precompressed variants
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+from flask import Response, request, send_file, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # Optional - gzip variants are always produced
+    brotli = None
+
+# Text formats worth precompressing (images are already compressed)
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.json', '.svg', '.html', '.txt', '.map'}
+
+# Files whose URL must never change (browsers look them up by fixed path)
+UNHASHED_FILES = {'js/service-worker.js'}
+
+# Assets the service worker pre-caches on install
+PRECACHE_FILES = ['css/main.css', 'js/main.js', "img/Don't Panic logo.png"]
+
+HASH_LENGTH = 10
+
+
+class AssetManifest:
+    """Maps static filenames to content-hashed names and back"""
+
+    def __init__(self, static_folder, cache_dir, precompress=True, auto_reload=False):
+        self.static_folder = static_folder
+        self.cache_dir = cache_dir
+        self.precompress = precompress
+        self.auto_reload = auto_reload
+        self.entries = {}    # 'css/main.css' -> {'hashed': ..., 'mtime': ..., 'size': ...}
+        self.reverse = {}    # 'css/main.3f2a1b9c0d.css' -> 'css/main.css'
+
+    def build(self):
+        """Hash every file in the static folder"""
+        self.entries.clear()
+        self.reverse.clear()
+        for root, _dirs, files in os.walk(self.static_folder):
+            for name in files:
+                path = os.path.join(root, name)
+                filename = os.path.relpath(path, self.static_folder).replace(os.sep, '/')
+                if filename not in UNHASHED_FILES:
+                    self._add(filename)
+        return self
+
+    def _add(self, filename):
+        """Hash a single file and write its compressed variants"""
+        path = os.path.join(self.static_folder, filename)
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+        base, ext = os.path.splitext(filename)
+        hashed = f'{base}.{digest}{ext}'
+
+        old = self.entries.get(filename)
+        if old:
+            self.reverse.pop(old['hashed'], None)
+
+        stat = os.stat(path)
+        self.entries[filename] = {
+            'hashed': hashed,
+            'digest': digest,
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+        }
+        self.reverse[hashed] = filename
+
+        if self.precompress and ext.lower() in COMPRESSIBLE_EXTENSIONS:
+            self._write_variants(hashed, data)
+
+    def _write_variants(self, hashed, data):
+        """Write .gz (and .br when brotli is installed) next to the cache key"""
+        variants = {'gzip': lambda d: gzip.compress(d, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['br'] = lambda d: brotli.compress(d, quality=11)
+
+        for encoding, compress in variants.items():
+            target = self.variant_path(hashed, encoding)
+            # Hashed names are content-addressed, so an existing file is current
+            if os.path.exists(target):
+                continue
+            compressed = compress(data)
+            if len(compressed) >= len(data):
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp = f'{target}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(compressed)
+            os.replace(tmp, target)
+
+    def variant_path(self, hashed, encoding):
+        """Path of the precompressed file for an encoding"""
+        suffix = '.br' if encoding == 'br' else '.gz'
+        return os.path.join(self.cache_dir, *hashed.split('/')) + suffix
+
+    def _refresh(self, filename):
+        """Re-hash a file whose mtime changed (development only)"""
+        entry = self.entries.get(filename)
+        path = os.path.join(self.static_folder, filename)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return
+        if entry is None or entry['mtime'] != mtime:
+            self._add(filename)
+
+    def hashed(self, filename):
+        """Return the fingerprinted name for a static file, or the name unchanged"""
+        if filename in UNHASHED_FILES:
+            return filename
+        if self.auto_reload:
+            self._refresh(filename)
+        entry = self.entries.get(filename)
+        return entry['hashed'] if entry else filename
+
+    def resolve(self, requested):
+        """Return the original filename for a hashed name, or None"""
+        return self.reverse.get(requested)
+
+    @property
+    def version(self):
+        """Digest over the whole manifest - changes whenever any asset changes"""
+        digest = hashlib.sha256()
+        for filename in sorted(self.entries):
+            digest.update(filename.encode('utf-8'))
+            digest.update(self.entries[filename]['digest'].encode('ascii'))
+        return digest.hexdigest()[:HASH_LENGTH]
+
+    def to_dict(self):
+        """Plain filename -> hashed filename mapping"""
+        return {name: entry['hashed'] for name, entry in self.entries.items()}
+
+
+def init_assets(app):
+    """Build the asset manifest and wire it into url_for and the static view"""
+    if not app.config.get('ASSET_FINGERPRINTING', True) or not app.static_folder:
+        return None
+
+    manifest = AssetManifest(
+        app.static_folder,
+        app.config.get('ASSET_CACHE_DIR') or os.path.join(app.instance_path, 'assets'),
+        precompress=app.config.get('ASSET_PRECOMPRESS', True),
+        auto_reload=app.debug,
+    ).build()
+    app.extensions['asset_manifest'] = manifest
+
+    max_age = app.config.get('ASSET_MAX_AGE', 365 * 24 * 3600)
+    default_static_view = app.view_functions['static']
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        """Rewrite url_for('static', filename=...) to the hashed name"""
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = manifest.hashed(values['filename'])
+
+    def static_view(filename):
+        """Serve hashed assets immutably, everything else as Flask normally would"""
+        original = manifest.resolve(filename)
+        if original is None:
+            return default_static_view(filename=filename)
+
+        encoding = _negotiate_encoding(manifest, filename)
+        if encoding:
+            mimetype = mimetypes.guess_type(original)[0] or 'application/octet-stream'
+            response = send_file(
+                manifest.variant_path(filename, encoding),
+                mimetype=mimetype,
+                max_age=max_age,
+                etag=f"{manifest.entries[original]['digest']}-{encoding}",
+                download_name=os.path.basename(filename),  # Not the .gz/.br name on disk
+            )
+            response.headers['Content-Encoding'] = encoding
+        else:
+            response = send_from_directory(app.static_folder, original, max_age=max_age)
+
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        response.vary.add('Accept-Encoding')
+        return response
+
+    app.view_functions['static'] = static_view
+
+    @app.route('/service-worker.js')
+    def service_worker():
+        """Service worker served from the root so its scope covers the whole app"""
+        path = os.path.join(app.static_folder, 'js', 'service-worker.js')
+        with open(path, encoding='utf-8') as f:
+            script = f.read()
+
+        precache = [url_for('index')] + [
+            url_for('static', filename=name) for name in PRECACHE_FILES
+            if name in manifest.entries
+        ]
+        header = (
+            f'self.ASSET_VERSION = {json.dumps(manifest.version)};\n'
+            f'self.PRECACHE_URLS = {json.dumps(precache)};\n'
+        )
+        response = Response(header + script, mimetype='application/javascript')
+        # The browser must always re-check the worker so new versions activate
+        response.cache_control.no_cache = True
+        return response
+
+    return manifest
+
+
+def _negotiate_encoding(manifest, hashed):
+    """Pick the best precompressed variant the client accepts"""
+    for encoding in ('br', 'gzip'):
+        if request.accept_encodings[encoding] and os.path.exists(manifest.variant_path(hashed, encoding)):
+            return encoding
+    return None
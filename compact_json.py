@@ -0,0 +1,132 @@
+"""
+Compressed JSON columns
+Scenario.scenario_content, ScenarioVersion.scenario_content and
+TrainingSession.session_data are stored as a binary envelope instead of
+JSON text:
+
+    [format byte][payload]
+
+- 0x00  the UTF-8 text as is (too short for compression to pay)
+- 0x01  raw deflate (zlib) primed with ZDICT
+- 0x02  zstd primed with ZDICT (needs the zstandard package)
+
+Python code still sees the same str - the JSON text is kept exactly,
+formatting included, so the editor shows what was saved and version hashes
+don't change. A JSON document never starts with a byte below 0x09, so a
+value that doesn't start with a format byte is legacy text (rows not yet
+converted by scripts/compress_json_columns.py) and reads back unchanged.
+
+ZDICT holds the keys and values every document repeats. Small documents
+such as a short decision log compress well because of it. It is part of
+formats 1 and 2 and must never change; a new dictionary needs a new
+format byte.
+"""
+
+import zlib
+
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+try:
+    import zstandard
+except ImportError:  # Optional - zlib is always available
+    zstandard = None
+
+RAW, ZLIB, ZSTD = 0x00, 0x01, 0x02
+CODECS = {'zlib': ZLIB, 'zstd': ZSTD}
+MIN_COMPRESS_BYTES = 64  # Shorter values are stored as RAW
+
+# Likeliest matches last - deflate codes nearer distances in fewer bits
+ZDICT = ''.join([
+    ' Time is critical. The security team is waiting for your direction. Notify the incident response team',
+    ' and preserve evidence before restoring systems from backups. What is your first action? What do you do?',
+    '{"intro": "", "stages": [{"stage": "detection", "content": "", "question": "", "options": [',
+    '{"text": "", "points": 0, "next": "END", "metrics": {"detection": 1, "containment": 1,',
+    ' "eradication": 1, "recovery": 1, "communication": 1}}]}]}',
+    '{"stage": "containment", "stage": "eradication", "stage": "recovery", "stage": "communication",',
+    '{"intro":"","stages":[{"stage":"detection","content":"","question":"","options":[',
+    '{"text":"","points":0,"next":"END","metrics":{"detection":1,"containment":1,',
+    '"eradication":1,"recovery":1,"communication":1}}]}]}',
+    '{"decisions": [{"decision": {"stage": 0, "option": 0, "points": 0}, "recorded_at": "2026-01-01T00:00:00.000000"}',
+    '{"decisions":[{"decision":{"stage":0,"option":0,"points":0},"recorded_at":"2026-01-01T00:00:00.000000"}',
+    ',{"decision":{"stage":1,"option":2,"points":30},"recorded_at":"2026-',
+]).encode('utf-8')
+
+_codec = ZLIB
+_level = 6
+_zstd_dict = None
+
+
+def configure(codec='zlib', level=6):
+    """Codec and level for new values (reads accept every format)"""
+    global _codec, _level
+    if codec not in CODECS:
+        raise ValueError(f'JSON_COLUMN_CODEC must be one of {sorted(CODECS)}')
+    if codec == 'zstd' and zstandard is None:
+        codec = 'zlib'  # Not installed - fall back rather than fail every write
+    _codec, _level = CODECS[codec], level
+
+
+def _zstd():
+    global _zstd_dict
+    if zstandard is None:
+        raise RuntimeError('this value is zstd-compressed; install the zstandard package to read it')
+    if _zstd_dict is None:
+        _zstd_dict = zstandard.ZstdCompressionDict(ZDICT, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+    return _zstd_dict
+
+
+def encode(text, codec=None, level=None):
+    """Envelope bytes for a JSON string"""
+    data = text.encode('utf-8')
+    codec = _codec if codec is None else codec
+    level = _level if level is None else level
+    if len(data) >= MIN_COMPRESS_BYTES:
+        if codec == ZSTD:
+            packed = zstandard.ZstdCompressor(level=level, dict_data=_zstd(), write_content_size=True,
+                                              write_checksum=False, write_dict_id=False).compress(data)
+        else:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, 9, zlib.Z_DEFAULT_STRATEGY, ZDICT)
+            packed = compressor.compress(data) + compressor.flush()
+        if len(packed) < len(data):
+            return bytes((codec,)) + packed
+    return bytes((RAW,)) + data
+
+
+def is_encoded(value):
+    """True for envelope bytes, False for legacy JSON text"""
+    return isinstance(value, (bytes, bytearray, memoryview)) and len(value) > 0 and value[0] <= ZSTD
+
+
+def decode(value):
+    """JSON string from envelope bytes or legacy text"""
+    if isinstance(value, str):
+        return value
+    value = bytes(value)
+    if not is_encoded(value):
+        return value.decode('utf-8')  # Legacy text in a binary column (PostgreSQL after the type change)
+    codec, payload = value[0], value[1:]
+    if codec == ZLIB:
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS, ZDICT)
+        payload = decompressor.decompress(payload) + decompressor.flush()
+    elif codec == ZSTD:
+        zdict = _zstd()  # First - it explains a missing zstandard package
+        payload = zstandard.ZstdDecompressor(dict_data=zdict).decompress(payload)
+    return payload.decode('utf-8')
+
+
+class CompressedJSON(TypeDecorator):
+    """JSON text column stored as a compressed envelope - Python sees the same str"""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else encode(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else decode(value)
+
+
+def init_json_columns(app):
+    """Pick the codec for new values from JSON_COLUMN_CODEC / JSON_COLUMN_LEVEL"""
+    configure(app.config.get('JSON_COLUMN_CODEC', 'zlib'), app.config.get('JSON_COLUMN_LEVEL', 6))
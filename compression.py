@@ -0,0 +1,83 @@
+"""
+Response compression
+gzip/deflate for HTML and JSON responses, done in-app so deployments that
+run gunicorn directly (see render.yaml) get it without a reverse proxy.
+"""
+
+import zlib
+
+from flask import request
+
+# zlib wbits for each Content-Encoding ("deflate" in HTTP means zlib-wrapped)
+WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+
+def _compressor(encoding, level):
+    return zlib.compressobj(level, zlib.DEFLATED, WBITS[encoding])
+
+
+def _stream(chunks, encoding, level):
+    """Compress a streamed body chunk by chunk, flushing so output isn't held back"""
+    compressor = _compressor(encoding, level)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush(zlib.Z_FINISH)
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def init_compression(app):
+    """Compress eligible responses in an after_request hook"""
+    if not app.config.get('COMPRESS_ENABLED', True):
+        return
+
+    mimetypes = set(app.config.get('COMPRESS_MIMETYPES', ['text/html', 'application/json']))
+    min_size = app.config.get('COMPRESS_MIN_SIZE', 500)
+    level = app.config.get('COMPRESS_LEVEL', 6)
+    algorithms = [a for a in app.config.get('COMPRESS_ALGORITHMS', ['gzip', 'deflate']) if a in WBITS]
+
+    @app.after_request
+    def compress_response(response):
+        """gzip/deflate the body when the client accepts it and it's worth it"""
+        if (response.status_code < 200
+                or response.status_code in (204, 206, 304)
+                or request.method == 'HEAD'
+                or response.direct_passthrough  # send_file - static files are precompressed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in mimetypes):
+            return response
+
+        encoding = request.accept_encodings.best_match(algorithms)
+        if not encoding:
+            return response
+
+        if response.is_streamed:
+            # Size unknown up front - always compress, chunk by chunk
+            response.response = _stream(response.response, encoding, level)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < min_size:
+                return response
+            compressor = _compressor(encoding, level)
+            response.set_data(compressor.compress(data) + compressor.flush())
+
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+
+        # The compressed body is a different representation - weaken the ETag
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+
+        return response
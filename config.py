@@ -26,6 +26,125 @@ class Config:
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     UPLOAD_FOLDER = os.path.join(basedir, 'uploads')
     ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif'}
+    
+    # Static asset settings
+    ASSET_FINGERPRINTING = True  # Serve static files under content-hashed names
+    ASSET_PRECOMPRESS = True  # Write .gz (and .br if brotli is installed) variants
+    ASSET_MAX_AGE = 365 * 24 * 60 * 60  # Hashed files never change, cache for a year
+    ASSET_CACHE_DIR = os.path.join(basedir, 'instance', 'assets')
+    
+    # Template fragment cache settings
+    FRAGMENT_CACHE_BACKEND = 'memory'  # 'memory', 'filesystem' (shared by workers) or None
+    FRAGMENT_CACHE_MAX_ENTRIES = 500
+    FRAGMENT_CACHE_DIR = os.path.join(basedir, 'instance', 'fragment_cache')
+    
+    # Response compression settings
+    COMPRESS_ENABLED = True
+    COMPRESS_MIMETYPES = ['text/html', 'application/json']
+    COMPRESS_ALGORITHMS = ['gzip', 'deflate']  # In order of preference
+    COMPRESS_MIN_SIZE = 500  # Bytes - smaller bodies aren't worth the CPU
+    COMPRESS_LEVEL = 6  # 1 (fastest) to 9 (smallest)
+    
+    # SQL instrumentation (opt-in): Server-Timing headers, per-request log line, slow query log
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', '').lower() in ('1', 'true', 'yes')
+    SLOW_QUERY_THRESHOLD_MS = int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+    SQL_INSTRUMENTATION_TOP_N = 3  # Slowest statements reported per request
+    
+    # Prometheus metrics at /metrics
+    METRICS_ENABLED = True
+    # Shared directory for per-worker metric files (set it when running several gunicorn workers)
+    METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Optional bearer token for scrapes
+    
+    # On-demand profiler for instructors (?_profile=collapsed|text|pstats, /admin/profile)
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', '').lower() in ('1', 'true', 'yes')
+    PROFILER_MAX_SECONDS = 10  # Cap for worker sampling and per-request sampling
+    WORKER_TIMEOUT = int(os.environ.get('WORKER_TIMEOUT', 30))  # gunicorn --timeout; worker sampling stays under half of it
+    PROFILER_SAMPLE_INTERVAL = 0.005  # Seconds between stack samples
+    PROFILER_MAX_OUTPUT_BYTES = 1024 * 1024
+    
+    # Leaderboards
+    LEADERBOARD_SIZE = 20  # Rows shown per board
+    
+    # User/scenario deletes: sessions go in short batches so trainees' writes aren't blocked
+    BULK_DELETE_BATCH_SIZE = 1000
+    BULK_DELETE_PAUSE = 0.05  # Seconds between batches
+    
+    # Compressed JSON columns (compact_json.py): scenario_content and session_data
+    JSON_COLUMN_CODEC = 'zlib'  # 'zlib', or 'zstd' (needs the zstandard package; falls back to zlib)
+    JSON_COLUMN_LEVEL = 6
+    
+    # Scenario search
+    SEARCH_PAGE_SIZE = 20
+    
+    # Published scenario versions never change, so their JSON is cached for a year
+    SCENARIO_VERSION_MAX_AGE = 365 * 24 * 60 * 60
+    
+    # Dashboard recommendations (recommender.py)
+    RECOMMENDATIONS_SHOWN = 5
+    RECOMMENDER_CACHE_USERS = 10000  # Users whose ranked results are kept in memory per worker
+    
+    # Scenario simulator in the editor (simulator.py): random playthroughs when exact enumeration can't be used
+    SIMULATOR_RUNS = 100_000
+    SIMULATOR_MAX_RUNS = 1_000_000
+    
+    # Scenario pack import (scenario_packs.py): validation runs in a process pool
+    PACK_IMPORT_WORKERS = min(4, os.cpu_count() or 1)  # 0 or 1 validates in the request
+    PACK_IMPORT_CHUNK_SIZE = 100  # Entries per worker task
+    PACK_IMPORT_BATCH_SIZE = 500  # Rows per executemany insert
+    
+    # Team exercises (teams.py): one scenario played together, each member owning roles (categories)
+    TEAM_MAX_MEMBERS = 8
+    TEAM_POLL_SECONDS = 2  # How often team pages ask for changes (304 while there are none)
+    TEAM_CAS_RETRIES = 5  # Joins and role claims that lose a compare-and-swap re-read and retry
+    
+    # Token-bucket admission control (ratelimit.py): over-limit POSTs get 429 + Retry-After
+    RATE_LIMIT_ENABLED = True
+    RATE_LIMIT_BACKEND = 'shared'  # 'memory' (per worker), 'shared' (all workers on the host) or 'database' (all hosts)
+    RATE_LIMIT_SHARED_FILE = os.path.join(basedir, 'instance', 'rate_limits.bin')
+    RATE_LIMIT_SHARED_SLOTS = 65536  # 24 bytes each
+    RATE_LIMIT_PROXY_HOPS = int(os.environ.get('RATE_LIMIT_PROXY_HOPS', 0))  # Trusted proxies adding X-Forwarded-For
+    RATE_LIMIT_IDLE_SECONDS = 24 * 60 * 60  # Database buckets idle this long are pruned
+    RATE_LIMITS = {  # Endpoint -> scope ('global', 'ip' or 'user') -> (tokens per second, burst)
+        # Password hashing is the dearest thing a worker does; the ip burst lets a class behind one NAT in
+        'auth.login': {'global': (10, 50), 'ip': (5, 300), 'user': (0.2, 5)},
+        'auth.register': {'global': (2, 20), 'ip': (0.1, 10)},
+        'scenarios.submit_decision': {'global': (200, 1000), 'user': (2, 30)},
+        'scenarios.complete': {'global': (50, 300), 'user': (0.2, 5)},
+        'teams.decide': {'global': (200, 1000), 'user': (2, 30)},
+        'teams.claim_roles': {'user': (1, 20)},
+    }
+    
+    # Multi-tenant organisations (tenancy.py): each has its own database on one of TENANT_SHARDS
+    TENANT_DOMAIN = os.environ.get('TENANT_DOMAIN')  # <slug>.TENANT_DOMAIN picks an organisation (None: the domain in CNAME)
+    TENANT_HEADER = os.environ.get('TENANT_HEADER')  # e.g. 'X-Tenant' - only if a trusted proxy sets it
+    TENANT_SHARDS = {  # Shard -> URL template ({tenant} is the slug), or {'url': ..., engine options}
+        'local': 'sqlite:///' + os.path.join(basedir, 'instance', 'tenants', '{tenant}.db'),
+    }
+    TENANT_ENGINE_OPTIONS = {'pool_size': 5, 'max_overflow': 5, 'pool_recycle': 1800, 'pool_pre_ping': True}
+    TENANT_MAX_ENGINES = 200  # Organisation databases with an open pool per worker
+    TENANT_CACHE_SECONDS = 30  # Shard map lookups are cached this long (moves wait it out)
+    
+    # Session archival (scripts/archive_sessions.py)
+    ARCHIVE_DIR = os.path.join(basedir, 'instance', 'archive')
+    ARCHIVE_RETENTION_DAYS = 365  # Sessions that ended earlier are archived
+    ARCHIVE_BATCH_SIZE = 5000
+    ARCHIVE_MAX_BATCHES_PER_RUN = 20  # Bound for each scheduled archive run
+    
+    # Background maintenance scheduler (one leader across workers via a DB lease row)
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', '').lower() in ('1', 'true', 'yes')
+    SCHEDULER_TICK_SECONDS = 30
+    SCHEDULER_LEASE_SECONDS = 90  # A dead leader is replaced after this long
+    SCHEDULER_JOBS = {  # Job name -> seconds between runs (0 disables)
+        'reap_abandoned': 5 * 60,
+        'refresh_scenario_stats': 15 * 60,
+        'archive_sessions': 24 * 60 * 60,
+        'prune_leaderboards': 24 * 60 * 60,
+        'prune_scenario_versions': 24 * 60 * 60,
+        'prune_rate_limits': 60 * 60,
+    }
+    SESSION_ABANDON_AFTER_HOURS = 24  # In-progress sessions older than this are abandoned
+    REAPER_BATCH_SIZE = 1000
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -43,6 +162,8 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'  # In-memory database
     WTF_CSRF_ENABLED = False  # Disable CSRF for testing
+    RATE_LIMIT_BACKEND = 'memory'
+    RATE_LIMITS = {}  # Benchmarks post from one client in a tight loop; tests set their own limits
 
 # Configuration dictionary
 config = {
@@ -64,10 +64,12 @@ def create_sample_data():
             incident_type='ransomware',
             difficulty_level=3,
             estimated_time=30,
+            max_points=100,
             scenario_content=json.dumps(scenario_content),
             created_by=instructor.id
         )
         db.session.add(scenario)
+        scenario.publish(instructor.id)
         db.session.commit()
         
         print("✅ Sample scenario created!")
@@ -76,6 +78,7 @@ def create_sample_data():
         session = TrainingSession(
             user_id=trainee1.id,
             scenario_id=scenario.id,
+            version_hash=scenario.version_hash,
             status='completed',
             score=85,
             outcome='success',
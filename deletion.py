@@ -0,0 +1,126 @@
+"""
+Chunked deletes for users and scenarios
+A scenario with tens of thousands of plays used to be deleted by the ORM
+loading and deleting every session in one transaction, holding SQLite's
+write lock (and blocking every trainee's submit) until it finished.
+
+Here a user's or scenario's sessions are deleted BULK_DELETE_BATCH_SIZE
+at a time, each batch in its own short transaction with a pause after it
+so other writers get in. The parent row goes last; ON DELETE CASCADE
+removes what is left (memberships, rollups, summaries, leaderboard rows
+and any session created in the meantime) in that final statement.
+
+Each function is a generator of progress dicts, for the NDJSON endpoint.
+"""
+
+import time
+
+from models import (db, User, Scenario, TrainingSession, Cohort, CohortAssignment,
+                    CohortRollup, LeaderboardEntry, cohort_members)
+
+
+def _delete_sessions(criterion, batch_size, pause):
+    """Delete matching sessions in short transactions; yields the running count"""
+    deleted = 0
+    while True:
+        ids = [row.id for row in db.session.query(TrainingSession.id).filter(criterion)
+               .order_by(TrainingSession.id).limit(batch_size)]
+        if not ids:
+            break
+        deleted += db.session.query(TrainingSession).filter(TrainingSession.id.in_(ids)).delete(
+            synchronize_session=False)
+        db.session.commit()
+        yield deleted
+        if pause:
+            time.sleep(pause)
+
+
+def _blocking_references(user_id):
+    """Why a user can't be deleted (rows that must keep pointing at them), or None"""
+    if db.session.query(Scenario.id).filter_by(created_by=user_id).first():
+        return 'created scenarios'
+    if db.session.query(Cohort.id).filter_by(created_by=user_id).first():
+        return 'created cohorts'
+    if db.session.query(CohortAssignment.id).filter_by(assigned_by=user_id).first():
+        return 'assigned scenarios to cohorts'
+    return None
+
+
+def delete_user(user_id, batch_size=1000, pause=0.0):
+    """Delete a user and everything that belongs to them; yields progress dicts"""
+    user = db.session.get(User, user_id)
+    if user is None:
+        yield {'kind': 'user', 'id': user_id, 'status': 'missing'}
+        return
+    username = user.username
+    reason = _blocking_references(user_id)
+    if reason:
+        yield {'kind': 'user', 'id': user_id, 'name': username, 'status': 'skipped',
+               'reason': f'{username} has {reason}'}
+        return
+
+    total = db.session.query(db.func.count(TrainingSession.id)).filter_by(user_id=user_id).scalar()
+    cohort_ids = [row.cohort_id for row in db.session.execute(
+        db.select(cohort_members.c.cohort_id).where(cohort_members.c.user_id == user_id))]
+    db.session.commit()  # Don't hold a read transaction across the batches
+    yield {'kind': 'user', 'id': user_id, 'name': username, 'status': 'started', 'sessions': total}
+
+    deleted = 0
+    for deleted in _delete_sessions(TrainingSession.user_id == user_id, batch_size, pause):
+        yield {'kind': 'user', 'id': user_id, 'status': 'progress', 'deleted': deleted, 'sessions': total}
+
+    db.session.query(User).filter_by(id=user_id).delete(synchronize_session=False)
+    db.session.commit()
+
+    # Cohort totals included this user's sessions
+    for cohort_id in cohort_ids:
+        CohortRollup.rebuild(cohort_id)
+    db.session.commit()
+    yield {'kind': 'user', 'id': user_id, 'name': username, 'status': 'deleted', 'deleted': deleted}
+
+
+def delete_scenario(scenario_id, batch_size=1000, pause=0.0):
+    """Delete a scenario and all its sessions; yields progress dicts"""
+    scenario = db.session.get(Scenario, scenario_id)
+    if scenario is None:
+        yield {'kind': 'scenario', 'id': scenario_id, 'status': 'missing'}
+        return
+    title = scenario.title
+    total = db.session.query(db.func.count(TrainingSession.id)).filter_by(scenario_id=scenario_id).scalar()
+
+    # Overall boards hold sums of per-scenario bests - take this scenario's share out first
+    LeaderboardEntry.remove_scenario(scenario_id)
+    db.session.commit()
+    yield {'kind': 'scenario', 'id': scenario_id, 'name': title, 'status': 'started', 'sessions': total}
+
+    deleted = 0
+    for deleted in _delete_sessions(TrainingSession.scenario_id == scenario_id, batch_size, pause):
+        yield {'kind': 'scenario', 'id': scenario_id, 'status': 'progress', 'deleted': deleted, 'sessions': total}
+
+    # Through the ORM so the search index hears about it
+    scenario = db.session.get(Scenario, scenario_id)
+    if scenario is not None:
+        db.session.delete(scenario)
+    db.session.commit()
+    yield {'kind': 'scenario', 'id': scenario_id, 'name': title, 'status': 'deleted', 'deleted': deleted}
+
+
+def delete_many(kind, ids, batch_size=1000, pause=0.0):
+    """Delete several users or scenarios one after another; yields progress dicts and a summary"""
+    delete_one = delete_user if kind == 'users' else delete_scenario
+    summary = {'kind': kind, 'status': 'done', 'deleted': 0, 'skipped': 0, 'missing': 0, 'errors': 0, 'sessions': 0}
+    for position, item_id in enumerate(ids, start=1):
+        try:
+            for progress in delete_one(item_id, batch_size, pause):
+                progress['item'] = position
+                progress['items'] = len(ids)
+                yield progress
+                if progress['status'] in ('deleted', 'skipped', 'missing'):
+                    summary[progress['status']] += 1
+                    summary['sessions'] += progress.get('deleted', 0)
+        except Exception as e:
+            db.session.rollback()
+            summary['errors'] += 1
+            yield {'kind': kind, 'id': item_id, 'status': 'error', 'error': str(e),
+                   'item': position, 'items': len(ids)}
+    yield summary
@@ -0,0 +1,245 @@
+"""
+Template fragment caching
+Provides a `{% cache name, version... %}...{% endcache %}` Jinja tag whose
+rendered markup is stored under an explicit version stamp (for example
+Scenario.cache_version()), so entries never need invalidating - a new
+version simply produces a new key.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+
+# ========================
+# Backends
+# ========================
+class MemoryBackend:
+    """In-process LRU - fastest, but each gunicorn worker has its own copy"""
+
+    def __init__(self, max_entries=500):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class FileSystemBackend:
+    """One file per fragment - shared by every worker on the host"""
+
+    PRUNE_EVERY = 100  # Writes between size checks
+
+    def __init__(self, directory, max_entries=500):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.html')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so other workers never read a partial file
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(value)
+        os.replace(tmp, path)
+
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        """Remove the least recently written files beyond max_entries"""
+        files = []
+        for root, _dirs, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.html'):
+                    path = os.path.join(root, name)
+                    try:
+                        files.append((os.stat(path).st_mtime, path))
+                    except OSError:
+                        pass
+        files.sort()
+        for _mtime, path in files[:max(0, len(files) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        for root, _dirs, names in os.walk(self.directory):
+            for name in names:
+                try:
+                    os.remove(os.path.join(root, name))
+                except OSError:
+                    pass
+
+
+# ========================
+# Cache front-end
+# ========================
+class FragmentCache:
+    """Looks up rendered fragments and keeps per-fragment hit/miss counts"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._stats = {}
+        self._lock = threading.Lock()
+        self.listeners = []  # callables(name, hit) - e.g. metrics counters
+
+    @staticmethod
+    def make_key(name, versions):
+        """Stable key from the fragment name and its version stamps"""
+        raw = '\x1f'.join([str(name)] + [repr(v) for v in versions])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _record(self, name, hit, elapsed=0.0):
+        with self._lock:
+            entry = self._stats.setdefault(name, {'hits': 0, 'misses': 0, 'render_seconds': 0.0})
+            if hit:
+                entry['hits'] += 1
+            else:
+                entry['misses'] += 1
+                entry['render_seconds'] += elapsed
+        for listener in self.listeners:
+            listener(name, hit)
+
+    def get_or_render(self, name, versions, render):
+        key = self.make_key(name, versions)
+        value = self.backend.get(key)
+        if value is not None:
+            self._record(name, hit=True)
+            return Markup(value)
+
+        started = time.perf_counter()
+        value = render()
+        self._record(name, hit=False, elapsed=time.perf_counter() - started)
+        self.backend.set(key, str(value))
+        return value
+
+    def stats(self):
+        """Hit/miss counts and hit rate per fragment name (this process only)"""
+        with self._lock:
+            report = {}
+            for name, entry in self._stats.items():
+                total = entry['hits'] + entry['misses']
+                report[name] = dict(entry, hit_rate=round(entry['hits'] / total, 4) if total else 0.0)
+            return report
+
+
+class FragmentCacheExtension(Extension):
+    """Adds the {% cache %} tag - a no-op when no cache is configured"""
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+
+        # {% cache 'name', version, ... %}
+        name = parser.parse_expression()
+        versions = []
+        while parser.stream.skip_if('comma'):
+            versions.append(parser.parse_expression())
+
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        call = self.call_method('_render_fragment', [name, nodes.List(versions)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render_fragment(self, name, versions, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        return cache.get_or_render(name, versions, caller)
+
+
+class Lazy:
+    """Defers an expensive template value until a cache miss actually renders it"""
+
+    __slots__ = ('_factory', '_value', '_loaded')
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._loaded = False
+        self._value = None
+
+    def _get(self):
+        if not self._loaded:
+            self._value = self._factory()
+            self._loaded = True
+        return self._value
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+    def __getitem__(self, key):
+        return self._get()[key]
+
+    def __iter__(self):
+        return iter(self._get())
+
+    def __len__(self):
+        return len(self._get())
+
+    def __bool__(self):
+        return bool(self._get())
+
+    def __contains__(self, item):
+        return item in self._get()
+
+
+def init_fragment_cache(app):
+    """Install the {% cache %} tag and the configured backend"""
+    app.jinja_env.add_extension(FragmentCacheExtension)
+
+    backend_name = app.config.get('FRAGMENT_CACHE_BACKEND', 'memory')
+    max_entries = app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 500)
+
+    if backend_name == 'memory':
+        backend = MemoryBackend(max_entries)
+    elif backend_name == 'filesystem':
+        directory = app.config.get('FRAGMENT_CACHE_DIR') or os.path.join(app.instance_path, 'fragment_cache')
+        backend = FileSystemBackend(directory, max_entries)
+    else:
+        return None  # Caching disabled - {% cache %} renders its body every time
+
+    cache = FragmentCache(backend)
+    app.jinja_env.fragment_cache = cache
+    app.extensions['fragment_cache'] = cache
+    return cache
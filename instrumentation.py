@@ -0,0 +1,184 @@
+"""
+SQL instrumentation
+Opt-in (SQL_INSTRUMENTATION = True) per-request query counting and timing
+built on SQLAlchemy engine events. Each request gets a Server-Timing
+header and a structured log line, and statements slower than
+SLOW_QUERY_THRESHOLD_MS are logged together with the route that ran them.
+"""
+
+import json
+import logging
+import time
+import tracemalloc
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('dont_panic.sql')
+
+# Engine events are registered on the Engine class (covers every engine)
+# once per process, however many apps get created
+_listening = False
+_slow_threshold = 0.1
+_top_n = 3
+
+
+class QueryStats:
+    """Statements executed while handling one request"""
+
+    __slots__ = ('count', 'total', 'slowest')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = []  # [(seconds, statement)] - longest first, at most _top_n
+
+    def add(self, elapsed, statement):
+        self.count += 1
+        self.total += elapsed
+        if len(self.slowest) < _top_n or elapsed > self.slowest[-1][0]:
+            self.slowest.append((elapsed, statement))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[_top_n:]
+
+
+class QueryCounter:
+    """Context manager counting statements on one engine - used by tests and benchmarks"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __enter__(self):
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+
+class PeakMemory:
+    """Context manager measuring peak Python allocations (tracemalloc) - used by benchmarks
+
+    .peak is the high-water mark in bytes above what was allocated on entry.
+    """
+
+    def __init__(self):
+        self.peak = 0
+
+    def __enter__(self):
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self._baseline = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, *exc):
+        self.peak = tracemalloc.get_traced_memory()[1] - self._baseline
+        if self._started:
+            tracemalloc.stop()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+
+    route = None
+    if has_request_context():
+        route = request.endpoint
+        stats = g.get('sql_stats')
+        if stats is not None:
+            stats.add(elapsed, statement)
+
+    if elapsed >= _slow_threshold:
+        logger.warning(json.dumps({
+            'event': 'slow_query',
+            'route': route,
+            'duration_ms': round(elapsed * 1000, 2),
+            'statement': ' '.join(statement.split()),
+        }))
+
+
+def _handle_error(context):
+    """A failed statement never reaches after_cursor_execute - drop its start time"""
+    if context.connection is None:
+        return
+    starts = context.connection.info.get('query_start')
+    if starts:
+        starts.pop()
+
+
+def _shorten(statement, limit=120):
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit - 3] + '...'
+
+
+def init_instrumentation(app):
+    """Attach the engine listeners and per-request hooks (no-op unless enabled)"""
+    global _listening, _slow_threshold, _top_n
+
+    if not app.config.get('SQL_INSTRUMENTATION', False):
+        return
+
+    _slow_threshold = app.config.get('SLOW_QUERY_THRESHOLD_MS', 100) / 1000
+    _top_n = app.config.get('SQL_INSTRUMENTATION_TOP_N', 3)
+
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+        _listening = True
+
+    @app.before_request
+    def start_query_stats():
+        g.sql_stats = QueryStats()
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+
+        db_ms = round(stats.total * 1000, 2)
+        total_ms = round((time.perf_counter() - g.pop('request_started')) * 1000, 2)
+        response.headers.add('Server-Timing', f'db;desc="{stats.count} queries";dur={db_ms}')
+        response.headers.add('Server-Timing', f'app;dur={total_ms}')
+
+        logger.info(json.dumps({
+            'event': 'request',
+            'route': request.endpoint,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': total_ms,
+            'db_queries': stats.count,
+            'db_ms': db_ms,
+            'slowest': [
+                {'duration_ms': round(seconds * 1000, 2), 'statement': _shorten(statement)}
+                for seconds, statement in stats.slowest
+            ],
+        }))
+        return response
@@ -0,0 +1,419 @@
+"""
+Prometheus-style metrics
+Request latency histograms, in-flight requests, DB connection usage,
+fragment cache hit ratios and domain counters (logins, sessions started
+and completed), exposed in the text format at /metrics.
+
+Values live in a per-process store. With METRICS_MULTIPROC_DIR set (for
+gunicorn), each worker writes to its own memory-mapped file, and a scrape
+from any worker sums the files of every worker. Each file has a single
+writing process, so an update is one short in-process lock and an 8-byte
+write - no cross-process locking at all.
+
+For gunicorn, empty METRICS_MULTIPROC_DIR before starting the master, so
+counters from an earlier run don't carry over.
+"""
+
+import glob
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+from flask import Response, current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Key layout inside a store: family \0 sample suffix \0 rendered labels
+SEP = '\x00'
+
+
+# ========================
+# Value stores
+# ========================
+class LocalValues:
+    """Plain dict - single process deployments and development"""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc_many(self, updates):
+        with self._lock:
+            for key, amount in updates:
+                self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, key, value):
+        with self._lock:
+            self._values[key] = value
+
+    def collect(self, gauge_families):
+        with self._lock:
+            return dict(self._values)
+
+
+class MmapValues:
+    """One memory-mapped file per process; scrapes sum every process's file
+
+    File layout: an 8-byte header holding the number of bytes used, then
+    entries of [uint32 key length][key, padded][float64 value], with every
+    value 8-byte aligned. The used-bytes header is written last, so a
+    reader never sees a half-written entry.
+
+    The file is opened on the first write in each process, so workers forked
+    from an app built in the master (gunicorn --preload) each get their own.
+    """
+
+    INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, directory, gauge_families):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.gauge_families = gauge_families
+        self.path = None
+        self._pid = None
+        self._file = self._map = None
+        self._lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._forked)
+
+    def _forked(self):
+        """In a new child: the parent's file and a lock another thread may have held aren't ours"""
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _open(self):
+        """Open (or reuse, for a recycled pid) this process's file"""
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+        self._pid = os.getpid()
+        self.path = os.path.join(self.directory, f'metrics_{self._pid}.db')
+        self._positions = {}
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+        if os.fstat(fd).st_size == 0:
+            os.ftruncate(fd, self.INITIAL_SIZE)
+        self._file = os.fdopen(fd, 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._used = struct.unpack_from('I', self._map, 0)[0] or 8
+
+        # A reused pid keeps its counters, but gauges start again from zero
+        for key, _value, position in _read_entries(self._map, self._used):
+            self._positions[key] = position
+            if key.split(SEP, 1)[0] in self.gauge_families:
+                struct.pack_into('d', self._map, position, 0.0)
+        struct.pack_into('I', self._map, 0, self._used)
+
+    def _position(self, key):
+        if self._pid != os.getpid():
+            self._open()
+        position = self._positions.get(key)
+        if position is not None:
+            return position
+
+        encoded = key.encode('utf-8')
+        padded = len(encoded) + (8 - (4 + len(encoded)) % 8) % 8
+        size = 4 + padded + 8
+        while self._used + size > len(self._map):
+            new_size = len(self._map) * 2
+            self._file.truncate(new_size)
+            self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), new_size)
+
+        struct.pack_into(f'I{padded}s', self._map, self._used, len(encoded), encoded)
+        position = self._used + 4 + padded
+        struct.pack_into('d', self._map, position, 0.0)
+        self._used += size
+        struct.pack_into('I', self._map, 0, self._used)
+        self._positions[key] = position
+        return position
+
+    def inc_many(self, updates):
+        with self._lock:
+            for key, amount in updates:
+                position = self._position(key)
+                value = struct.unpack_from('d', self._map, position)[0]
+                struct.pack_into('d', self._map, position, value + amount)
+
+    def set(self, key, value):
+        with self._lock:
+            struct.pack_into('d', self._map, self._position(key), value)
+
+    def collect(self, gauge_families):
+        """Sum all worker files; gauges only count workers that are still alive"""
+        totals = {}
+        for path in glob.glob(os.path.join(self.directory, 'metrics_*.db')):
+            match = re.search(r'metrics_(\d+)\.db$', path)
+            alive = match is not None and _pid_alive(int(match.group(1)))
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                continue
+            if len(data) < 8:
+                continue
+            used = struct.unpack_from('I', data, 0)[0]
+            for key, value, _position in _read_entries(data, used):
+                if not alive and key.split(SEP, 1)[0] in gauge_families:
+                    continue
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+
+def _read_entries(buffer, used):
+    position = 8
+    while position + 4 <= used:
+        length = struct.unpack_from('I', buffer, position)[0]
+        padded = length + (8 - (4 + length) % 8) % 8
+        key = bytes(buffer[position + 4:position + 4 + length]).decode('utf-8')
+        value_position = position + 4 + padded
+        if value_position + 8 > used:
+            break
+        yield key, struct.unpack_from('d', buffer, value_position)[0], value_position
+        position = value_position + 8
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# Replaced by init_metrics; None means metrics are disabled
+_store = None
+
+
+# ========================
+# Metric types
+# ========================
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _render_labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+class _Metric:
+    kind = None
+    registry = {}
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _Metric.registry[name] = self
+
+    def _labels(self, labels):
+        return _render_labels(self.labelnames, [labels.get(n, '') for n in self.labelnames])
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if _store is not None:
+            _store.inc_many([(f'{self.name}{SEP}{SEP}{self._labels(labels)}', amount)])
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        if _store is not None:
+            _store.inc_many([(f'{self.name}{SEP}{SEP}{self._labels(labels)}', amount)])
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        if _store is not None:
+            _store.set(f'{self.name}{SEP}{SEP}{self._labels(labels)}', value)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if _store is None:
+            return
+        rendered = self._labels(labels)
+        # Buckets are stored non-cumulative (one write) and summed at scrape time
+        le = next((b for b in self.buckets if value <= b), '+Inf')
+        bucket_labels = f'{rendered},le="{le}"' if rendered else f'le="{le}"'
+        _store.inc_many([
+            (f'{self.name}{SEP}_bucket{SEP}{bucket_labels}', 1),
+            (f'{self.name}{SEP}_sum{SEP}{rendered}', value),
+            (f'{self.name}{SEP}_count{SEP}{rendered}', 1),
+        ])
+
+
+# ========================
+# Metrics
+# ========================
+REQUEST_LATENCY = Histogram('dontpanic_http_request_duration_seconds',
+                            'Request latency by blueprint and endpoint', ['blueprint', 'endpoint'])
+REQUESTS = Counter('dontpanic_http_requests_total',
+                   'Requests by blueprint, endpoint, method and status',
+                   ['blueprint', 'endpoint', 'method', 'status'])
+IN_FLIGHT = Gauge('dontpanic_http_requests_in_flight', 'Requests currently being handled')
+DB_CHECKED_OUT = Gauge('dontpanic_db_connections_checked_out', 'Pooled DB connections in use')
+DB_CONNECTS = Counter('dontpanic_db_connections_opened_total', 'New DB connections opened by the pool')
+FRAGMENT_CACHE = Counter('dontpanic_fragment_cache_lookups_total',
+                         'Template fragment cache lookups', ['fragment', 'result'])
+FRAGMENT_HIT_RATIO = Gauge('dontpanic_fragment_cache_hit_ratio',
+                           'Fragment cache hits / lookups (computed at scrape time)', ['fragment'])
+LOGINS = Counter('dontpanic_logins_total', 'Login attempts by result', ['result'])
+SESSIONS_STARTED = Counter('dontpanic_sessions_started_total', 'Training sessions started', ['scenario_id'])
+SESSIONS_COMPLETED = Counter('dontpanic_sessions_completed_total', 'Training sessions completed',
+                             ['scenario_id', 'outcome'])
+TEAM_CONFLICTS = Counter('dontpanic_team_conflicts_total',
+                         'Team exercise writes that lost a compare-and-swap to a teammate', ['action'])
+RATE_LIMITED = Counter('dontpanic_rate_limited_total', 'Requests refused with 429 by the rate limiter',
+                       ['endpoint', 'scope'])
+
+
+def render(values):
+    """Prometheus text exposition format"""
+    samples = {}
+    for key, value in values.items():
+        family, suffix, labels = key.split(SEP, 2)
+        samples.setdefault(family, []).append((suffix, labels, value))
+
+    # Hit ratio derived from the aggregated counters, so it's correct across workers
+    lookups = {}
+    for suffix, labels, value in samples.get(FRAGMENT_CACHE.name, []):
+        fragment = re.search(r'fragment="((?:[^"\\]|\\.)*)"', labels).group(1)
+        entry = lookups.setdefault(fragment, [0.0, 0.0])
+        entry[0 if 'result="hit"' in labels else 1] += value
+    for fragment, (hits, misses) in lookups.items():
+        samples.setdefault(FRAGMENT_HIT_RATIO.name, []).append(
+            ('', f'fragment="{fragment}"', hits / (hits + misses) if hits + misses else 0.0))
+
+    lines = []
+    for name, metric in sorted(_Metric.registry.items()):
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        family = samples.get(name, [])
+        if metric.kind == 'histogram':
+            lines.extend(_render_histogram(metric, family))
+            continue
+        for suffix, labels, value in sorted(family):
+            lines.append(f'{name}{suffix}{{{labels}}} {_format(value)}' if labels
+                         else f'{name}{suffix} {_format(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _render_histogram(metric, family):
+    series = {}
+    for suffix, labels, value in family:
+        if suffix == '_bucket':
+            base, le = re.match(r'(.*?),?le="([^"]+)"$', labels).groups()
+            series.setdefault(base, {}).setdefault('buckets', {})[le] = value
+        else:
+            series.setdefault(labels, {})[suffix] = value
+
+    lines = []
+    for labels in sorted(series):
+        data = series[labels]
+        prefix = f'{labels},' if labels else ''
+        cumulative = 0.0
+        for le in [str(b) for b in metric.buckets] + ['+Inf']:
+            cumulative += data.get('buckets', {}).get(le, 0.0)
+            lines.append(f'{metric.name}_bucket{{{prefix}le="{le}"}} {_format(cumulative)}')
+        suffix_labels = f'{{{labels}}}' if labels else ''
+        lines.append(f'{metric.name}_sum{suffix_labels} {_format(data.get("_sum", 0.0))}')
+        lines.append(f'{metric.name}_count{suffix_labels} {_format(data.get("_count", 0.0))}')
+    return lines
+
+
+def _format(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+# ========================
+# App wiring
+# ========================
+_pool_listening = False
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    DB_CHECKED_OUT.inc()
+
+
+def _on_checkin(dbapi_connection, connection_record):
+    DB_CHECKED_OUT.dec()
+
+
+def _on_connect(dbapi_connection, connection_record):
+    DB_CONNECTS.inc()
+
+
+def init_metrics(app):
+    """Pick the value store, time every request and expose /metrics"""
+    global _store, _pool_listening
+
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+
+    gauge_families = {name for name, m in _Metric.registry.items() if m.kind == 'gauge'}
+    directory = app.config.get('METRICS_MULTIPROC_DIR')
+    if _store is None:
+        _store = MmapValues(directory, gauge_families) if directory else LocalValues()
+
+    if not _pool_listening:
+        event.listen(Pool, 'checkout', _on_checkout)
+        event.listen(Pool, 'checkin', _on_checkin)
+        event.listen(Pool, 'connect', _on_connect)
+        _pool_listening = True
+
+    cache = app.extensions.get('fragment_cache')
+    if cache is not None:
+        cache.listeners.append(
+            lambda name, hit: FRAGMENT_CACHE.inc(fragment=name, result='hit' if hit else 'miss'))
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+        IN_FLIGHT.inc()
+
+    @app.after_request
+    def remember_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def observe_request(exc):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        IN_FLIGHT.dec()
+        # Unmatched URLs share one label so 404 scans can't blow up cardinality
+        endpoint = request.endpoint or 'unmatched'
+        blueprint = request.blueprint or ''
+        REQUEST_LATENCY.observe(time.perf_counter() - started, blueprint=blueprint, endpoint=endpoint)
+        REQUESTS.inc(blueprint=blueprint, endpoint=endpoint, method=request.method,
+                     status=g.pop('metrics_status', 500))
+
+    def metrics_view():
+        """Prometheus scrape endpoint"""
+        token = current_app.config.get('METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(render(_store.collect(gauge_families)),
+                        mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
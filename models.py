@@ -1,9 +1,74 @@
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import Engine
+import sqlite3
+import time
+from scenario_content import CATEGORIES, version_hash as content_hash
+from compact_json import CompressedJSON
+
+# Tables that always live in the control database (SQLALCHEMY_DATABASE_URI), whichever organisation is served
+CONTROL_TABLES = frozenset({'organisations', 'scheduler_locks', 'scheduled_jobs', 'rate_limit_buckets'})
+
+
+def tenant_key():
+    """Slug of the organisation being served, '' for the control database - part of every shared cache key"""
+    tenant = g.get('tenant') if has_app_context() else None
+    return tenant.slug if tenant is not None else ''
+
+
+def _bound_table(mapper, clause):
+    if mapper is not None:
+        return inspect(mapper).local_table.name
+    table = getattr(clause, 'table', clause)
+    return getattr(table, 'name', None)
+
+
+class TenantSession(Session):
+    """db.session: routes to the organisation database in g.tenant (see tenancy.py)
+
+    Without a tenant, and for CONTROL_TABLES, it uses the control database as before.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        tenant = g.get('tenant') if bind is None and has_app_context() else None
+        if tenant is not None and _bound_table(mapper, clause) not in CONTROL_TABLES:
+            return tenant.engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': TenantSession})
+
+
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite only enforces foreign keys (and ON DELETE CASCADE) when asked, per connection"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+def _combined_totals(session_filter, archived_totals):
+    """(started, completed, score_total): live training_sessions plus archived summaries
+
+    archived_totals are the scalar subqueries from SessionSummary.user_totals /
+    scenario_totals, so both halves come back in a single statement.
+    """
+    completed = db.and_(session_filter, TrainingSession.status == 'completed')
+    live = [
+        db.select(db.func.count(TrainingSession.id)).where(session_filter).scalar_subquery(),
+        db.select(db.func.count(TrainingSession.id)).where(completed).scalar_subquery(),
+        db.select(db.func.coalesce(db.func.sum(TrainingSession.score), 0)).where(completed).scalar_subquery(),
+    ]
+    row = db.session.execute(db.select(*live, *archived_totals)).one()
+    return tuple(int(row[i] or 0) + int(row[i + 3] or 0) for i in range(3))
 
-db = SQLAlchemy()
 
 # ========================
 # 1. USERS TABLE
@@ -30,15 +95,19 @@ class User(UserMixin, db.Model):
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     
     # Relationships
+    # Child rows go with ON DELETE CASCADE - passive_deletes stops the ORM loading them first
     training_sessions = db.relationship('TrainingSession', 
                                        backref='user', 
                                        lazy='dynamic',
-                                       cascade='all, delete-orphan')
+                                       cascade='all, delete-orphan',
+                                       passive_deletes=True)
     
+    # Users who created scenarios can't be deleted (the foreign key refuses)
     created_scenarios = db.relationship('Scenario',
                                        backref='creator',
                                        lazy='dynamic',
-                                       foreign_keys='Scenario.created_by')
+                                       foreign_keys='Scenario.created_by',
+                                       passive_deletes='all')
     
     def set_password(self, password):
         """Hash and set the password"""
@@ -48,21 +117,33 @@ class User(UserMixin, db.Model):
         """Check if provided password matches hash"""
         return check_password_hash(self.password_hash, password)
     
+    def get_id(self):
+        """Flask-Login id, qualified by organisation so a session cookie only works on its own tenant"""
+        slug = tenant_key()
+        return f'{slug}:{self.id}' if slug else str(self.id)
+    
     def is_instructor(self):
         """Check if user is an instructor"""
         return self.role == 'instructor'
     
+    def _session_totals(self):
+        """(started, completed, score_total) over live and archived sessions, in one query"""
+        return _combined_totals(TrainingSession.user_id == self.id, SessionSummary.user_totals(self.id))
+    
     def get_completed_scenarios_count(self):
         """Get number of completed scenarios"""
-        return self.training_sessions.filter_by(status='completed').count()
+        return self._session_totals()[1]
+    
+    def get_started_sessions_count(self):
+        """Get number of sessions ever started (including archived ones)"""
+        return self._session_totals()[0]
     
     def get_average_score(self):
         """Calculate average score across all completed sessions"""
-        completed = self.training_sessions.filter_by(status='completed').all()
+        _, completed, total = self._session_totals()
         if not completed:
             return 0
-        total = sum(session.score for session in completed if session.score)
-        return round(total / len(completed), 2)
+        return round(total / completed, 2)
     
     def __repr__(self):
         return f'<User {self.username} ({self.role})>'
@@ -95,10 +176,13 @@ class Scenario(db.Model):
     # Maximum points for the scenario (used to scale final score)
     max_points = db.Column(db.Integer, nullable=False, default=100)
     
-    # Scenario content (JSON stored as text)
-    scenario_content = db.Column(db.Text, nullable=False)
+    # Scenario content (JSON text, stored compressed - see compact_json.py)
+    scenario_content = db.Column(CompressedJSON, nullable=False)
     # This will store the decision tree/story branches as JSON
     
+    # Current published version - scenario_content and max_points mirror it (see publish())
+    version_hash = db.Column(db.String(64), db.ForeignKey('scenario_versions.hash'))
+    
     # Metadata
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -113,28 +197,88 @@ class Scenario(db.Model):
     training_sessions = db.relationship('TrainingSession',
                                        backref='scenario',
                                        lazy='dynamic',
-                                       cascade='all, delete-orphan')
+                                       cascade='all, delete-orphan',
+                                       passive_deletes=True)
+    current_version = db.relationship('ScenarioVersion', foreign_keys=[version_hash])
+    publications = db.relationship('ScenarioPublication',
+                                   backref='scenario',
+                                   lazy='dynamic',
+                                   cascade='all, delete-orphan',
+                                   passive_deletes=True,
+                                   order_by='ScenarioPublication.published_at.desc()')
+    
+    # Search facet counts group by these (see search.py)
+    __table_args__ = (db.Index('ix_scenarios_facets', 'incident_type', 'difficulty_level'),)
     
     def increment_play_count(self):
         """Increment the times_played counter"""
         self.times_played += 1
     
+    def publish(self, published_by=None):
+        """Snapshot scenario_content and max_points as an immutable version and make it current
+        
+        Identical content is stored once. Sessions already started keep the
+        version they pinned. Returns the ScenarioVersion.
+        """
+        version = ScenarioVersion.store(self.scenario_content, self.max_points)
+        if version.hash != self.version_hash:
+            self.current_version = version
+            db.session.add(ScenarioPublication(scenario=self, version=version, published_by=published_by))
+        return version
+    
+    def _session_totals(self):
+        """(started, completed, score_total) over live and archived sessions, in one query"""
+        return _combined_totals(TrainingSession.scenario_id == self.id, SessionSummary.scenario_totals(self.id))
+    
     def update_average_score(self):
         """Recalculate average score from all completed sessions"""
-        completed = self.training_sessions.filter_by(status='completed').all()
+        _, completed, total = self._session_totals()
         if not completed:
             self.average_score = 0.0
             return
         
-        total = sum(session.score for session in completed if session.score)
-        self.average_score = round(total / len(completed), 2)
+        self.average_score = round(total / completed, 2)
+    
+    @classmethod
+    def refresh_statistics(cls):
+        """Recompute times_played and average_score for every scenario in one UPDATE"""
+        table = cls.__table__
+        live = TrainingSession.__table__.alias('live')
+        archived = SessionSummary.__table__.alias('archived')
+        
+        def live_total(column, *criteria):
+            return db.select(db.func.coalesce(column, 0)).where(live.c.scenario_id == table.c.id, *criteria).scalar_subquery()
+        
+        def archived_total(column):
+            return db.select(db.func.coalesce(db.func.sum(column), 0)).where(
+                archived.c.scenario_id == table.c.id).scalar_subquery()
+        
+        completed = live.c.status == 'completed'
+        completed_count = live_total(db.func.count(), completed) + archived_total(archived.c.completed_count)
+        score_total = live_total(db.func.sum(live.c.score), completed) + archived_total(archived.c.score_total)
+        
+        # Statistics aren't edits - keep updated_at (and the scenario cache version) as it is
+        db.session.execute(table.update().values(
+            updated_at=table.c.updated_at,
+            times_played=live_total(db.func.count()) + archived_total(archived.c.started_count),
+            average_score=db.case(
+                (completed_count > 0, db.func.round(db.cast(score_total, db.Float) / completed_count, 2)),
+                else_=0.0),
+        ))
+    
+    @classmethod
+    def cache_version(cls):
+        """Version stamp for markup rendered from the scenario table"""
+        count, last_id, last_update = db.session.query(
+            db.func.count(cls.id), db.func.max(cls.id), db.func.max(cls.updated_at)
+        ).one()
+        return f'{tenant_key()}:{count}:{last_id}:{last_update}'
     
     def get_completion_rate(self):
         """Calculate percentage of started sessions that were completed"""
-        total = self.training_sessions.count()
+        total, completed, _ = self._session_totals()
         if total == 0:
             return 0
-        completed = self.training_sessions.filter_by(status='completed').count()
         return round((completed / total) * 100, 2)
     
     def __repr__(self):
@@ -152,8 +296,13 @@ class TrainingSession(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     
     # Foreign keys
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
-    scenario_id = db.Column(db.Integer, db.ForeignKey('scenarios.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    scenario_id = db.Column(db.Integer, db.ForeignKey('scenarios.id', ondelete='CASCADE'), nullable=False, index=True)
+    
+    # Scenario version the session started on - it plays and scores against that
+    # one even if the scenario is edited meanwhile (NULL for sessions from before versioning)
+    version_hash = db.Column(db.String(64), db.ForeignKey('scenario_versions.hash'), index=True)
+    version = db.relationship('ScenarioVersion')
     
     # Session timing
     started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -169,8 +318,8 @@ class TrainingSession(db.Model):
     status = db.Column(db.String(20), nullable=False, default='in_progress')
     # Options: 'in_progress', 'completed', 'abandoned'
     
-    # Session data (JSON stored as text)
-    session_data = db.Column(db.Text)
+    # Session data (JSON text, stored compressed - see compact_json.py)
+    session_data = db.Column(CompressedJSON)
     # Stores decisions made, path taken, etc. as JSON
     
     # Performance metrics
@@ -183,6 +332,19 @@ class TrainingSession(db.Model):
     # Metadata
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
+    # Outcome bands by final score (points, not percent)
+    SUCCESS_SCORE = 80
+    PARTIAL_SUCCESS_SCORE = 60
+    
+    @classmethod
+    def outcome_for(cls, score):
+        """Outcome label for a final score"""
+        if score >= cls.SUCCESS_SCORE:
+            return 'success'
+        if score >= cls.PARTIAL_SUCCESS_SCORE:
+            return 'partial_success'
+        return 'failure'
+    
     def complete_session(self, final_score, outcome):
         """Mark session as completed"""
         self.completed_at = datetime.utcnow()
@@ -205,6 +367,14 @@ class TrainingSession(db.Model):
         """Check if session is completed"""
         return self.status == 'completed'
     
+    @classmethod
+    def stats_version(cls):
+        """Version stamp for markup rendered from completed-session statistics"""
+        count, last_completed = db.session.query(
+            db.func.count(cls.id), db.func.max(cls.completed_at)
+        ).filter(cls.status == 'completed').one()
+        return f'{tenant_key()}:{count}:{last_completed}'
+    
     def get_performance_breakdown(self):
         """Get dictionary of performance scores by category"""
         return {
@@ -219,6 +389,847 @@ class TrainingSession(db.Model):
         return f'<TrainingSession user={self.user_id} scenario={self.scenario_id} status={self.status}>'
 
 
+# ========================
+# 4. COHORTS (classes)
+# ========================
+cohort_members = db.Table(
+    'cohort_members',
+    db.Column('cohort_id', db.Integer, db.ForeignKey('cohorts.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('user_id', db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True, index=True),
+    db.Column('joined_at', db.DateTime, nullable=False, default=datetime.utcnow)
+)
+
+class Cohort(db.Model):
+    """A class of trainees that scenarios get assigned to"""
+    __tablename__ = 'cohorts'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), unique=True, nullable=False)
+    description = db.Column(db.Text)
+
+    # Metadata
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # Relationships
+    members = db.relationship('User',
+                              secondary=cohort_members,
+                              backref=db.backref('cohorts', lazy='dynamic', passive_deletes=True),
+                              lazy='dynamic',
+                              passive_deletes=True)
+
+    assignments = db.relationship('CohortAssignment',
+                                  backref='cohort',
+                                  lazy='dynamic',
+                                  cascade='all, delete-orphan',
+                                  passive_deletes=True)
+
+    rollups = db.relationship('CohortRollup',
+                              backref='cohort',
+                              lazy='dynamic',
+                              cascade='all, delete-orphan',
+                              passive_deletes=True)
+
+    def add_members(self, user_ids):
+        """Bulk-add users by id (existing members are skipped); returns the number added"""
+        existing = {row.user_id for row in db.session.execute(
+            db.select(cohort_members.c.user_id).where(cohort_members.c.cohort_id == self.id))}
+        new_ids = sorted(set(user_ids) - existing)
+        if new_ids:
+            db.session.execute(cohort_members.insert(),
+                               [{'cohort_id': self.id, 'user_id': uid} for uid in new_ids])
+        return len(new_ids)
+
+    def remove_member(self, user_id):
+        """Remove one member"""
+        db.session.execute(cohort_members.delete().where(
+            cohort_members.c.cohort_id == self.id, cohort_members.c.user_id == user_id))
+
+    def assign_scenarios(self, scenario_ids, assigned_by, due_at=None):
+        """Bulk-assign scenarios (already assigned ones are skipped); returns the number added"""
+        existing = {a.scenario_id for a in self.assignments}
+        new_ids = sorted(set(scenario_ids) - existing)
+        if new_ids:
+            db.session.execute(db.insert(CohortAssignment), [
+                {'cohort_id': self.id, 'scenario_id': sid, 'assigned_by': assigned_by,
+                 'assigned_at': datetime.utcnow(), 'due_at': due_at}
+                for sid in new_ids
+            ])
+        return len(new_ids)
+
+    def get_member_count(self):
+        """Number of members"""
+        return db.session.scalar(db.select(db.func.count()).select_from(cohort_members)
+                                 .where(cohort_members.c.cohort_id == self.id))
+
+    def get_summary(self):
+        """Totals across every assigned scenario, from the rollup rows"""
+        totals = db.session.query(
+            db.func.coalesce(db.func.sum(CohortRollup.sessions_started), 0),
+            db.func.coalesce(db.func.sum(CohortRollup.sessions_completed), 0),
+            db.func.coalesce(db.func.sum(CohortRollup.score_total), 0),
+            *[db.func.coalesce(db.func.sum(getattr(CohortRollup, f'{c}_total')), 0) for c in CATEGORIES]
+        ).filter(CohortRollup.cohort_id == self.id).one()
+        return CohortRollup.summarize(*totals)
+
+    def __repr__(self):
+        return f'<Cohort {self.name}>'
+
+
+class CohortAssignment(db.Model):
+    """A scenario assigned to every member of a cohort"""
+    __tablename__ = 'cohort_assignments'
+    __table_args__ = (db.UniqueConstraint('cohort_id', 'scenario_id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    cohort_id = db.Column(db.Integer, db.ForeignKey('cohorts.id', ondelete='CASCADE'), nullable=False, index=True)
+    scenario_id = db.Column(db.Integer, db.ForeignKey('scenarios.id', ondelete='CASCADE'), nullable=False, index=True)
+
+    assigned_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    assigned_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    due_at = db.Column(db.DateTime)
+
+    scenario = db.relationship('Scenario',
+                               backref=db.backref('cohort_assignments',
+                                                  lazy='dynamic',
+                                                  cascade='all, delete-orphan',
+                                                  passive_deletes=True))
+
+    def __repr__(self):
+        return f'<CohortAssignment cohort={self.cohort_id} scenario={self.scenario_id}>'
+
+
+class CohortRollup(db.Model):
+    """Running session totals per (cohort, assigned scenario)
+
+    Kept up to date by record_start / record_completion, which run one
+    UPDATE each inside the caller's transaction. rebuild() recomputes a
+    cohort from scratch after members or assignments change.
+    """
+    __tablename__ = 'cohort_rollups'
+
+    cohort_id = db.Column(db.Integer, db.ForeignKey('cohorts.id', ondelete='CASCADE'), primary_key=True)
+    scenario_id = db.Column(db.Integer, db.ForeignKey('scenarios.id', ondelete='CASCADE'), primary_key=True, index=True)
+
+    sessions_started = db.Column(db.Integer, nullable=False, default=0)
+    sessions_completed = db.Column(db.Integer, nullable=False, default=0)
+    score_total = db.Column(db.Integer, nullable=False, default=0)
+    detection_total = db.Column(db.Integer, nullable=False, default=0)
+    containment_total = db.Column(db.Integer, nullable=False, default=0)
+    eradication_total = db.Column(db.Integer, nullable=False, default=0)
+    recovery_total = db.Column(db.Integer, nullable=False, default=0)
+    communication_total = db.Column(db.Integer, nullable=False, default=0)
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    scenario = db.relationship('Scenario',
+                               backref=db.backref('cohort_rollups',
+                                                  lazy='dynamic',
+                                                  cascade='all, delete-orphan',
+                                                  passive_deletes=True))
+
+    @staticmethod
+    def _member_cohorts(user_id):
+        return db.select(cohort_members.c.cohort_id).where(cohort_members.c.user_id == user_id)
+
+    @classmethod
+    def record_start(cls, user_id, scenario_id):
+        """Count a started session in every cohort of the user that has the scenario assigned"""
+        db.session.execute(
+            db.update(cls)
+            .where(cls.scenario_id == scenario_id, cls.cohort_id.in_(cls._member_cohorts(user_id)))
+            .values(sessions_started=cls.sessions_started + 1, updated_at=datetime.utcnow()),
+            execution_options={'synchronize_session': False}
+        )
+
+    @classmethod
+    def record_completion(cls, session):
+        """Add a completed session's score and category scores to its cohorts' rollups"""
+        values = {
+            'sessions_completed': cls.sessions_completed + 1,
+            'score_total': cls.score_total + (session.score or 0),
+            'updated_at': datetime.utcnow(),
+        }
+        for category in CATEGORIES:
+            column = getattr(cls, f'{category}_total')
+            values[f'{category}_total'] = column + (getattr(session, f'{category}_score') or 0)
+        db.session.execute(
+            db.update(cls)
+            .where(cls.scenario_id == session.scenario_id,
+                   cls.cohort_id.in_(cls._member_cohorts(session.user_id)))
+            .values(**values),
+            execution_options={'synchronize_session': False}
+        )
+
+    @classmethod
+    def rebuild(cls, cohort_id):
+        """Recompute every rollup row of a cohort from its members' live and archived sessions"""
+        db.session.execute(db.delete(cls).where(cls.cohort_id == cohort_id))
+
+        members = db.select(cohort_members.c.user_id).where(cohort_members.c.cohort_id == cohort_id)
+        completed = TrainingSession.status == 'completed'
+
+        def completed_sum(column):
+            return db.func.coalesce(db.func.sum(db.case((completed, db.func.coalesce(column, 0)), else_=0)), 0)
+
+        live = (
+            db.select(
+                TrainingSession.scenario_id.label('scenario_id'),
+                db.func.count(TrainingSession.id).label('started'),
+                db.func.coalesce(db.func.sum(db.case((completed, 1), else_=0)), 0).label('completed'),
+                completed_sum(TrainingSession.score).label('score'),
+                *[completed_sum(getattr(TrainingSession, f'{c}_score')).label(c) for c in CATEGORIES]
+            )
+            .where(TrainingSession.user_id.in_(members))
+            .group_by(TrainingSession.scenario_id)
+        )
+        archived = (
+            db.select(
+                SessionSummary.scenario_id.label('scenario_id'),
+                db.func.sum(SessionSummary.started_count).label('started'),
+                db.func.sum(SessionSummary.completed_count).label('completed'),
+                db.func.sum(SessionSummary.score_total).label('score'),
+                *[db.func.sum(getattr(SessionSummary, f'{c}_total')).label(c) for c in CATEGORIES]
+            )
+            .where(SessionSummary.user_id.in_(members))
+            .group_by(SessionSummary.scenario_id)
+        )
+        both = db.union_all(live, archived).subquery()
+        totals = (
+            db.select(both.c.scenario_id,
+                      *[db.func.sum(getattr(both.c, name)).label(name)
+                        for name in ('started', 'completed', 'score', *CATEGORIES)])
+            .group_by(both.c.scenario_id)
+            .subquery()
+        )
+
+        # One row per assignment, zeros where no member has played it yet
+        rows = db.select(
+            CohortAssignment.cohort_id,
+            CohortAssignment.scenario_id,
+            db.func.coalesce(totals.c.started, 0),
+            db.func.coalesce(totals.c.completed, 0),
+            db.func.coalesce(totals.c.score, 0),
+            *[db.func.coalesce(getattr(totals.c, c), 0) for c in CATEGORIES],
+            db.literal(datetime.utcnow()),
+        ).outerjoin(totals, totals.c.scenario_id == CohortAssignment.scenario_id).where(
+            CohortAssignment.cohort_id == cohort_id)
+
+        db.session.execute(db.insert(cls).from_select(
+            ['cohort_id', 'scenario_id', 'sessions_started', 'sessions_completed', 'score_total',
+             *[f'{c}_total' for c in CATEGORIES], 'updated_at'],
+            rows
+        ))
+
+    @staticmethod
+    def summarize(started, completed, score_total, *category_totals):
+        """Rates and averages from raw totals"""
+        return {
+            'sessions_started': started,
+            'sessions_completed': completed,
+            'completion_rate': round(completed / started * 100, 2) if started else 0,
+            'average_score': round(score_total / completed, 2) if completed else 0,
+            'categories': {
+                category: round(total / completed, 2) if completed else 0
+                for category, total in zip(CATEGORIES, category_totals)
+            },
+        }
+
+    def get_summary(self):
+        """Rates and averages for this (cohort, scenario) row"""
+        return self.summarize(self.sessions_started, self.sessions_completed, self.score_total,
+                              *[getattr(self, f'{c}_total') for c in CATEGORIES])
+
+    def __repr__(self):
+        return f'<CohortRollup cohort={self.cohort_id} scenario={self.scenario_id}>'
+
+
+# ========================
+# 5. LEADERBOARDS
+# ========================
+def _upsert(model, rows, set_, where=None):
+    """INSERT ... ON CONFLICT (primary key) DO UPDATE, for SQLite and PostgreSQL
+
+    set_ and where are callables taking (table, excluded). Other databases fall
+    back to UPDATE-then-INSERT per row.
+    """
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[c.name for c in table.primary_key.columns],
+            set_=set_(table, stmt.excluded),
+            where=where(table, stmt.excluded) if where is not None else None,
+        )
+        db.session.execute(stmt)
+        return
+
+    for row in rows:
+        excluded = SimpleNamespace(**{key: db.literal(value) for key, value in row.items()})
+        match = [column == row[column.name] for column in table.primary_key.columns]
+        condition = match + ([where(table, excluded)] if where is not None else [])
+        result = db.session.execute(table.update().where(*condition).values(set_(table, excluded)))
+        if result.rowcount == 0 and db.session.execute(db.select(table).where(*match)).first() is None:
+            db.session.execute(table.insert().values(row))
+
+
+class LeaderboardEntry(db.Model):
+    """Best score per user on a board
+
+    A board is (scenario_id, period). scenario_id 0 is the overall board,
+    whose score is the sum of the user's best scores across scenarios.
+    Periods are 'all' plus the ISO week ('w2026-42') and calendar month
+    ('m2026-10') of the completion, so time-windowed boards roll over by
+    simply starting to write a new key.
+    """
+    __tablename__ = 'leaderboard_entries'
+
+    OVERALL = 0
+    PERIODS = ('all', 'week', 'month')
+
+    # No foreign key on scenario_id - 0 is the overall board
+    scenario_id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(12), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+
+    score = db.Column(db.Integer, nullable=False, default=0)
+    achieved_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    user = db.relationship('User',
+                           backref=db.backref('leaderboard_entries',
+                                              lazy='dynamic',
+                                              cascade='all, delete-orphan',
+                                              passive_deletes=True))
+
+    @staticmethod
+    def period_keys(when):
+        """{'all': 'all', 'week': 'w2026-42', 'month': 'm2026-10'} for a timestamp"""
+        year, week, _ = when.isocalendar()
+        return {'all': 'all', 'week': f'w{year}-{week:02d}', 'month': when.strftime('m%Y-%m')}
+
+    @classmethod
+    def record(cls, user_id, scenario_id, score, when):
+        """Fold one completed session into every board it belongs to
+
+        One indexed read of the user's current bests; the two upserts
+        only run when at least one board improved.
+        """
+        keys = list(cls.period_keys(when).values())
+        current = dict(db.session.query(cls.period, cls.score).filter(
+            cls.scenario_id == scenario_id, cls.user_id == user_id, cls.period.in_(keys)).all())
+
+        improved = [key for key in keys if key not in current or score > current[key]]
+        if not improved:
+            return
+
+        _upsert(cls,
+                [{'scenario_id': scenario_id, 'period': key, 'user_id': user_id,
+                  'score': score, 'achieved_at': when} for key in improved],
+                set_=lambda t, ex: {'score': ex.score, 'achieved_at': ex.achieved_at},
+                where=lambda t, ex: ex.score > t.c.score)
+
+        # Overall boards move by how much the scenario best went up
+        _upsert(cls,
+                [{'scenario_id': cls.OVERALL, 'period': key, 'user_id': user_id,
+                  'score': score - current.get(key, 0), 'achieved_at': when} for key in improved],
+                set_=lambda t, ex: {'score': t.c.score + ex.score, 'achieved_at': ex.achieved_at})
+
+    @classmethod
+    def top(cls, scenario_id, period='all', limit=10):
+        """[(rank, username, score, achieved_at)] - the first `limit` rows of the board index"""
+        rows = (db.session.query(User.username, cls.score, cls.achieved_at)
+                .join(User, User.id == cls.user_id)
+                .filter(cls.scenario_id == scenario_id, cls.period == period)
+                .order_by(cls.score.desc(), cls.achieved_at)
+                .limit(limit).all())
+        return [(rank, *row) for rank, row in enumerate(rows, start=1)]
+
+    @classmethod
+    def rank_of(cls, user_id, scenario_id, period='all'):
+        """(rank, score) for a user, or None if they aren't on the board
+
+        The rank is a COUNT over the part of the board index above the
+        user's entry - no sort and no table access.
+        """
+        entry = db.session.get(cls, (scenario_id, period, user_id))
+        if entry is None:
+            return None
+        ahead = db.session.query(db.func.count()).select_from(cls).filter(
+            cls.scenario_id == scenario_id, cls.period == period,
+            db.or_(cls.score > entry.score,
+                   db.and_(cls.score == entry.score, cls.achieved_at < entry.achieved_at))
+        ).scalar()
+        return ahead + 1, entry.score
+
+    @classmethod
+    def board_size(cls, scenario_id, period='all'):
+        """Number of users on a board"""
+        return db.session.query(db.func.count()).select_from(cls).filter(
+            cls.scenario_id == scenario_id, cls.period == period).scalar()
+
+    @classmethod
+    def remove_scenario(cls, scenario_id):
+        """Drop a scenario's boards and take its bests back out of the overall boards"""
+        scenario_rows = cls.__table__.alias('scenario_rows')
+        table = cls.__table__
+        best = db.select(scenario_rows.c.score).where(
+            scenario_rows.c.scenario_id == scenario_id,
+            scenario_rows.c.period == table.c.period,
+            scenario_rows.c.user_id == table.c.user_id)
+        db.session.execute(table.update().where(table.c.scenario_id == cls.OVERALL, best.exists())
+                           .values(score=table.c.score - best.scalar_subquery()))
+        db.session.execute(table.delete().where(table.c.scenario_id == scenario_id))
+
+    @classmethod
+    def prune(cls, now=None, keep_weeks=12, keep_months=12):
+        """Delete weekly/monthly boards older than the retention window"""
+        now = now or datetime.utcnow()
+        oldest_week = cls.period_keys(now - timedelta(weeks=keep_weeks - 1))['week']
+        month_index = now.year * 12 + now.month - 1 - (keep_months - 1)
+        oldest_month = f'm{month_index // 12}-{month_index % 12 + 1:02d}'
+        return db.session.query(cls).filter(db.or_(
+            db.and_(cls.period.like('w%'), cls.period < oldest_week),
+            db.and_(cls.period.like('m%'), cls.period < oldest_month),
+        )).delete(synchronize_session=False)
+
+    @classmethod
+    def rebuild(cls, now=None, batch_size=10000):
+        """Recompute every board from completed and archived sessions (backfill / repair)
+
+        Weekly and monthly boards are rebuilt for the current period only.
+        """
+        now = now or datetime.utcnow()
+        live = cls.period_keys(now)
+        best = {}
+        sessions = (db.session.query(TrainingSession.user_id, TrainingSession.scenario_id,
+                                     TrainingSession.score, TrainingSession.completed_at)
+                    .filter(TrainingSession.status == 'completed',
+                            TrainingSession.completed_at.isnot(None))
+                    .order_by(TrainingSession.completed_at)
+                    .yield_per(batch_size))
+        for user_id, scenario_id, score, completed_at in sessions:
+            score = score or 0
+            for name, key in cls.period_keys(completed_at).items():
+                if key != live[name]:
+                    continue
+                board_key = (scenario_id, key, user_id)
+                if board_key not in best or score > best[board_key][0]:
+                    best[board_key] = (score, completed_at)
+
+        # Archived sessions only matter for the all-time boards
+        archived = db.session.query(SessionSummary.user_id, SessionSummary.scenario_id,
+                                    SessionSummary.best_score, SessionSummary.best_score_at).filter(
+            SessionSummary.completed_count > 0, SessionSummary.best_score_at.isnot(None))
+        for user_id, scenario_id, score, achieved_at in archived.yield_per(batch_size):
+            board_key = (scenario_id, 'all', user_id)
+            if board_key not in best or score > best[board_key][0] or (
+                    score == best[board_key][0] and achieved_at < best[board_key][1]):
+                best[board_key] = (score, achieved_at)
+
+        overall = {}
+        for (scenario_id, key, user_id), (score, achieved_at) in best.items():
+            total, latest = overall.get((key, user_id), (0, achieved_at))
+            overall[(key, user_id)] = (total + score, max(latest, achieved_at))
+
+        db.session.execute(cls.__table__.delete())
+        rows = [{'scenario_id': s, 'period': k, 'user_id': u, 'score': score, 'achieved_at': at}
+                for (s, k, u), (score, at) in best.items()]
+        rows += [{'scenario_id': cls.OVERALL, 'period': k, 'user_id': u, 'score': score, 'achieved_at': at}
+                 for (k, u), (score, at) in overall.items()]
+        for start in range(0, len(rows), batch_size):
+            db.session.execute(cls.__table__.insert(), rows[start:start + batch_size])
+        return len(rows)
+
+    def __repr__(self):
+        return f'<LeaderboardEntry scenario={self.scenario_id} {self.period} user={self.user_id} score={self.score}>'
+
+
+# Board order is score DESC, achieved_at ASC (first to reach a score ranks higher)
+db.Index('ix_leaderboard_rank', LeaderboardEntry.scenario_id, LeaderboardEntry.period,
+         LeaderboardEntry.score.desc(), LeaderboardEntry.achieved_at)
+
+
+# ========================
+# 6. ARCHIVED SESSION SUMMARIES
+# ========================
+class SessionSummary(db.Model):
+    """Pre-aggregated totals of archived sessions, one row per (user, scenario)
+
+    Sessions older than the retention window are moved to compressed
+    JSONL files by archive.py. Their totals land here, so the aggregates
+    on User and Scenario stay correct while training_sessions stays small.
+    """
+    __tablename__ = 'session_summaries'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    scenario_id = db.Column(db.Integer, db.ForeignKey('scenarios.id', ondelete='CASCADE'), primary_key=True, index=True)
+
+    started_count = db.Column(db.Integer, nullable=False, default=0)
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+    score_total = db.Column(db.Integer, nullable=False, default=0)
+    detection_total = db.Column(db.Integer, nullable=False, default=0)
+    containment_total = db.Column(db.Integer, nullable=False, default=0)
+    eradication_total = db.Column(db.Integer, nullable=False, default=0)
+    recovery_total = db.Column(db.Integer, nullable=False, default=0)
+    communication_total = db.Column(db.Integer, nullable=False, default=0)
+    time_total = db.Column(db.Integer, nullable=False, default=0)  # Seconds, completed sessions
+
+    best_score = db.Column(db.Integer, nullable=False, default=0)
+    best_score_at = db.Column(db.DateTime)
+    last_completed_at = db.Column(db.DateTime)
+
+    user = db.relationship('User',
+                           backref=db.backref('session_summaries',
+                                              lazy='dynamic',
+                                              cascade='all, delete-orphan',
+                                              passive_deletes=True))
+    scenario = db.relationship('Scenario',
+                               backref=db.backref('session_summaries',
+                                                  lazy='dynamic',
+                                                  cascade='all, delete-orphan',
+                                                  passive_deletes=True))
+
+    TOTALS = ('started_count', 'completed_count', 'score_total', 'detection_total', 'containment_total',
+              'eradication_total', 'recovery_total', 'communication_total', 'time_total')
+
+    @classmethod
+    def add(cls, rows):
+        """Fold a batch of per-(user, scenario) totals into the summary rows"""
+        if not rows:
+            return
+
+        def merge(table, excluded):
+            values = {name: getattr(table.c, name) + getattr(excluded, name) for name in cls.TOTALS}
+            improved = excluded.best_score > table.c.best_score
+            values['best_score'] = db.case((improved, excluded.best_score), else_=table.c.best_score)
+            values['best_score_at'] = db.case((improved, excluded.best_score_at), else_=table.c.best_score_at)
+            values['last_completed_at'] = db.func.coalesce(
+                db.case((excluded.last_completed_at > table.c.last_completed_at, excluded.last_completed_at),
+                        else_=table.c.last_completed_at),
+                excluded.last_completed_at)
+            return values
+
+        _upsert(cls, rows, set_=merge)
+
+    @classmethod
+    def user_totals(cls, user_id):
+        """Scalar subqueries (started, completed, score_total) for one user's archived sessions"""
+        where = cls.user_id == user_id
+        return [db.select(db.func.coalesce(db.func.sum(getattr(cls, name)), 0)).where(where).scalar_subquery()
+                for name in ('started_count', 'completed_count', 'score_total')]
+
+    @classmethod
+    def scenario_totals(cls, scenario_id):
+        """Scalar subqueries (started, completed, score_total) for one scenario's archived sessions"""
+        where = cls.scenario_id == scenario_id
+        return [db.select(db.func.coalesce(db.func.sum(getattr(cls, name)), 0)).where(where).scalar_subquery()
+                for name in ('started_count', 'completed_count', 'score_total')]
+
+    def __repr__(self):
+        return f'<SessionSummary user={self.user_id} scenario={self.scenario_id} completed={self.completed_count}>'
+
+
+# ========================
+# 7. BACKGROUND JOBS
+# ========================
+class SchedulerLock(db.Model):
+    """Lease row - whichever process holds it runs the scheduled jobs"""
+    __tablename__ = 'scheduler_locks'
+
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(120))
+    expires_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<SchedulerLock {self.name} held by {self.holder} until {self.expires_at}>'
+
+
+class ScheduledJob(db.Model):
+    """Last run of each maintenance job, shared by every worker"""
+    __tablename__ = 'scheduled_jobs'
+
+    name = db.Column(db.String(50), primary_key=True)
+    last_run_at = db.Column(db.DateTime)
+    last_status = db.Column(db.String(20))  # 'ok' or 'error'
+    last_duration_ms = db.Column(db.Integer)
+    last_result = db.Column(db.Text)  # JSON summary or error message
+    run_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ScheduledJob {self.name} {self.last_status} at {self.last_run_at}>'
+
+
+# ========================
+# 8. SCENARIO VERSIONS
+# ========================
+class ScenarioVersion(db.Model):
+    """Immutable published scenario content, addressed by its hash
+
+    Rows are never updated, so anything derived from one (the version JSON
+    served to players, max points, caches) can be kept for good under the hash.
+    """
+    __tablename__ = 'scenario_versions'
+
+    hash = db.Column(db.String(64), primary_key=True)  # scenario_content.version_hash(content, max_points)
+    scenario_content = db.Column(CompressedJSON, nullable=False)
+    max_points = db.Column(db.Integer, nullable=False, default=100)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    @classmethod
+    def store(cls, scenario_content, max_points):
+        """The version for this content, added to the session if it's new"""
+        key = content_hash(scenario_content, max_points)
+        version = db.session.get(cls, key)
+        if version is None:
+            version = cls(hash=key, scenario_content=scenario_content, max_points=int(max_points))
+            db.session.add(version)
+        return version
+
+    @classmethod
+    def prune(cls):
+        """Delete versions no scenario, publication or session refers to; returns the count"""
+        return cls.query.filter(
+            ~db.exists().where(Scenario.version_hash == cls.hash),
+            ~db.exists().where(ScenarioPublication.version_hash == cls.hash),
+            ~db.exists().where(TrainingSession.version_hash == cls.hash),
+            ~db.exists().where(TeamExercise.version_hash == cls.hash),
+        ).delete(synchronize_session=False)
+
+    def __repr__(self):
+        return f'<ScenarioVersion {self.hash[:12]} max_points={self.max_points}>'
+
+
+class ScenarioPublication(db.Model):
+    """When each version became a scenario's current one, and who published it"""
+    __tablename__ = 'scenario_publications'
+
+    id = db.Column(db.Integer, primary_key=True)
+    scenario_id = db.Column(db.Integer, db.ForeignKey('scenarios.id', ondelete='CASCADE'), nullable=False, index=True)
+    version_hash = db.Column(db.String(64), db.ForeignKey('scenario_versions.hash'), nullable=False, index=True)
+    published_by = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'))
+    published_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    version = db.relationship('ScenarioVersion')
+
+    def __repr__(self):
+        return f'<ScenarioPublication scenario={self.scenario_id} version={self.version_hash[:12]}>'
+
+
+class ScenarioVersionPoints(db.Model):
+    """Best-path points per category for a version (scenario_content.category_points)
+
+    Derived from an immutable version, so rows are written once and kept
+    until the version is pruned.
+    """
+    __tablename__ = 'scenario_version_points'
+
+    hash = db.Column(db.String(64), db.ForeignKey('scenario_versions.hash', ondelete='CASCADE'), primary_key=True)
+    detection = db.Column(db.Float, nullable=False, default=0)
+    containment = db.Column(db.Float, nullable=False, default=0)
+    eradication = db.Column(db.Float, nullable=False, default=0)
+    recovery = db.Column(db.Float, nullable=False, default=0)
+    communication = db.Column(db.Float, nullable=False, default=0)
+
+    @classmethod
+    def store(cls, rows):
+        """Insert computed rows; a hash another worker stored first is left as it is"""
+        _upsert(cls, rows, set_=lambda table, excluded: {'hash': table.c.hash})
+
+    def __repr__(self):
+        return f'<ScenarioVersionPoints {self.hash[:12]}>'
+
+
+# ========================
+# 9. SKILL PROFILES
+# ========================
+class SkillProfile(db.Model):
+    """Category points a trainee has earned vs what the best path offered, over completed sessions
+
+    record() adds one completion with a single UPDATE; users without a row
+    are built from their sessions by recommender.rebuild_profiles().
+    """
+    __tablename__ = 'skill_profiles'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    sessions = db.Column(db.Integer, nullable=False, default=0)
+    detection_earned = db.Column(db.Float, nullable=False, default=0)
+    containment_earned = db.Column(db.Float, nullable=False, default=0)
+    eradication_earned = db.Column(db.Float, nullable=False, default=0)
+    recovery_earned = db.Column(db.Float, nullable=False, default=0)
+    communication_earned = db.Column(db.Float, nullable=False, default=0)
+    detection_available = db.Column(db.Float, nullable=False, default=0)
+    containment_available = db.Column(db.Float, nullable=False, default=0)
+    eradication_available = db.Column(db.Float, nullable=False, default=0)
+    recovery_available = db.Column(db.Float, nullable=False, default=0)
+    communication_available = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    @classmethod
+    def record(cls, user_id, earned, available):
+        """Add one completed session's category scores and best-path points (CATEGORIES order)"""
+        values = {'sessions': cls.sessions + 1, 'updated_at': datetime.utcnow()}
+        for category, earned_points, available_points in zip(CATEGORIES, earned, available):
+            values[f'{category}_earned'] = getattr(cls, f'{category}_earned') + float(earned_points)
+            values[f'{category}_available'] = getattr(cls, f'{category}_available') + float(available_points)
+        db.session.execute(
+            db.update(cls).where(cls.user_id == user_id).values(**values),
+            execution_options={'synchronize_session': False}
+        )
+
+    @classmethod
+    def store(cls, rows):
+        """Insert built profiles; a user whose profile another request built first keeps it"""
+        _upsert(cls, rows, set_=lambda table, excluded: {'user_id': table.c.user_id})
+
+    def __repr__(self):
+        return f'<SkillProfile user={self.user_id} sessions={self.sessions}>'
+
+
+# ========================
+# 10. RATE LIMITS
+# ========================
+class RateLimitBucket(db.Model):
+    """Token bucket state for RATE_LIMIT_BACKEND = 'database' (see ratelimit.py)"""
+    __tablename__ = 'rate_limit_buckets'
+
+    key = db.Column(db.String(255), primary_key=True)  # tenant:endpoint:scope:identity
+    tokens = db.Column(db.Float, nullable=False)
+    updated = db.Column(db.Float, nullable=False)  # Unix time of the last take
+
+    @classmethod
+    def prune(cls, idle_seconds):
+        """Delete buckets untouched for idle_seconds (full again by then); returns the count"""
+        return cls.query.filter(cls.updated < time.time() - idle_seconds).delete(synchronize_session=False)
+
+    def __repr__(self):
+        return f'<RateLimitBucket {self.key} tokens={self.tokens:.2f}>'
+
+
+# ========================
+# 11. ORGANISATIONS
+# ========================
+class Organisation(db.Model):
+    """Client organisation - a row of the shard map (see tenancy.py)
+
+    Its users, scenarios and sessions live in their own database on `shard`;
+    this table is in the control database.
+    """
+    __tablename__ = 'organisations'
+
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(63), unique=True, nullable=False, index=True)  # Subdomain
+    name = db.Column(db.String(200), nullable=False)
+    shard = db.Column(db.String(50), nullable=False)  # Key of TENANT_SHARDS
+    status = db.Column(db.String(20), nullable=False, default='active')
+    # Options: 'active', 'moving' (503 while its data is copied to another shard), 'suspended'
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    moved_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<Organisation {self.slug} on {self.shard} ({self.status})>'
+
+
+# ========================
+# 12. TEAM EXERCISES
+# ========================
+class TeamExercise(db.Model):
+    """One scenario played by a team - the state its members share (see teams.py)
+
+    Every change bumps `version`, written with compare_and_swap() instead of
+    a row lock: a write based on a stale read changes nothing.
+    """
+    __tablename__ = 'team_exercises'
+
+    id = db.Column(db.Integer, primary_key=True)
+    scenario_id = db.Column(db.Integer, db.ForeignKey('scenarios.id', ondelete='CASCADE'), nullable=False, index=True)
+    version_hash = db.Column(db.String(64), db.ForeignKey('scenario_versions.hash'), nullable=False, index=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'))
+    join_code = db.Column(db.String(8), unique=True, nullable=False)  # Teammates join with it
+
+    status = db.Column(db.String(20), nullable=False, default='in_progress')
+    # Options: 'in_progress', 'completed', 'abandoned'
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    # Shared play state, as play.html keeps it for one player
+    stage_index = db.Column(db.Integer, nullable=False, default=0)
+    detection = db.Column(db.Float, nullable=False, default=0)  # Points per category
+    containment = db.Column(db.Float, nullable=False, default=0)
+    eradication = db.Column(db.Float, nullable=False, default=0)
+    recovery = db.Column(db.Float, nullable=False, default=0)
+    communication = db.Column(db.Float, nullable=False, default=0)
+    score = db.Column(db.Integer)  # Set on completion
+
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    completed_at = db.Column(db.DateTime)
+
+    scenario = db.relationship('Scenario')
+    version_row = db.relationship('ScenarioVersion')
+
+    @classmethod
+    def compare_and_swap(cls, exercise_id, version, **values):
+        """Write values and bump the version if it is still `version`; False if a teammate changed it first"""
+        result = db.session.execute(
+            db.update(cls).where(cls.id == exercise_id, cls.version == version)
+            .values(version=version + 1, updated_at=datetime.utcnow(), **values),
+            execution_options={'synchronize_session': False}
+        )
+        return result.rowcount == 1
+
+    def metrics(self):
+        """Points per category, in CATEGORIES order"""
+        return [getattr(self, category) or 0.0 for category in CATEGORIES]
+
+    def __repr__(self):
+        return f'<TeamExercise {self.id} scenario={self.scenario_id} v{self.version} ({self.status})>'
+
+
+class TeamMember(db.Model):
+    """A user in a team exercise and the roles (CATEGORIES) they own"""
+    __tablename__ = 'team_members'
+
+    exercise_id = db.Column(db.Integer, db.ForeignKey('team_exercises.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True, index=True)
+    roles = db.Column(db.String(100), nullable=False, default='')  # Comma-separated
+    # Their completed TrainingSession, written when the exercise ends
+    session_id = db.Column(db.Integer, db.ForeignKey('training_sessions.id', ondelete='SET NULL'))
+    joined_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    user = db.relationship('User')
+
+    def role_list(self):
+        return [role for role in self.roles.split(',') if role]
+
+    def __repr__(self):
+        return f'<TeamMember exercise={self.exercise_id} user={self.user_id} roles={self.roles!r}>'
+
+
+class TeamDecision(db.Model):
+    """Decision log of a team exercise; seq is the exercise version the decision produced"""
+    __tablename__ = 'team_decisions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    exercise_id = db.Column(db.Integer, db.ForeignKey('team_exercises.id', ondelete='CASCADE'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'))
+    role = db.Column(db.String(20))  # The stage's role (None if nobody owned it)
+    stage = db.Column(db.Integer, nullable=False)
+    option = db.Column(db.Integer, nullable=False)
+    points = db.Column(db.Integer, nullable=False, default=0)
+    recorded_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # Polls read the decisions after a version
+    __table_args__ = (db.UniqueConstraint('exercise_id', 'seq', name='uq_team_decisions_seq'),)
+
+    def __repr__(self):
+        return f'<TeamDecision exercise={self.exercise_id} seq={self.seq} stage={self.stage} option={self.option}>'
+
+
 # ========================
 # OPTIONAL: Helper Functions
 # ========================
@@ -247,3 +1258,4 @@ def create_default_instructor():
     db.session.add(instructor)
     db.session.commit()
     print("✅ Default instructor created: username='admin', password='admin123'")
+
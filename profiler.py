@@ -0,0 +1,209 @@
+"""
+On-demand profiling for live workers (instructors only, PROFILER_ENABLED)
+- One request: add ?_profile=<format> or an X-Profile: <format> header and
+  the response is replaced by that request's profile
+- A whole worker: GET /admin/profile?seconds=N samples every thread in the
+  worker that answers, for N seconds. The sampling request holds a thread
+  of its own, so this needs a threaded worker (gunicorn --threads N, i.e.
+  gthread) - a sync worker has no other request to sample and is refused.
+
+Formats:
+  collapsed  stack sampling, one "frame;frame;frame count" line per stack
+             (feed to flamegraph.pl or speedscope)
+  text       cProfile, top functions by cumulative time
+  pstats     cProfile, binary dump for snakeviz / pstats.Stats
+
+When disabled no hooks are installed at all. Duration and output size are
+capped, and one profile runs per worker at a time.
+"""
+
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import Response, g, request
+from flask_login import current_user
+
+from models import tenant_key
+
+FORMATS = ('collapsed', 'text', 'pstats')
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# cProfile can't run twice at once, and concurrent samplers just skew each other
+_busy = threading.Lock()
+
+
+def _frame_name(code):
+    filename = code.co_filename
+    if filename.startswith(ROOT):
+        filename = os.path.relpath(filename, ROOT)
+    else:
+        filename = os.path.basename(filename)
+    return f'{filename}:{code.co_qualname}'
+
+
+def collapse(frame):
+    """Root-first 'a;b;c' stack for one frame"""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler:
+    """Samples thread stacks with sys._current_frames on a background thread"""
+
+    def __init__(self, interval, thread_ids=None):
+        self.interval = interval
+        self.thread_ids = thread_ids  # None = every thread except the sampler
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample_once(self):
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            self.counts[collapse(frame)] += 1
+        self.samples += 1
+
+    def _run(self, deadline):
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            self._sample_once()
+            self._stop.wait(self.interval)
+
+    def start(self, max_seconds):
+        self._thread = threading.Thread(target=self._run, args=(time.monotonic() + max_seconds,),
+                                        name='profiler-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def run_for(self, seconds):
+        """Sample in the calling thread for a fixed time"""
+        self._run(time.monotonic() + seconds)
+
+
+def render_collapsed(counts, max_bytes):
+    """Most frequent stacks first, dropping the tail once max_bytes is reached"""
+    out = io.StringIO()
+    size = 0
+    dropped = 0
+    for stack, count in counts.most_common():
+        line = f'{stack} {count}\n'
+        if size + len(line) > max_bytes:
+            dropped += 1
+            continue
+        out.write(line)
+        size += len(line)
+    if dropped:
+        out.write(f'# truncated: {dropped} stacks dropped (PROFILER_MAX_OUTPUT_BYTES)\n')
+    return out.getvalue()
+
+
+def render_profile(profile, fmt, max_bytes):
+    """cProfile results as text (top functions) or a binary pstats dump"""
+    if fmt == 'pstats':
+        profile.create_stats()
+        data = marshal.dumps(profile.stats)
+        if len(data) > max_bytes:
+            return Response('Profile exceeds PROFILER_MAX_OUTPUT_BYTES - use format=text\n',
+                            status=413, mimetype='text/plain')
+        return Response(data, mimetype='application/octet-stream',
+                        headers={'Content-Disposition': 'attachment; filename=profile.pstats'})
+
+    out = io.StringIO()
+    pstats.Stats(profile, stream=out).strip_dirs().sort_stats('cumulative').print_stats(60)
+    return Response(out.getvalue()[:max_bytes], mimetype='text/plain')
+
+
+def is_profiler_user():
+    # Workers serve every organisation, so only the control site's instructors may profile them
+    return current_user.is_authenticated and current_user.role in ('instructor', 'admin') and not tenant_key()
+
+
+def sample_worker(seconds, config):
+    """Sample all threads of this worker; returns collapsed stacks, or None if busy"""
+    if not _busy.acquire(blocking=False):
+        return None
+    try:
+        # The request holds its worker thread meanwhile - stay well clear of the worker timeout
+        limit = min(config['PROFILER_MAX_SECONDS'], config.get('WORKER_TIMEOUT', 30) / 2)
+        seconds = max(0.1, min(seconds, limit))
+        sampler = Sampler(config['PROFILER_SAMPLE_INTERVAL'])
+        sampler.run_for(seconds)
+        header = f'# {sampler.samples} samples over {seconds:g}s, pid {os.getpid()}\n'
+        return header + render_collapsed(sampler.counts, config['PROFILER_MAX_OUTPUT_BYTES'])
+    finally:
+        _busy.release()
+
+
+def init_profiler(app):
+    """Per-request profiling hooks (nothing is installed unless enabled)"""
+    if not app.config.get('PROFILER_ENABLED', False):
+        return
+
+    max_seconds = app.config['PROFILER_MAX_SECONDS']
+    max_bytes = app.config['PROFILER_MAX_OUTPUT_BYTES']
+    interval = app.config['PROFILER_SAMPLE_INTERVAL']
+
+    @app.before_request
+    def start_request_profile():
+        fmt = request.args.get('_profile') or request.headers.get('X-Profile')
+        if fmt not in FORMATS or not is_profiler_user():
+            return
+        if not _busy.acquire(blocking=False):
+            return Response('A profile is already running in this worker\n', status=409,
+                            mimetype='text/plain')
+
+        g.profile_format = fmt
+        g.profile_started = time.perf_counter()
+        if fmt == 'collapsed':
+            g.profiler = Sampler(interval, thread_ids={threading.get_ident()})
+            g.profiler.start(max_seconds)
+        else:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def finish_request_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+
+        try:
+            if isinstance(profiler, Sampler):
+                profiler.stop()
+                elapsed = time.perf_counter() - g.profile_started
+                header = (f'# {request.endpoint}: {profiler.samples} samples, {elapsed * 1000:.1f} ms, '
+                          f'status {response.status_code}\n')
+                return Response(header + render_collapsed(profiler.counts, max_bytes),
+                                mimetype='text/plain')
+            profiler.disable()
+            return render_profile(profiler, g.profile_format, max_bytes)
+        finally:
+            _busy.release()
+
+    @app.teardown_request
+    def abandon_request_profile(exc):
+        # after_request is skipped when the view raises - don't leave the profiler running
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return
+        if isinstance(profiler, Sampler):
+            profiler.stop()
+        else:
+            profiler.disable()
+        _busy.release()
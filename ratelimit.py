@@ -0,0 +1,306 @@
+"""
+Token-bucket admission control
+Endpoints in RATE_LIMITS get one bucket per scope:
+- 'global'  shared by every client
+- 'ip'      per client address (RATE_LIMIT_PROXY_HOPS trusted proxies in X-Forwarded-For)
+- 'user'    per signed-in user; for login and register, per submitted username
+
+Each scope is (tokens per second, burst), kept per organisation (see
+tenancy.py). A POST takes one token from each of its buckets, all or nothing. If any bucket is empty it is refused before
+the view runs with 429 and Retry-After (seconds until every bucket has a
+token again). Overload costs a lookup instead of a worker.
+
+Bucket stores (RATE_LIMIT_BACKEND):
+- 'memory'    in-process dict - limits are per worker
+- 'shared'    a memory-mapped slot table in RATE_LIMIT_SHARED_FILE, locked
+              with flock - one set of limits for every worker on the host
+- 'database'  rate_limit_buckets rows, one conditional UPDATE per bucket -
+              limits hold across hosts; idle rows are pruned by the scheduler
+
+If the store fails, requests are let through - the limiter must never be
+the outage.
+"""
+
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, jsonify, render_template, request
+from flask_login import current_user
+
+from metrics import RATE_LIMITED
+from models import db, RateLimitBucket, tenant_key
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows - 'shared' falls back to 'memory'
+    fcntl = None
+
+SCOPES = ('global', 'ip', 'user')
+USERNAME_ENDPOINTS = ('auth.login', 'auth.register')  # 'user' scope keys on the submitted username
+
+
+def _level(tokens, updated, rate, burst, now):
+    """Tokens in a bucket now, after refilling since `updated`"""
+    return min(burst, tokens + max(0.0, now - updated) * rate)
+
+
+def _wait(level, rate):
+    """Seconds until a bucket at `level` has a whole token"""
+    return 0.0 if level >= 1 else (1 - level) / rate
+
+
+# ========================
+# Bucket stores
+# ========================
+class LocalBuckets:
+    """In-process LRU of buckets - limits are per worker"""
+
+    def __init__(self, max_entries=100_000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def take(self, buckets, now):
+        """Seconds to wait for each (key, rate, burst); tokens are only taken if every wait is 0"""
+        with self._lock:
+            levels = [_level(*self._data.get(key, (burst, now)), rate, burst, now) for key, rate, burst in buckets]
+            waits = [_wait(level, rate) for level, (_, rate, _) in zip(levels, buckets)]
+            if not any(waits):
+                for level, (key, _, _) in zip(levels, buckets):
+                    self._data[key] = (level - 1, now)
+                    self._data.move_to_end(key)
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+            return waits
+
+
+class SharedBuckets:
+    """Fixed-size slot table in a memory-mapped file, shared by every worker on the host
+
+    Slot layout: [uint64 key hash][float64 tokens][float64 updated]. A key
+    probes PROBE slots from hash % slots. A new bucket takes an empty slot,
+    or else the least recently used one (an idle bucket has refilled
+    anyway). A take holds flock on the file, plus a thread lock because
+    flock doesn't exclude threads sharing the descriptor. For the same
+    reason each process opens the file itself on its first take - workers
+    forked from a preloaded app would otherwise share the master's.
+    """
+
+    SLOT = struct.Struct('Qdd')
+    PROBE = 8
+
+    def __init__(self, path, slots):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.slots = slots
+        self._pid = None
+        self._fd = self._map = None
+        self._lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._forked)
+
+    def _forked(self):
+        """In a new child: the inherited descriptor and thread lock belong to the parent"""
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _open(self):
+        if self._map is not None:
+            self._map.close()
+            os.close(self._fd)
+        self._pid = os.getpid()
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = self.slots * self.SLOT.size
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size != size:  # New file, or RATE_LIMIT_SHARED_SLOTS changed
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, size)
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+
+    def _find(self, key_hash, claimed):
+        """(slot, tokens, updated) for a key; tokens is None when the bucket is new"""
+        start = key_hash % self.slots
+        free = stalest = None
+        for offset in range(self.PROBE):
+            slot = (start + offset) % self.slots
+            stored, tokens, updated = self.SLOT.unpack_from(self._map, slot * self.SLOT.size)
+            if stored == key_hash:
+                return slot, tokens, updated
+            if slot in claimed:
+                continue
+            if stored == 0:
+                free = slot if free is None else free
+            elif stalest is None or updated < stalest[1]:
+                stalest = (slot, updated)
+        return (free if free is not None else stalest[0]), None, None
+
+    def take(self, buckets, now):
+        """Seconds to wait for each (key, rate, burst); tokens are only taken if every wait is 0"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                found, claimed = [], set()
+                for key, rate, burst in buckets:
+                    key_hash = self._hash(key)
+                    slot, tokens, updated = self._find(key_hash, claimed)
+                    claimed.add(slot)
+                    level = burst if tokens is None else _level(tokens, updated, rate, burst, now)
+                    found.append((slot, key_hash, level, rate))
+                waits = [_wait(level, rate) for _, _, level, rate in found]
+                if not any(waits):
+                    for slot, key_hash, level, _ in found:
+                        self.SLOT.pack_into(self._map, slot * self.SLOT.size, key_hash, level - 1, now)
+                return waits
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class DatabaseBuckets:
+    """rate_limit_buckets rows - limits hold across hosts
+
+    Each bucket is one conditional UPDATE (refill and take, only if a whole
+    token is there) on its own connection, outside the request's
+    transaction. When a later bucket refuses, tokens already taken are
+    given back.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.table = RateLimitBucket.__table__
+
+    def _refilled(self, rate, burst, now):
+        table = self.table
+        elapsed = db.case((table.c.updated < now, now - table.c.updated), else_=0.0)
+        level = table.c.tokens + elapsed * rate
+        return db.case((level > burst, burst), else_=level)
+
+    def take(self, buckets, now):
+        """Seconds to wait for each (key, rate, burst); tokens are only taken if every wait is 0"""
+        table = self.table
+        waits, taken = [0.0] * len(buckets), []
+        with self.engine.begin() as connection:
+            for index, (key, rate, burst) in enumerate(buckets):
+                level = self._refilled(rate, burst, now)
+                if connection.execute(table.update().where(table.c.key == key, level >= 1)
+                                      .values(tokens=level - 1, updated=now)).rowcount:
+                    taken.append((key, burst))
+                    continue
+                row = connection.execute(db.select(table.c.tokens, table.c.updated)
+                                         .where(table.c.key == key)).first()
+                if row is None:
+                    connection.execute(table.insert().values(key=key, tokens=burst - 1, updated=now))
+                    taken.append((key, burst))
+                    continue
+                waits[index] = _wait(_level(row.tokens, row.updated, rate, burst, now), rate)
+                break
+            if any(waits):
+                for key, burst in taken:
+                    connection.execute(table.update().where(table.c.key == key).values(
+                        tokens=db.case((table.c.tokens + 1 > burst, burst), else_=table.c.tokens + 1)))
+        return waits
+
+
+# ========================
+# Limiter
+# ========================
+class RateLimiter:
+    """Checks RATE_LIMITS for each POST before its view runs"""
+
+    def __init__(self, store, limits, proxy_hops=0):
+        for endpoint, scopes in limits.items():
+            for scope, (rate, burst) in scopes.items():
+                if scope not in SCOPES or rate <= 0 or burst < 1:
+                    raise ValueError(f'RATE_LIMITS[{endpoint!r}][{scope!r}]: scope must be one of {SCOPES}, '
+                                     f'rate > 0 and burst >= 1')
+        self.store = store
+        self.limits = limits
+        self.proxy_hops = proxy_hops
+
+    def _client_ip(self):
+        route = request.access_route if self.proxy_hops else []
+        if len(route) >= self.proxy_hops > 0:
+            return route[-self.proxy_hops]
+        return request.remote_addr or 'unknown'
+
+    def _identity(self, scope):
+        if scope == 'global':
+            return ''
+        if scope == 'ip':
+            return self._client_ip()
+        if request.endpoint in USERNAME_ENDPOINTS:
+            return (request.form.get('username') or '').strip().lower()[:80] or None
+        return str(current_user.id) if current_user.is_authenticated else None
+
+    def check(self):
+        """before_request hook: None to go on, or the 429 response"""
+        limits = self.limits.get(request.endpoint) if request.method == 'POST' else None
+        if not limits:
+            return None
+
+        buckets, scopes, tenant = [], [], tenant_key()
+        for scope, (rate, burst) in limits.items():
+            identity = self._identity(scope)
+            if identity is not None:
+                # Each organisation has its own buckets (and user ids)
+                buckets.append((f'{tenant}:{request.endpoint}:{scope}:{identity}', float(rate), float(burst)))
+                scopes.append(scope)
+        try:
+            waits = self.store.take(buckets, time.time())
+        except Exception as e:
+            current_app.logger.warning('Rate limit store failed, admitting request: %s', e)
+            return None
+        if not any(waits):
+            return None
+
+        wait = max(waits)
+        RATE_LIMITED.inc(endpoint=request.endpoint, scope=scopes[waits.index(wait)])
+        return too_many_requests(wait)
+
+
+def too_many_requests(wait):
+    """429 with Retry-After - JSON for API calls, a page for forms"""
+    seconds = max(1, math.ceil(wait))
+    if request.is_json or request.accept_mimetypes.best == 'application/json':
+        response = jsonify({'error': 'Too many requests', 'retry_after': seconds})
+    else:
+        response = current_app.make_response(render_template('errors/429.html', retry_after=seconds))
+    response.status_code = 429
+    response.headers['Retry-After'] = str(seconds)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+def _store(app):
+    backend = app.config.get('RATE_LIMIT_BACKEND', 'shared')
+    if backend == 'database':
+        with app.app_context():
+            return DatabaseBuckets(db.engine)
+    if backend == 'shared' and fcntl is not None:
+        path = app.config.get('RATE_LIMIT_SHARED_FILE') or os.path.join(app.instance_path, 'rate_limits.bin')
+        return SharedBuckets(path, app.config.get('RATE_LIMIT_SHARED_SLOTS', 65536))
+    return LocalBuckets()
+
+
+def init_rate_limits(app):
+    """Refuse over-limit POSTs to the endpoints in RATE_LIMITS with 429 (register after init_metrics)"""
+    if not app.config.get('RATE_LIMIT_ENABLED', True):
+        return None
+    limiter = RateLimiter(_store(app), app.config.get('RATE_LIMITS', {}), app.config.get('RATE_LIMIT_PROXY_HOPS', 0))
+    app.extensions['rate_limiter'] = limiter
+    app.before_request(limiter.check)
+    return limiter
@@ -0,0 +1,199 @@
+"""
+Read models for the admin pages
+The users, user detail, reports and scenario management pages only print
+a handful of columns, but ORM queries build full objects, register each
+one in the identity map and keep their loaded state for change tracking.
+These functions run Core selects of just the needed columns and wrap the
+rows in small __slots__ classes with the same attribute and method names
+the templates already use (user.get_completed_scenarios_count(),
+session.scenario.title, session.get_duration_minutes() ...).
+
+Projections are read-only snapshots: nothing is tracked, and nothing
+lazy-loads, so a template can't trigger extra queries.
+"""
+
+from models import db, User, Scenario, ScenarioVersion, TrainingSession, SessionSummary
+
+
+class Projection:
+    """Base for read-only row projections - slots instead of a per-instance __dict__"""
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__[:3])
+        return f'<{type(self).__name__} {fields}>'
+
+
+class UserRow(Projection):
+    __slots__ = ('id', 'username', 'email', 'role', 'is_active', 'created_at', 'last_login',
+                 'started_count', 'completed_count', 'score_total')
+
+    def get_completed_scenarios_count(self):
+        return self.completed_count
+
+    def get_started_sessions_count(self):
+        return self.started_count
+
+    def get_average_score(self):
+        if not self.completed_count:
+            return 0
+        return round(self.score_total / self.completed_count, 2)
+
+
+class UserRef(Projection):
+    __slots__ = ('id', 'username')
+
+
+class ScenarioRef(Projection):
+    __slots__ = ('id', 'title', 'max_points')
+
+
+class ScenarioRow(Projection):
+    __slots__ = ('id', 'title', 'description', 'incident_type', 'difficulty_level', 'estimated_time',
+                 'max_points', 'times_played', 'average_score', 'created_at')
+
+
+class SessionRow(Projection):
+    __slots__ = ('id', 'status', 'started_at', 'completed_at', 'score', 'time_taken', 'outcome',
+                 'user', 'scenario')
+
+    def get_duration_minutes(self):
+        if self.time_taken:
+            return round(self.time_taken / 60, 1)
+        return 0
+
+    def is_completed(self):
+        return self.status == 'completed'
+
+
+# ========================
+# Users
+# ========================
+def _user_select(user_id=None):
+    """Users joined to their (started, completed, score_total), live plus archived"""
+    completed = TrainingSession.status == 'completed'
+    live = db.select(
+        TrainingSession.user_id,
+        db.func.count(TrainingSession.id).label('started'),
+        db.func.count(TrainingSession.id).filter(completed).label('completed'),
+        db.func.coalesce(db.func.sum(TrainingSession.score).filter(completed), 0).label('score_total'),
+    ).group_by(TrainingSession.user_id)
+    archived = db.select(
+        SessionSummary.user_id,
+        db.func.sum(SessionSummary.started_count).label('started'),
+        db.func.sum(SessionSummary.completed_count).label('completed'),
+        db.func.sum(SessionSummary.score_total).label('score_total'),
+    ).group_by(SessionSummary.user_id)
+    if user_id is not None:
+        # Filter inside the groups so only this user's sessions are read
+        live = live.where(TrainingSession.user_id == user_id)
+        archived = archived.where(SessionSummary.user_id == user_id)
+    live, archived = live.subquery('live'), archived.subquery('archived')
+
+    def total(column):
+        return db.func.coalesce(live.c[column], 0) + db.func.coalesce(archived.c[column], 0)
+
+    return (
+        db.select(User.id, User.username, User.email, User.role, User.is_active, User.created_at,
+                  User.last_login, total('started'), total('completed'), total('score_total'))
+        .outerjoin(live, live.c.user_id == User.id)
+        .outerjoin(archived, archived.c.user_id == User.id)
+    )
+
+
+def user_rows(roles=('trainee', 'instructor')):
+    """Users with their session counts (live plus archived), newest first, in one statement"""
+    statement = _user_select().where(User.role.in_(roles)).order_by(User.created_at.desc())
+    return [UserRow(*row) for row in db.session.execute(statement)]
+
+
+def user_row(user_id):
+    """One user's projection (counts included), or None"""
+    row = db.session.execute(_user_select(user_id).where(User.id == user_id)).first()
+    return UserRow(*row) if row else None
+
+
+# ========================
+# Sessions
+# ========================
+def _session_select(*criteria):
+    # Scores are out of the max points of the version the session was played on
+    max_points = db.func.coalesce(ScenarioVersion.max_points, Scenario.max_points)
+    return (
+        db.select(TrainingSession.id, TrainingSession.status, TrainingSession.started_at,
+                  TrainingSession.completed_at, TrainingSession.score, TrainingSession.time_taken,
+                  TrainingSession.outcome, User.id, User.username,
+                  Scenario.id, Scenario.title, max_points)
+        .join(User, User.id == TrainingSession.user_id)
+        .join(Scenario, Scenario.id == TrainingSession.scenario_id)
+        .outerjoin(ScenarioVersion, ScenarioVersion.hash == TrainingSession.version_hash)
+        .where(*criteria)
+    )
+
+
+def _session_rows(statement):
+    rows = []
+    users, scenarios = {}, {}  # One reference object per user/scenario version, shared by their rows
+    for row in db.session.execute(statement):
+        user = users.get(row[7])
+        if user is None:
+            user = users[row[7]] = UserRef(row[7], row[8])
+        scenario = scenarios.get(row[9:12])
+        if scenario is None:
+            scenario = scenarios[row[9:12]] = ScenarioRef(*row[9:12])
+        rows.append(SessionRow(*row[:7], user, scenario))
+    return rows
+
+
+def completed_session_rows():
+    """Every completed session with its user's name and scenario's title, oldest first"""
+    return _session_rows(_session_select(TrainingSession.status == 'completed')
+                         .order_by(TrainingSession.id))
+
+
+def user_session_rows(user_id):
+    """A user's sessions with scenario titles, most recently started first"""
+    return _session_rows(_session_select(TrainingSession.user_id == user_id)
+                         .order_by(TrainingSession.started_at.desc()))
+
+
+# ========================
+# Scenarios
+# ========================
+def scenario_rows():
+    """Scenarios for the management table, newest first"""
+    statement = db.select(Scenario.id, Scenario.title, Scenario.description, Scenario.incident_type,
+                          Scenario.difficulty_level, Scenario.estimated_time, Scenario.max_points,
+                          Scenario.times_played, Scenario.average_score,
+                          Scenario.created_at).order_by(Scenario.created_at.desc())
+    return [ScenarioRow(*row) for row in db.session.execute(statement)]
+
+
+def scenario_completion_totals():
+    """[(title, completed, score_total)] per scenario with completions, live plus archived, in one statement"""
+    completed = TrainingSession.status == 'completed'
+    live = db.select(
+        TrainingSession.scenario_id.label('key'),
+        db.func.count(TrainingSession.id).label('completed'),
+        db.func.coalesce(db.func.sum(TrainingSession.score), 0).label('score_total'),
+    ).where(completed).group_by(TrainingSession.scenario_id).subquery('live')
+    archived = db.select(
+        SessionSummary.scenario_id.label('key'),
+        db.func.sum(SessionSummary.completed_count).label('completed'),
+        db.func.sum(SessionSummary.score_total).label('score_total'),
+    ).group_by(SessionSummary.scenario_id).subquery('archived')
+
+    attempts = db.func.coalesce(live.c.completed, 0) + db.func.coalesce(archived.c.completed, 0)
+    score_total = db.func.coalesce(live.c.score_total, 0) + db.func.coalesce(archived.c.score_total, 0)
+    statement = (
+        db.select(Scenario.title, attempts, score_total)
+        .outerjoin(live, live.c.key == Scenario.id)
+        .outerjoin(archived, archived.c.key == Scenario.id)
+        .where(attempts > 0)
+        .order_by(Scenario.id)
+    )
+    return db.session.execute(statement).all()
@@ -0,0 +1,358 @@
+"""
+Next-scenario recommendations
+Each trainee has a weakness vector over the five categories, 1 - earned /
+available, from their SkillProfile: category scores against the points the
+best path offered, summed over completed sessions and smoothed towards
+PRIOR_RATIO so one session doesn't swing it. Each scenario has an emphasis
+vector - the share of its best-path points in each category, split by
+option metrics the way play.html awards them.
+
+Ranking is one matrix product over the whole active library:
+    score = weakness . emphasis - DIFFICULTY_WEIGHT * |difficulty - target| - PLAYED_PENALTY * completed
+with the target difficulty rising with the trainee's overall ratio.
+
+Caching:
+- category points are content-derived, so they are stored per version hash
+  (scenario_version_points) and memoised in-process for good
+- the library matrix is rebuilt only when Scenario.cache_version() changes
+- each user's top scenarios are kept until the library or their profile
+  changes; complete() updates the profile with one UPDATE, so the next
+  dashboard view re-ranks just that user
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+from flask import current_app
+
+from models import (db, Scenario, ScenarioVersion, ScenarioVersionPoints, SessionSummary,
+                    SkillProfile, TrainingSession, tenant_key)
+from scenario_content import CATEGORIES, category_points
+
+PRIOR_RATIO = 0.5  # Share of available points assumed before there is any evidence
+PRIOR_POINTS = 50  # ... weighted as this many available points per category
+DIFFICULTY_WEIGHT = 0.1  # Score lost per level away from the trainee's target difficulty
+PLAYED_PENALTY = 0.5  # Completed scenarios sink below unplayed ones that fit as well
+RANK_CHUNK = 256  # Users ranked per matrix product (bounds the users x library score matrix)
+IN_CHUNK = 500  # Values per IN (...) list
+
+# version hash -> category points; versions never change, so entries can't go stale
+_version_points = {}
+_VERSION_POINTS_MAX = 100_000
+
+
+class RecommenderCache:
+    """Per-app library matrices and per-user results, both by organisation (see tenancy.py)"""
+
+    def __init__(self, max_users):
+        self.lock = threading.Lock()
+        self.libraries = {}  # tenant -> library
+        self.results = OrderedDict()  # (tenant, user_id) -> (key, recommendations), least recently used first
+        self.max_users = max_users
+
+    def get(self, user_id, key):
+        user_key = (tenant_key(), user_id)
+        with self.lock:
+            entry = self.results.get(user_key)
+            if entry is None or entry[0] != key:
+                return None
+            self.results.move_to_end(user_key)
+            return entry[1]
+
+    def put(self, user_id, key, recommendations):
+        user_key = (tenant_key(), user_id)
+        with self.lock:
+            self.results[user_key] = (key, recommendations)
+            self.results.move_to_end(user_key)
+            while len(self.results) > self.max_users:
+                self.results.popitem(last=False)
+
+    def discard(self, user_id):
+        with self.lock:
+            self.results.pop((tenant_key(), user_id), None)
+
+
+def _chunks(values, size=IN_CHUNK):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def version_points(hashes):
+    """Category points for each version hash - memo, then scenario_version_points, then computed and stored"""
+    found = {key: _version_points[key] for key in hashes if key in _version_points}
+    missing = set(hashes) - found.keys()
+
+    columns = [getattr(ScenarioVersionPoints, c) for c in CATEGORIES]
+    for chunk in _chunks(missing):
+        for key, *values in db.session.execute(
+                db.select(ScenarioVersionPoints.hash, *columns).where(ScenarioVersionPoints.hash.in_(chunk))):
+            found[key] = np.array(values, dtype=float)
+    missing -= found.keys()
+
+    computed = []
+    for chunk in _chunks(missing):
+        for key, content in db.session.execute(
+                db.select(ScenarioVersion.hash, ScenarioVersion.scenario_content)
+                .where(ScenarioVersion.hash.in_(chunk))):
+            found[key] = np.array(category_points(content), dtype=float)
+            computed.append({'hash': key, **dict(zip(CATEGORIES, found[key].tolist()))})
+    if computed:
+        ScenarioVersionPoints.store(computed)
+
+    if len(_version_points) + len(found) > _VERSION_POINTS_MAX:
+        _version_points.clear()
+    _version_points.update(found)
+    return found
+
+
+def _scenario_points(scenario_ids):
+    """Category points of each scenario's current content (legacy scenarios without a version included)"""
+    current = {}
+    for chunk in _chunks(scenario_ids):
+        current.update(db.session.execute(
+            db.select(Scenario.id, Scenario.version_hash).where(Scenario.id.in_(chunk))).all())
+    points = version_points({key for key in current.values() if key})
+    result = {scenario_id: points[key] for scenario_id, key in current.items() if key in points}
+
+    legacy = [scenario_id for scenario_id in current if scenario_id not in result]
+    for chunk in _chunks(legacy):
+        for scenario_id, content in db.session.execute(
+                db.select(Scenario.id, Scenario.scenario_content).where(Scenario.id.in_(chunk))):
+            result[scenario_id] = np.array(category_points(content), dtype=float)
+    return result
+
+
+def _emphasis(points):
+    """Rows scaled to sum to 1; scenarios with no positive points emphasise every category equally"""
+    totals = points.sum(axis=1, keepdims=True)
+    return np.divide(points, totals, out=np.full_like(points, 1 / len(CATEGORIES)), where=totals > 0)
+
+
+def _load_library(stamp):
+    rows = db.session.execute(
+        db.select(Scenario.id, Scenario.title, Scenario.incident_type, Scenario.difficulty_level)
+        .where(Scenario.is_active.is_(True)).order_by(Scenario.id)).all()
+    ids = [row.id for row in rows]
+    points = _scenario_points(ids)
+    matrix = np.array([points[scenario_id] for scenario_id in ids], dtype=float).reshape(-1, len(CATEGORIES))
+    return SimpleNamespace(
+        stamp=stamp,
+        ids=np.array(ids, dtype=np.int64),
+        titles=[row.title for row in rows],
+        incident_types=[row.incident_type for row in rows],
+        difficulty=np.array([row.difficulty_level for row in rows], dtype=float),
+        emphasis=_emphasis(matrix),
+    )
+
+
+def _library(cache):
+    """The active library as arrays, rebuilt when the scenario table changes"""
+    stamp = Scenario.cache_version()
+    tenant = tenant_key()
+    library = cache.libraries.get(tenant)
+    if library is None or library.stamp != stamp:
+        library = _load_library(stamp)
+        with cache.lock:
+            cache.libraries[tenant] = library
+    return library
+
+
+def profile_vectors(profiles):
+    """(weakness, target difficulty) arrays for SkillProfile rows - shapes (m, 5) and (m,)"""
+    earned = np.array([[getattr(p, f'{c}_earned') for c in CATEGORIES] for p in profiles],
+                      dtype=float).reshape(-1, len(CATEGORIES))
+    available = np.array([[getattr(p, f'{c}_available') for c in CATEGORIES] for p in profiles],
+                         dtype=float).reshape(-1, len(CATEGORIES))
+    prior = PRIOR_RATIO * PRIOR_POINTS
+    weakness = 1 - np.clip((earned + prior) / (available + PRIOR_POINTS), 0, 1)
+    overall = np.clip((earned.sum(axis=1) + prior * len(CATEGORIES))
+                      / (available.sum(axis=1) + PRIOR_POINTS * len(CATEGORIES)), 0, 1)
+    return weakness, 1 + 4 * overall
+
+
+def rank(emphasis, difficulty, weakness, target, played, limit):
+    """Top `limit` library columns per user, best first, with their scores
+
+    emphasis (n, 5) and difficulty (n,) describe the library; weakness (m, 5),
+    target (m,) and played (m, n) the users.
+    """
+    scores = weakness @ emphasis.T
+    scores -= DIFFICULTY_WEIGHT * np.abs(difficulty[None, :] - target[:, None])
+    scores -= PLAYED_PENALTY * played
+    k = min(limit, scores.shape[1])
+    if k == 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty
+    top = np.argpartition(scores, -k, axis=1)[:, -k:]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    return top, np.take_along_axis(scores, top, axis=1)
+
+
+def _played(library, user_ids):
+    """(m, n) mask of library scenarios each user has completed"""
+    played = np.zeros((len(user_ids), len(library.ids)), dtype=bool)
+    if not len(library.ids):
+        return played
+    rows = {user_id: index for index, user_id in enumerate(user_ids)}
+    for chunk in _chunks(user_ids):
+        pairs = db.session.execute(
+            db.select(TrainingSession.user_id, TrainingSession.scenario_id).distinct()
+            .where(TrainingSession.user_id.in_(chunk), TrainingSession.status == 'completed')).all()
+        if not pairs:
+            continue
+        users, scenarios = np.array(pairs, dtype=np.int64).T
+        columns = np.minimum(np.searchsorted(library.ids, scenarios), len(library.ids) - 1)
+        known = library.ids[columns] == scenarios
+        played[[rows[user_id] for user_id in users[known].tolist()], columns[known]] = True
+    return played
+
+
+def _profiles(user_ids):
+    profiles = {}
+    for chunk in _chunks(user_ids):
+        profiles.update((p.user_id, p) for p in SkillProfile.query.filter(SkillProfile.user_id.in_(chunk)))
+    missing = [user_id for user_id in user_ids if user_id not in profiles]
+    if missing:
+        # Two tabs of a new user may both get here - the second insert is a no-op, not a 500
+        rebuild_profiles(missing, keep_existing=True)
+        db.session.commit()
+        for chunk in _chunks(missing):
+            profiles.update((p.user_id, p) for p in SkillProfile.query.filter(SkillProfile.user_id.in_(chunk)))
+    return profiles
+
+
+def recommend_many(user_ids, limit=None):
+    """Recommended scenarios for each user id, best first: {user_id: [SimpleNamespace, ...]}"""
+    cache = current_app.extensions['recommender']
+    limit = limit or current_app.config['RECOMMENDATIONS_SHOWN']
+    library = _library(cache)
+    profiles = _profiles(user_ids)
+
+    results, stale = {}, []
+    for user_id in user_ids:
+        profile = profiles[user_id]
+        key = (library.stamp, profile.sessions, profile.updated_at, limit)
+        cached = cache.get(user_id, key)
+        if cached is None:
+            stale.append((user_id, key))
+        else:
+            results[user_id] = cached
+
+    for start in range(0, len(stale), RANK_CHUNK):
+        batch = stale[start:start + RANK_CHUNK]
+        batch_ids = [user_id for user_id, _ in batch]
+        weakness, target = profile_vectors([profiles[user_id] for user_id in batch_ids])
+        top, scores = rank(library.emphasis, library.difficulty, weakness, target,
+                           _played(library, batch_ids), limit)
+        for row, (user_id, key) in enumerate(batch):
+            recommendations = []
+            for column, score in zip(top[row].tolist(), scores[row].tolist()):
+                focus = library.emphasis[column] * weakness[row]
+                recommendations.append(SimpleNamespace(
+                    scenario_id=int(library.ids[column]),
+                    title=library.titles[column],
+                    incident_type=library.incident_types[column],
+                    difficulty_level=int(library.difficulty[column]),
+                    score=round(score, 4),
+                    focus=[CATEGORIES[i] for i in np.argsort(-focus, kind='stable')[:2] if focus[i] > 0],
+                ))
+            cache.put(user_id, key, recommendations)
+            results[user_id] = recommendations
+    return results
+
+
+def recommend(user_id, limit=None):
+    """Recommended scenarios for one user, best first"""
+    return recommend_many([user_id], limit)[user_id]
+
+
+def record_completion(session):
+    """Add a newly completed session to its user's skill profile (one UPDATE in the caller's transaction)"""
+    if session.version_hash:
+        available = version_points({session.version_hash}).get(session.version_hash)
+    else:
+        available = _scenario_points([session.scenario_id]).get(session.scenario_id)
+    if available is None:
+        return
+    earned = [getattr(session, f'{c}_score') or 0 for c in CATEGORIES]
+    SkillProfile.record(session.user_id, earned, available.tolist())
+    current_app.extensions['recommender'].discard(session.user_id)
+
+
+def rebuild_profiles(user_ids=None, keep_existing=False):
+    """Recompute skill profiles from live and archived completed sessions; returns the number written
+
+    With user_ids, every listed user gets a row (zeros if they haven't
+    completed anything); otherwise all users with completed sessions.
+    keep_existing only inserts rows for users who don't have one yet.
+    """
+    live = (
+        db.select(TrainingSession.user_id, TrainingSession.scenario_id, TrainingSession.version_hash,
+                  db.func.count(),
+                  *[db.func.sum(db.func.coalesce(getattr(TrainingSession, f'{c}_score'), 0)) for c in CATEGORIES])
+        .where(TrainingSession.status == 'completed')
+        .group_by(TrainingSession.user_id, TrainingSession.scenario_id, TrainingSession.version_hash)
+    )
+    # Archived sessions didn't keep their version; they count against the scenario's current one
+    archived = (
+        db.select(SessionSummary.user_id, SessionSummary.scenario_id, db.null(),
+                  SessionSummary.completed_count,
+                  *[getattr(SessionSummary, f'{c}_total') for c in CATEGORIES])
+        .where(SessionSummary.completed_count > 0)
+    )
+
+    chunks = list(_chunks(user_ids)) if user_ids is not None else [None]
+    groups = []
+    for chunk in chunks:
+        for query, model in ((live, TrainingSession), (archived, SessionSummary)):
+            if chunk is not None:
+                query = query.where(model.user_id.in_(chunk))
+            groups += db.session.execute(query).all()
+
+    by_version = version_points({key for _, _, key, *_ in groups if key})
+    by_scenario = _scenario_points({scenario_id for _, scenario_id, key, *_ in groups
+                                    if not key or key not in by_version})
+
+    zeros = np.zeros(len(CATEGORIES))
+    totals = {user_id: [0, zeros.copy(), zeros.copy()] for user_id in user_ids or ()}
+    for user_id, scenario_id, key, count, *earned in groups:
+        available = by_version.get(key) if key else None
+        if available is None:
+            available = by_scenario.get(scenario_id)
+        if available is None:
+            continue  # Scenario deleted since
+        total = totals.setdefault(user_id, [0, zeros.copy(), zeros.copy()])
+        total[0] += count
+        total[1] += np.array(earned, dtype=float)
+        total[2] += available * count
+
+    now = datetime.utcnow()
+    rows = []
+    for user_id, (sessions, earned, available) in totals.items():
+        row = {'user_id': user_id, 'sessions': sessions, 'updated_at': now}
+        row.update((f'{c}_earned', value) for c, value in zip(CATEGORIES, earned.tolist()))
+        row.update((f'{c}_available', value) for c, value in zip(CATEGORIES, available.tolist()))
+        rows.append(row)
+
+    if keep_existing:
+        for chunk in _chunks(rows, 1000):
+            SkillProfile.store(chunk)
+        return len(rows)
+    if user_ids is None:
+        db.session.execute(db.delete(SkillProfile))
+    else:
+        for chunk in chunks:
+            db.session.execute(db.delete(SkillProfile).where(SkillProfile.user_id.in_(chunk)))
+    for chunk in _chunks(rows, 1000):
+        db.session.execute(db.insert(SkillProfile), chunk)
+    return len(rows)
+
+
+def init_recommender(app):
+    """Per-app recommendation cache"""
+    app.extensions['recommender'] = RecommenderCache(app.config['RECOMMENDER_CACHE_USERS'])
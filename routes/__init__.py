@@ -9,6 +9,7 @@ from flask import Blueprint
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 scenario_bp = Blueprint('scenarios', __name__, url_prefix='/scenarios')
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
+team_bp = Blueprint('teams', __name__, url_prefix='/teams')
 
 # Import route handlers
-from . import auth, scenarios, admin
\ No newline at end of file
+from . import auth, scenarios, admin, teams
\ No newline at end of file
@@ -1,13 +1,25 @@
 """Admin routes - Instructor dashboard and management"""
 
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, current_app, abort, Response, send_from_directory, stream_with_context
 from flask_login import login_required, current_user
 from functools import wraps
-from models import db, User, Scenario, TrainingSession
+from models import db, User, Scenario, TrainingSession, Cohort, CohortAssignment, CohortRollup, SessionSummary, SchedulerLock, ScheduledJob, ScenarioPublication, cohort_members, tenant_key
 from werkzeug.security import generate_password_hash
 from datetime import datetime
 from . import admin_bp
 from types import SimpleNamespace
+from fragment_cache import Lazy
+import profiler
+import deletion
+import scenario_packs
+import simulator
+import read_models
+from archive import list_archives
+from scheduler import LOCK_NAME
+from tenancy import tenant_dir
+from scenario_content import best_path_points, validate
+import re
+import json
 
 def instructor_required(f):
     """Decorator to require instructor role"""
@@ -59,8 +71,7 @@ def dashboard():
 @instructor_required
 def users():
     """Manage users"""
-    all_users = User.query.filter(User.role.in_(['trainee', 'instructor'])).order_by(User.created_at.desc()).all()
-    return render_template('admin/users.html', users=all_users)
+    return render_template('admin/users.html', users=read_models.user_rows())
 
 @admin_bp.route('/users/add', methods=['POST'])
 @login_required
@@ -121,52 +132,54 @@ def add_user():
 @instructor_required
 def user_detail(user_id):
     """View user details and progress"""
-    user = User.query.get_or_404(user_id)
-    
-    # Get user's training history
-    sessions = TrainingSession.query.filter_by(user_id=user_id).order_by(
-        TrainingSession.started_at.desc()
-    ).all()
-    
-    # Calculate statistics
-    total_sessions = len(sessions)
-    completed_sessions = len([s for s in sessions if s.status == 'completed'])
-    average_score = sum([s.score for s in sessions if s.score]) / completed_sessions if completed_sessions > 0 else 0
+    user = read_models.user_row(user_id)
+    if user is None:
+        abort(404)
     
+    # Totals include sessions past the retention window (kept as summaries)
     user_stats = {
-        'total_sessions': total_sessions,
-        'completed_sessions': completed_sessions,
-        'average_score': average_score
+        'total_sessions': user.started_count,
+        'completed_sessions': user.completed_count,
+        'average_score': user.score_total / user.completed_count if user.completed_count else 0
     }
     
     return render_template('admin/user_detail.html',
                          user=user,
-                         sessions=sessions,
+                         sessions=read_models.user_session_rows(user_id),
                          stats=user_stats)
 
+def _delete_one(delete, item_id, label):
+    """Run a chunked delete to completion and report it as JSON"""
+    try:
+        result = None
+        for result in delete(item_id, current_app.config['BULK_DELETE_BATCH_SIZE'],
+                             current_app.config['BULK_DELETE_PAUSE']):
+            pass
+        if result['status'] == 'skipped':
+            return jsonify({'success': False, 'error': f"Can't delete: {result['reason']}"}), 409
+        return jsonify({'success': True, 'message': f'{label} "{result["name"]}" deleted'})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @admin_bp.route('/users/<int:user_id>/delete', methods=['POST'])
 @login_required
 @instructor_required
 def delete_user(user_id):
     """Delete a user"""
-    user = User.query.get_or_404(user_id)
-    username = user.username
-    
-    try:
-        db.session.delete(user)
-        db.session.commit()
-        return jsonify({'success': True, 'message': f'User "{username}" deleted'})
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'success': False, 'error': str(e)}), 500
+    User.query.get_or_404(user_id)
+    return _delete_one(deletion.delete_user, user_id, 'User')
 
 @admin_bp.route('/scenarios/manage')
 @login_required
 @instructor_required
 def manage_scenarios():
     """Manage scenarios"""
-    scenarios = Scenario.query.order_by(Scenario.created_at.desc()).all()
-    return render_template('admin/scenarios.html', scenarios=scenarios)
+    # Only loaded when the cached scenario table is stale
+    scenarios = Lazy(read_models.scenario_rows)
+    return render_template('admin/scenarios.html',
+                         scenarios=scenarios,
+                         scenarios_version=Scenario.cache_version())
 
 @admin_bp.route('/scenarios/create', methods=['GET', 'POST'])
 @login_required
@@ -195,20 +208,9 @@ def create_scenario():
             import json
             scenario_data = json.loads(scenario_content)
             
-            # Calculate max_points if auto is enabled
+            # Calculate max_points if auto is enabled (best answer path)
             if auto_max_points:
-                total_points = 0
-                if 'stages' in scenario_data:
-                    for stage in scenario_data['stages']:
-                        # Sum the HIGHEST points from each stage (best answer path)
-                        if 'options' in stage:
-                            max_stage_points = 0
-                            for option in stage['options']:
-                                points = int(option.get('points', 0))
-                                if points > max_stage_points:
-                                    max_stage_points = points
-                            total_points += max_stage_points
-                max_points = total_points if total_points > 0 else 100
+                max_points = best_path_points(scenario_data)
             
             new_scenario = Scenario(
                 title=title,
@@ -222,6 +224,7 @@ def create_scenario():
             )
             
             db.session.add(new_scenario)
+            new_scenario.publish(current_user.id)
             db.session.commit()
             flash(f'✅ Scenario "{title}" created successfully! (Max Points: {max_points})', 'success')
             return redirect(url_for('admin.manage_scenarios'))
@@ -272,23 +275,14 @@ def edit_scenario(scenario_id):
             import json
             scenario_data = json.loads(scenario.scenario_content)
             
-            # Calculate max_points if auto is enabled
+            # Calculate max_points if auto is enabled (best answer path)
             if auto_max_points:
-                total_points = 0
-                if 'stages' in scenario_data:
-                    for stage in scenario_data['stages']:
-                        # Sum the HIGHEST points from each stage (best answer path)
-                        if 'options' in stage:
-                            max_stage_points = 0
-                            for option in stage['options']:
-                                points = int(option.get('points', 0))
-                                if points > max_stage_points:
-                                    max_stage_points = points
-                            total_points += max_stage_points
-                scenario.max_points = total_points if total_points > 0 else 100
+                scenario.max_points = best_path_points(scenario_data)
             else:
                 scenario.max_points = int(request.form.get('max_points', scenario.max_points or 100))
             
+            # A new immutable version - sessions already in progress keep theirs
+            scenario.publish(current_user.id)
             db.session.commit()
             flash(f'✅ Scenario "{scenario.title}" updated successfully! (Max Points: {scenario.max_points})', 'success')
             return redirect(url_for('admin.manage_scenarios'))
@@ -304,21 +298,130 @@ def edit_scenario(scenario_id):
     
     return render_template('admin/create_scenario.html', scenario=scenario)
 
-@admin_bp.route('/scenarios/<int:scenario_id>/delete', methods=['POST'])
+@admin_bp.route('/scenarios/<int:scenario_id>/versions')
 @login_required
 @instructor_required
-def delete_scenario(scenario_id):
-    """Delete a scenario"""
+def scenario_versions(scenario_id):
+    """Published versions of a scenario, newest first, with how many sessions pinned each"""
     scenario = Scenario.query.get_or_404(scenario_id)
-    title = scenario.title
+    pinned = dict(db.session.query(TrainingSession.version_hash, db.func.count(TrainingSession.id))
+                  .filter(TrainingSession.scenario_id == scenario_id)
+                  .group_by(TrainingSession.version_hash).all())
+    return jsonify({
+        'scenario_id': scenario.id,
+        'current': scenario.version_hash,
+        'versions': [{
+            'hash': publication.version_hash,
+            'published_at': publication.published_at.isoformat(),
+            'published_by': publication.published_by,
+            'max_points': publication.version.max_points,
+            'sessions': pinned.get(publication.version_hash, 0),
+            'url': url_for('scenarios.version_content', version_hash=publication.version_hash),
+        } for publication in scenario.publications.options(db.joinedload(ScenarioPublication.version))],
+        'unversioned_sessions': pinned.get(None, 0),
+    })
+
+@admin_bp.route('/scenarios/simulate', methods=['POST'])
+@login_required
+@instructor_required
+def simulate_scenario():
+    """Random play of unsaved scenario content: score histogram, stage reach and outcome chances
     
+    JSON body: scenario_content, max_points, auto_max_points, optional runs.
+    """
+    data = request.get_json(silent=True) or {}
+    content = data.get('scenario_content') or ''
+    if isinstance(content, (dict, list)):
+        content = json.dumps(content)
     try:
-        db.session.delete(scenario)
-        db.session.commit()
-        return jsonify({'success': True, 'message': f'Scenario "{title}" deleted'})
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'success': False, 'error': str(e)}), 500
+        max_points = None if data.get('auto_max_points') else int(data.get('max_points') or 0) or None
+        runs = int(data.get('runs') or current_app.config['SIMULATOR_RUNS'])
+    except (TypeError, ValueError):
+        return jsonify({'error': 'max_points and runs must be whole numbers'}), 400
+    
+    report = simulator.simulate(content, max(max_points, 1) if max_points else None,
+                                runs=min(max(runs, 1), current_app.config['SIMULATOR_MAX_RUNS']))
+    return jsonify({'errors': validate(content), **report})
+
+@admin_bp.route('/scenarios/export')
+@login_required
+@instructor_required
+def export_scenarios():
+    """Stream scenarios as a pack (?format=jsonl|zip, optional ?ids=1,2,3)"""
+    fmt = request.args.get('format', 'jsonl')
+    if fmt not in ('jsonl', 'zip'):
+        abort(400)
+    try:
+        ids = [int(item_id) for item_id in request.args.get('ids', '').split(',') if item_id.strip()] or None
+    except ValueError:
+        abort(400)
+    
+    filename = f'scenarios-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}'
+    pack = scenario_packs.export_pack(ids, fmt, name=request.host)
+    return Response(stream_with_context(pack),
+                    mimetype='application/zip' if fmt == 'zip' else 'application/x-ndjson',
+                    headers={'Content-Disposition': f'attachment; filename={filename}',
+                             'X-Accel-Buffering': 'no', 'Cache-Control': 'no-store'})
+
+def _flag(name):
+    """Checkbox or API boolean from the form"""
+    return request.form.get(name, '').lower() in ('1', 'on', 'true', 'yes')
+
+@admin_bp.route('/scenarios/import', methods=['POST'])
+@login_required
+@instructor_required
+def import_scenarios():
+    """Import a scenario pack (multipart field "pack"): all valid entries in one transaction
+    
+    Form flags: update (publish changed content over scenarios with the same title),
+    skip_invalid (import the valid entries anyway), dry_run (validate only).
+    Browsers get a flash message; API clients asking for JSON get the summary.
+    """
+    wants_json = request.accept_mimetypes.best == 'application/json'
+    upload = request.files.get('pack')
+    
+    if upload is None or not upload.filename:
+        if wants_json:
+            return jsonify({'success': False, 'error': 'Choose a pack file to import'}), 400
+        flash('Choose a pack file to import', 'error')
+        return redirect(url_for('admin.manage_scenarios'))
+    
+    try:
+        summary = scenario_packs.import_pack(
+            upload.stream, current_user.id,
+            update=_flag('update'), skip_invalid=_flag('skip_invalid'), dry_run=_flag('dry_run'),
+            workers=current_app.config['PACK_IMPORT_WORKERS'],
+            chunk_size=current_app.config['PACK_IMPORT_CHUNK_SIZE'],
+            batch_size=current_app.config['PACK_IMPORT_BATCH_SIZE'])
+    except scenario_packs.PackError as e:
+        if wants_json:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        flash(f'❌ {upload.filename}: {e}', 'error')
+        return redirect(url_for('admin.manage_scenarios'))
+    
+    ok = summary['imported'] or not summary['invalid']
+    if wants_json:
+        return jsonify({'success': ok, **summary}), 200 if ok else 422
+    
+    counts = (f"{summary['created']} new, {summary['updated']} updated, {summary['unchanged']} unchanged, "
+              f"{summary['skipped']} skipped (title exists), {summary['invalid']} invalid")
+    if summary['imported']:
+        flash(f'✅ Imported {upload.filename} in {summary["seconds"]}s: {counts}', 'success')
+    elif summary['dry_run'] and not summary['invalid']:
+        flash(f'✅ {upload.filename} is valid: {counts}', 'success')
+    else:
+        flash(f'❌ Nothing imported from {upload.filename}: {counts}', 'error')
+    for error in summary['errors'][:5]:
+        flash(f"{error['source']}: {'; '.join(error['errors'][:3])}", 'error')
+    return redirect(url_for('admin.manage_scenarios'))
+
+@admin_bp.route('/scenarios/<int:scenario_id>/delete', methods=['POST'])
+@login_required
+@instructor_required
+def delete_scenario(scenario_id):
+    """Delete a scenario"""
+    Scenario.query.get_or_404(scenario_id)
+    return _delete_one(deletion.delete_scenario, scenario_id, 'Scenario')
 
 @admin_bp.route('/reports')
 @login_required
@@ -326,19 +429,323 @@ def delete_scenario(scenario_id):
 def reports():
     """View training reports and analytics"""
     
-    # Get all completed sessions with statistics
-    completed_sessions = TrainingSession.query.filter_by(status='completed').all()
+    # Completed sessions with user names and scenario titles, in one joined select
+    completed_sessions = read_models.completed_session_rows()
+    
+    # Completions per scenario, live plus archived (one grouped query, shared by both builders)
+    per_scenario = Lazy(read_models.scenario_completion_totals)
+    
+    # Overall totals
+    def build_totals():
+        completed = sum(attempts for _, attempts, _ in per_scenario)
+        score_total = sum(score_total for _, _, score_total in per_scenario)
+        return SimpleNamespace(completed=completed,
+                               average=score_total / completed if completed else None)
     
     # Scenario performance
-    scenario_stats = {}
-    for scenario in Scenario.query.all():
-        sessions = [s for s in completed_sessions if s.scenario_id == scenario.id]
-        if sessions:
-            scenario_stats[scenario.title] = {
-                'attempts': len(sessions),
-                'avg_score': sum([s.score for s in sessions if s.score]) / len(sessions)
-            }
+    def build_scenario_stats():
+        return {title: {'attempts': attempts, 'avg_score': score_total / attempts}
+                for title, attempts, score_total in per_scenario}
+    
+    # Only computed when the cached stats fragments are stale
+    stats_version = (TrainingSession.stats_version(), Scenario.cache_version())
     
     return render_template('admin/reports.html',
                          completed_sessions=completed_sessions,
-                         scenario_stats=scenario_stats)
+                         totals=Lazy(build_totals),
+                         scenario_stats=Lazy(build_scenario_stats),
+                         stats_version=stats_version)
+
+@admin_bp.route('/cache-stats')
+@login_required
+@instructor_required
+def cache_stats():
+    """Fragment cache hit rates for this worker"""
+    cache = current_app.extensions.get('fragment_cache')
+    return jsonify({
+        'backend': type(cache.backend).__name__ if cache else None,
+        'fragments': cache.stats() if cache else {}
+    })
+
+@admin_bp.route('/profile')
+@login_required
+@instructor_required
+def profile_worker():
+    """Sample every thread of this worker for ?seconds=N, as collapsed stacks"""
+    if not current_app.config.get('PROFILER_ENABLED', False) or not profiler.is_profiler_user():
+        abort(404)  # The worker serves every organisation - only the control site's instructors may sample it
+    
+    # The sampler skips its own thread; a worker serving one request at a time has nothing else to show
+    if not request.environ.get('wsgi.multithread'):
+        return Response('This worker handles one request at a time, so there is nothing to sample.\n'
+                        'Run gunicorn with --threads N (gthread workers), or profile a single request '
+                        'with ?_profile=collapsed\n', status=409, mimetype='text/plain')
+    
+    seconds = request.args.get('seconds', 5, type=float)
+    output = profiler.sample_worker(seconds, current_app.config)
+    if output is None:
+        return Response('A profile is already running in this worker\n', status=409, mimetype='text/plain')
+    return Response(output, mimetype='text/plain')
+
+# ========================
+# Cohorts
+# ========================
+@admin_bp.route('/cohorts', methods=['GET', 'POST'])
+@login_required
+@instructor_required
+def cohorts():
+    """List cohorts and create new ones"""
+    if request.method == 'POST':
+        name = request.form.get('name', '').strip()
+        description = request.form.get('description', '').strip()
+        
+        if not name:
+            flash('Cohort name is required', 'error')
+            return redirect(url_for('admin.cohorts'))
+        
+        if Cohort.query.filter_by(name=name).first():
+            flash(f'Cohort "{name}" already exists', 'error')
+            return redirect(url_for('admin.cohorts'))
+        
+        try:
+            cohort = Cohort(name=name, description=description, created_by=current_user.id)
+            db.session.add(cohort)
+            db.session.commit()
+            flash(f'✅ Cohort "{name}" created', 'success')
+            return redirect(url_for('admin.cohort_detail', cohort_id=cohort.id))
+        except Exception as e:
+            db.session.rollback()
+            flash(f'❌ Error creating cohort: {str(e)}', 'error')
+            return redirect(url_for('admin.cohorts'))
+    
+    # Member and assignment counts in one grouped query each
+    member_counts = dict(db.session.query(cohort_members.c.cohort_id, db.func.count())
+                         .group_by(cohort_members.c.cohort_id).all())
+    assignment_counts = dict(db.session.query(CohortAssignment.cohort_id, db.func.count())
+                             .group_by(CohortAssignment.cohort_id).all())
+    
+    return render_template('admin/cohorts.html',
+                         cohorts=Cohort.query.order_by(Cohort.name).all(),
+                         member_counts=member_counts,
+                         assignment_counts=assignment_counts)
+
+@admin_bp.route('/cohorts/<int:cohort_id>')
+@login_required
+@instructor_required
+def cohort_detail(cohort_id):
+    """Class dashboard - read from the rollup rows, not from the sessions table"""
+    cohort = Cohort.query.get_or_404(cohort_id)
+    
+    rollups = (CohortRollup.query.filter_by(cohort_id=cohort_id)
+               .join(Scenario).add_columns(Scenario.title)
+               .order_by(Scenario.title).all())
+    assignments = dict(db.session.query(CohortAssignment.scenario_id, CohortAssignment.due_at)
+                       .filter_by(cohort_id=cohort_id).all())
+    
+    return render_template('admin/cohort_detail.html',
+                         cohort=cohort,
+                         summary=cohort.get_summary(),
+                         rollups=rollups,
+                         assignments=assignments,
+                         members=cohort.members.order_by(User.username).all(),
+                         scenarios=Scenario.query.filter_by(is_active=True).order_by(Scenario.title).all())
+
+@admin_bp.route('/cohorts/<int:cohort_id>/members', methods=['POST'])
+@login_required
+@instructor_required
+def add_cohort_members(cohort_id):
+    """Bulk-add members from a list of usernames (comma or newline separated)"""
+    cohort = Cohort.query.get_or_404(cohort_id)
+    usernames = {name.strip() for name in request.form.get('usernames', '').replace(',', '\n').splitlines()}
+    usernames.discard('')
+    
+    if not usernames:
+        flash('Enter at least one username', 'error')
+        return redirect(url_for('admin.cohort_detail', cohort_id=cohort_id))
+    
+    found = dict(db.session.query(User.username, User.id).filter(User.username.in_(usernames)).all())
+    missing = sorted(usernames - set(found))
+    
+    try:
+        added = cohort.add_members(found.values())
+        CohortRollup.rebuild(cohort_id)
+        db.session.commit()
+        flash(f'✅ Added {added} member(s) to "{cohort.name}"', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'❌ Error adding members: {str(e)}', 'error')
+    
+    if missing:
+        flash(f'Unknown usernames skipped: {", ".join(missing[:20])}', 'warning')
+    return redirect(url_for('admin.cohort_detail', cohort_id=cohort_id))
+
+@admin_bp.route('/cohorts/<int:cohort_id>/members/<int:user_id>/remove', methods=['POST'])
+@login_required
+@instructor_required
+def remove_cohort_member(cohort_id, user_id):
+    """Remove a member from a cohort"""
+    cohort = Cohort.query.get_or_404(cohort_id)
+    
+    try:
+        cohort.remove_member(user_id)
+        CohortRollup.rebuild(cohort_id)
+        db.session.commit()
+        flash('Member removed', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'❌ Error removing member: {str(e)}', 'error')
+    
+    return redirect(url_for('admin.cohort_detail', cohort_id=cohort_id))
+
+@admin_bp.route('/cohorts/<int:cohort_id>/assign', methods=['POST'])
+@login_required
+@instructor_required
+def assign_cohort_scenarios(cohort_id):
+    """Assign several scenarios to every member of a cohort at once"""
+    cohort = Cohort.query.get_or_404(cohort_id)
+    scenario_ids = request.form.getlist('scenario_ids', type=int)
+    
+    due_at = None
+    if request.form.get('due_at'):
+        try:
+            due_at = datetime.strptime(request.form['due_at'], '%Y-%m-%d')
+        except ValueError:
+            flash('Due date must be YYYY-MM-DD', 'error')
+            return redirect(url_for('admin.cohort_detail', cohort_id=cohort_id))
+    
+    valid_ids = [row.id for row in db.session.query(Scenario.id).filter(Scenario.id.in_(scenario_ids))]
+    if not valid_ids:
+        flash('Select at least one scenario', 'error')
+        return redirect(url_for('admin.cohort_detail', cohort_id=cohort_id))
+    
+    try:
+        assigned = cohort.assign_scenarios(valid_ids, assigned_by=current_user.id, due_at=due_at)
+        CohortRollup.rebuild(cohort_id)
+        db.session.commit()
+        flash(f'✅ Assigned {assigned} scenario(s) to "{cohort.name}"', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'❌ Error assigning scenarios: {str(e)}', 'error')
+    
+    return redirect(url_for('admin.cohort_detail', cohort_id=cohort_id))
+
+@admin_bp.route('/cohorts/<int:cohort_id>/assignments/<int:scenario_id>/remove', methods=['POST'])
+@login_required
+@instructor_required
+def unassign_cohort_scenario(cohort_id, scenario_id):
+    """Withdraw a scenario from a cohort"""
+    Cohort.query.get_or_404(cohort_id)
+    
+    try:
+        CohortAssignment.query.filter_by(cohort_id=cohort_id, scenario_id=scenario_id).delete()
+        CohortRollup.query.filter_by(cohort_id=cohort_id, scenario_id=scenario_id).delete()
+        db.session.commit()
+        flash('Assignment removed', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'❌ Error removing assignment: {str(e)}', 'error')
+    
+    return redirect(url_for('admin.cohort_detail', cohort_id=cohort_id))
+
+@admin_bp.route('/cohorts/<int:cohort_id>/delete', methods=['POST'])
+@login_required
+@instructor_required
+def delete_cohort(cohort_id):
+    """Delete a cohort (members keep their accounts and sessions)"""
+    cohort = Cohort.query.get_or_404(cohort_id)
+    name = cohort.name
+    
+    try:
+        db.session.delete(cohort)
+        db.session.commit()
+        return jsonify({'success': True, 'message': f'Cohort "{name}" deleted'})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# ========================
+# Session archive
+# ========================
+@admin_bp.route('/archive')
+@login_required
+@instructor_required
+def archive_index():
+    """Archived session files and the totals kept for them"""
+    totals = db.session.query(
+        db.func.coalesce(db.func.sum(SessionSummary.started_count), 0).label('started'),
+        db.func.coalesce(db.func.sum(SessionSummary.completed_count), 0).label('completed'),
+        db.func.coalesce(db.func.sum(SessionSummary.score_total), 0).label('score_total')
+    ).one()
+    
+    return render_template('admin/archive.html',
+                         archives=list_archives(tenant_dir(current_app.config['ARCHIVE_DIR'])),
+                         totals=totals,
+                         retention_days=current_app.config['ARCHIVE_RETENTION_DAYS'])
+
+@admin_bp.route('/archive/<month>.jsonl.gz')
+@login_required
+@instructor_required
+def archive_download(month):
+    """Download one month of archived sessions (gzip JSONL)"""
+    if not re.fullmatch(r'\d{4}-\d{2}', month):
+        abort(404)
+    return send_from_directory(tenant_dir(current_app.config['ARCHIVE_DIR']), f'sessions-{month}.jsonl.gz',
+                               as_attachment=True, mimetype='application/gzip')
+
+@admin_bp.route('/scheduler')
+@login_required
+@instructor_required
+def scheduler_status():
+    """Maintenance scheduler leader and last run of each job (JSON)"""
+    if tenant_key():
+        abort(404)  # Jobs run for every organisation - only the control site shows them
+    lock = db.session.get(SchedulerLock, LOCK_NAME)
+    jobs = {job.name: job for job in ScheduledJob.query.all()}
+    
+    return jsonify({
+        'enabled': current_app.config['SCHEDULER_ENABLED'],
+        'leader': lock.holder if lock and lock.expires_at > datetime.utcnow() else None,
+        'lease_expires_at': lock.expires_at.isoformat() if lock and lock.expires_at else None,
+        'jobs': [{
+            'name': name,
+            'interval_seconds': seconds,
+            'last_run_at': jobs[name].last_run_at.isoformat() if name in jobs else None,
+            'last_status': jobs[name].last_status if name in jobs else None,
+            'last_duration_ms': jobs[name].last_duration_ms if name in jobs else None,
+            'last_result': jobs[name].last_result if name in jobs else None,
+            'run_count': jobs[name].run_count if name in jobs else 0,
+        } for name, seconds in current_app.config['SCHEDULER_JOBS'].items()]
+    })
+
+@admin_bp.route('/bulk-delete', methods=['POST'])
+@login_required
+@instructor_required
+def bulk_delete():
+    """Delete many users or scenarios in batches, streaming progress as NDJSON
+
+    Body (JSON or form): kind=users|scenarios and ids (list, or comma-separated).
+    One JSON object per line: started / progress / deleted / skipped per item, then a summary.
+    """
+    payload = request.get_json(silent=True) or request.form
+    kind = payload.get('kind')
+    raw_ids = payload.get('ids') or []
+    if isinstance(raw_ids, str):
+        raw_ids = raw_ids.split(',')
+    try:
+        ids = [int(item_id) for item_id in raw_ids if str(item_id).strip()]
+    except ValueError:
+        return jsonify({'success': False, 'error': 'ids must be integers'}), 400
+    if kind not in ('users', 'scenarios') or not ids:
+        return jsonify({'success': False, 'error': 'kind (users or scenarios) and ids are required'}), 400
+    if kind == 'users' and current_user.id in ids:
+        return jsonify({'success': False, 'error': "You can't delete your own account"}), 400
+    
+    batch_size = current_app.config['BULK_DELETE_BATCH_SIZE']
+    pause = current_app.config['BULK_DELETE_PAUSE']
+    
+    def generate():
+        for progress in deletion.delete_many(kind, list(dict.fromkeys(ids)), batch_size, pause):
+            yield json.dumps(progress) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-store'})
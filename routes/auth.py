@@ -4,6 +4,7 @@ from flask import render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
 from models import db, User
+from metrics import LOGINS
 from . import auth_bp
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
@@ -30,6 +31,7 @@ def login():
         # Check credentials
         if user and check_password_hash(user.password_hash, password):
             login_user(user, remember=remember)
+            LOGINS.inc(result='success')
             flash(f'Welcome back, {user.username}!', 'success')
             
             # Redirect to next page or dashboard
@@ -38,6 +40,7 @@ def login():
                 return redirect(next_page)
             return redirect(url_for('dashboard'))
         else:
+            LOGINS.inc(result='failure')
             flash('Invalid username or password', 'error')
     
     return render_template('auth/login.html')
@@ -1,16 +1,30 @@
 """Scenario routes - List, Start, Play scenarios"""
 
-from flask import render_template, redirect, url_for, flash, jsonify, request
+from flask import render_template, redirect, url_for, flash, jsonify, request, current_app, abort
 from flask_login import login_required, current_user
-from models import db, Scenario, TrainingSession
+from models import db, Scenario, ScenarioVersion, TrainingSession, CohortRollup, LeaderboardEntry
+from fragment_cache import Lazy
+from metrics import SESSIONS_STARTED, SESSIONS_COMPLETED
+from search import search_scenarios
+from recommender import recommend, record_completion
 from datetime import datetime
+import hashlib
+import json
 from . import scenario_bp
 
+def _points(value, max_points):
+    """A posted score as an int in 0..max_points - the client adds it up, so it isn't trusted"""
+    try:
+        return min(max(int(value), 0), max_points)
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
 @scenario_bp.route('/')
 @login_required
 def list():
     """List all available scenarios"""
-    scenarios = Scenario.query.all()
+    # Only loaded when the cached scenario cards are stale
+    scenarios = Lazy(Scenario.query.all)
     
     # Get user's completed scenarios
     completed_sessions = TrainingSession.query.filter_by(
@@ -18,11 +32,63 @@ def list():
         status='completed'
     ).all()
     
-    completed_scenario_ids = [session.scenario_id for session in completed_sessions]
+    completed_scenario_ids = sorted({session.scenario_id for session in completed_sessions})
     
     return render_template('scenarios/list.html', 
                          scenarios=scenarios,
-                         completed_ids=completed_scenario_ids)
+                         completed_ids=completed_scenario_ids,
+                         scenarios_version=Scenario.cache_version())
+
+def _run_search():
+    """Search arguments from the query string (q, type, difficulty, page)"""
+    return search_scenarios(query=request.args.get('q', '').strip(),
+                            incident_type=request.args.get('type') or None,
+                            difficulty_level=request.args.get('difficulty', type=int),
+                            page=request.args.get('page', 1, type=int),
+                            per_page=current_app.config['SEARCH_PAGE_SIZE'])
+
+@scenario_bp.route('/search')
+@login_required
+def search():
+    """Full-text scenario search with incident type and difficulty facets"""
+    return render_template('scenarios/search.html', search=_run_search())
+
+@scenario_bp.route('/search.json')
+@login_required
+def search_json():
+    """Search results and facet counts as JSON"""
+    search = _run_search()
+    return jsonify({
+        'query': search.query,
+        'total': search.total,
+        'page': search.page,
+        'pages': search.pages,
+        'results': [{
+            'id': result.scenario.id,
+            'title': result.scenario.title,
+            'description': result.scenario.description,
+            'incident_type': result.scenario.incident_type,
+            'difficulty_level': result.scenario.difficulty_level,
+            'snippet': str(result.snippet) if result.snippet else None,
+        } for result in search.results],
+        'facets': {facet: [{'value': value, 'count': count} for value, count in counts]
+                   for facet, counts in search.facets.items()},
+    })
+
+@scenario_bp.route('/recommended.json')
+@login_required
+def recommended():
+    """Next scenarios for the current user, aimed at their weakest categories"""
+    limit = min(max(request.args.get('limit', current_app.config['RECOMMENDATIONS_SHOWN'], type=int), 1), 50)
+    return jsonify({'recommendations': [{
+        'id': item.scenario_id,
+        'title': item.title,
+        'incident_type': item.incident_type,
+        'difficulty_level': item.difficulty_level,
+        'score': item.score,
+        'focus': item.focus,
+        'url': url_for('scenarios.detail', scenario_id=item.scenario_id),
+    } for item in recommend(current_user.id, limit)]})
 
 @scenario_bp.route('/<int:scenario_id>')
 @login_required
@@ -40,6 +106,31 @@ def detail(scenario_id):
                          scenario=scenario,
                          previous_sessions=previous_sessions)
 
+@scenario_bp.route('/<int:scenario_id>/content.json')
+@login_required
+def content(scenario_id):
+    """Current scenario content as JSON - cached stale-while-revalidate by the service worker"""
+    scenario = Scenario.query.get_or_404(scenario_id)
+    
+    response = current_app.response_class(scenario.scenario_content, mimetype='application/json')
+    response.set_etag(scenario.version_hash or hashlib.sha256(scenario.scenario_content.encode('utf-8')).hexdigest())
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@scenario_bp.route('/versions/<string(length=64):version_hash>.json')
+@login_required
+def version_content(version_hash):
+    """One published version's content - immutable, so browsers and the service worker keep it for good"""
+    version = db.session.get(ScenarioVersion, version_hash) or abort(404)
+    
+    response = current_app.response_class(version.scenario_content, mimetype='application/json')
+    response.set_etag(version.hash)
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config['SCENARIO_VERSION_MAX_AGE']
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
 @scenario_bp.route('/<int:scenario_id>/start', methods=['POST'])
 @login_required
 def start(scenario_id):
@@ -57,19 +148,28 @@ def start(scenario_id):
         flash('You already have an active session for this scenario', 'warning')
         return redirect(url_for('scenarios.play', session_id=active_session.id))
     
-    # Create new training session
+    # Scenarios created before versioning get their first version now
+    if scenario.version_hash is None:
+        scenario.publish()
+    
+    # Create new training session, pinned to the current version
     new_session = TrainingSession(
         user_id=current_user.id,
         scenario_id=scenario.id,
+        version_hash=scenario.version_hash,
         status='in_progress',
         started_at=datetime.utcnow()
     )
     
     try:
         db.session.add(new_session)
+        CohortRollup.record_start(current_user.id, scenario_id)  # flushes the new session too
+        # Read before commit - afterwards the expired rows would cost two reloads
+        session_id, title = new_session.id, scenario.title
         db.session.commit()
-        flash(f'Started: {scenario.title}', 'success')
-        return redirect(url_for('scenarios.play', session_id=new_session.id))
+        SESSIONS_STARTED.inc(scenario_id=scenario_id)
+        flash(f'Started: {title}', 'success')
+        return redirect(url_for('scenarios.play', session_id=session_id))
     except Exception as e:
         db.session.rollback()
         flash('Failed to start scenario', 'error')
@@ -91,9 +191,15 @@ def play(session_id):
     if session.status == 'completed':
         return redirect(url_for('scenarios.results', session_id=session_id))
     
+    # The reaper abandoned it - nothing it sends is accepted any more, so start afresh
+    if session.status == 'abandoned':
+        flash('That session was abandoned - start the scenario again', 'warning')
+        return redirect(url_for('scenarios.detail', scenario_id=session.scenario_id))
+    
     return render_template('scenarios/play.html',
                          session=session,
-                         scenario=session.scenario)
+                         scenario=session.scenario,
+                         version=session.version)
 
 @scenario_bp.route('/session/<int:session_id>/submit', methods=['POST'])
 @login_required
@@ -106,11 +212,30 @@ def submit_decision(session_id):
         return jsonify({'error': 'Access denied'}), 403
     
     # Get decision data
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     decision = data.get('decision')
+    if decision is None:
+        return jsonify({'error': 'No decision provided'}), 400
     
-    # TODO: Process decision, update game state
-    # For now, just acknowledge
+    # Decisions replayed after going offline can arrive late - ignore them
+    # once the session is over
+    if session.status != 'in_progress':
+        return jsonify({'error': 'Session is not in progress'}), 409
+    
+    # Append to the decision log kept in session_data
+    session_log = json.loads(session.session_data) if session.session_data else {}
+    session_log.setdefault('decisions', []).append({
+        'decision': decision,
+        'recorded_at': datetime.utcnow().isoformat()
+    })
+    session.session_data = json.dumps(session_log, separators=(',', ':'))
+    
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error recording decision: {e}")
+        return jsonify({'error': 'Failed to record decision'}), 500
     
     return jsonify({
         'success': True,
@@ -127,36 +252,53 @@ def complete(session_id):
     if session.user_id != current_user.id:
         return jsonify({'error': 'Access denied'}), 403
     
+    # A resubmitted completion (e.g. replayed from the offline queue) must not
+    # rewrite a score the cohort rollups and leaderboards already counted
+    if session.status == 'completed':
+        return jsonify({
+            'error': 'Session is already completed',
+            'redirect': url_for('scenarios.results', session_id=session_id)
+        }), 409
+    
+    # Nor may a session the reaper abandoned be completed later (as in submit_decision)
+    if session.status != 'in_progress':
+        return jsonify({
+            'error': 'Session is not in progress',
+            'redirect': url_for('scenarios.detail', scenario_id=session.scenario_id)
+        }), 409
+    
     # Get final score and optional metrics breakdown
-    data = request.get_json() or {}
-    final_score = data.get('score', 0)
-    metrics = data.get('metrics', {})
+    data = request.get_json(silent=True) or {}
+    metrics = data.get('metrics')
+    if not isinstance(metrics, dict):
+        metrics = {}
+    # Boards keep the best score for good - nothing above what the version played can award
+    max_points = (session.version or session.scenario).max_points or 0
 
     # Update session fields
     session.status = 'completed'
     session.completed_at = datetime.utcnow()
-    try:
-        session.score = int(final_score)
-    except Exception:
-        session.score = 0
+    session.score = _points(data.get('score', 0), max_points)
 
-    # Save breakdown metrics if provided (default to 0)
-    session.detection_score = int(metrics.get('detection', session.detection_score or 0))
-    session.containment_score = int(metrics.get('containment', session.containment_score or 0))
-    session.eradication_score = int(metrics.get('eradication', session.eradication_score or 0))
-    session.recovery_score = int(metrics.get('recovery', session.recovery_score or 0))
-    session.communication_score = int(metrics.get('communication', session.communication_score or 0))
+    # Save breakdown metrics if provided (default to 0), capped like the score (play.html does the same)
+    session.detection_score = _points(metrics.get('detection', session.detection_score or 0), max_points)
+    session.containment_score = _points(metrics.get('containment', session.containment_score or 0), max_points)
+    session.eradication_score = _points(metrics.get('eradication', session.eradication_score or 0), max_points)
+    session.recovery_score = _points(metrics.get('recovery', session.recovery_score or 0), max_points)
+    session.communication_score = _points(metrics.get('communication', session.communication_score or 0), max_points)
 
     # Derive simple outcome label
-    if session.score >= 80:
-        session.outcome = 'success'
-    elif session.score >= 60:
-        session.outcome = 'partial_success'
-    else:
-        session.outcome = 'failure'
+    session.outcome = TrainingSession.outcome_for(session.score)
+
+    # Read before commit - afterwards the expired row would cost a reload
+    completed_labels = dict(scenario_id=session.scenario_id, outcome=session.outcome)
 
     try:
+        CohortRollup.record_completion(session)
+        LeaderboardEntry.record(session.user_id, session.scenario_id, session.score, session.completed_at)
+        record_completion(session)
         db.session.commit()
+        SESSIONS_COMPLETED.inc(**completed_labels)
         return jsonify({
             'success': True,
             'redirect': url_for('scenarios.results', session_id=session_id)
@@ -183,4 +325,26 @@ def results(session_id):
     
     return render_template('scenarios/results.html',
                          session=session,
-                         scenario=session.scenario)
+                         scenario=session.scenario,
+                         version=session.version)
+
+@scenario_bp.route('/leaderboard')
+@scenario_bp.route('/<int:scenario_id>/leaderboard')
+@login_required
+def leaderboard(scenario_id=LeaderboardEntry.OVERALL):
+    """Top scores and the viewer's own rank - overall or for one scenario"""
+    scenario = None
+    if scenario_id != LeaderboardEntry.OVERALL:
+        scenario = Scenario.query.get_or_404(scenario_id)
+    
+    period_name = request.args.get('period', 'all')
+    if period_name not in LeaderboardEntry.PERIODS:
+        period_name = 'all'
+    period = LeaderboardEntry.period_keys(datetime.utcnow())[period_name]
+    
+    return render_template('scenarios/leaderboard.html',
+                         scenario=scenario,
+                         period_name=period_name,
+                         entries=LeaderboardEntry.top(scenario_id, period, limit=current_app.config['LEADERBOARD_SIZE']),
+                         my_rank=LeaderboardEntry.rank_of(current_user.id, scenario_id, period),
+                         board_size=LeaderboardEntry.board_size(scenario_id, period))
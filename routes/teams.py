@@ -0,0 +1,113 @@
+"""Team exercise routes - Start, Join, Play a scenario together"""
+
+from flask import render_template, redirect, url_for, flash, jsonify, request, current_app
+from flask_login import login_required, current_user
+from models import db, Scenario
+import teams
+from teams import TeamError
+from . import team_bp
+
+def _error(e, exercise_id=None):
+    """JSON for a refused action - a 409 also carries the current state, so the page catches up"""
+    body = {'error': str(e)}
+    if e.status == 409 and exercise_id is not None:
+        body['state'] = teams.current_state(exercise_id, current_user.id)
+    return jsonify(body), e.status
+
+@team_bp.route('/start/<int:scenario_id>', methods=['POST'])
+@login_required
+def start(scenario_id):
+    """Start a team exercise - teammates join with its code"""
+    scenario = Scenario.query.get_or_404(scenario_id)
+    try:
+        exercise_id = teams.create(scenario, current_user.id)
+    except Exception as e:
+        db.session.rollback()
+        flash('Failed to start team exercise', 'error')
+        print(f"Error starting team exercise: {e}")
+        return redirect(url_for('scenarios.detail', scenario_id=scenario_id))
+    return redirect(url_for('teams.play', exercise_id=exercise_id))
+
+@team_bp.route('/join', methods=['POST'])
+@login_required
+def join():
+    """Join a team exercise by its code"""
+    try:
+        exercise_id = teams.join(request.form.get('code'), current_user.id)
+    except TeamError as e:
+        db.session.rollback()
+        flash(str(e), 'warning')
+        return redirect(request.referrer or url_for('scenarios.list'))
+    return redirect(url_for('teams.play', exercise_id=exercise_id))
+
+@team_bp.route('/<int:exercise_id>')
+@login_required
+def play(exercise_id):
+    """Play a team exercise"""
+    try:
+        exercise, members = teams.load(exercise_id, current_user.id)
+    except TeamError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('scenarios.list'))
+
+    state = teams.state(exercise, members, current_user.id, [])
+    if state['results_url']:
+        return redirect(state['results_url'])
+
+    return render_template('scenarios/team.html',
+                         exercise=exercise,
+                         scenario=exercise.scenario,
+                         version=exercise.version_row,
+                         state=state,
+                         poll_seconds=current_app.config['TEAM_POLL_SECONDS'])
+
+@team_bp.route('/<int:exercise_id>/state.json')
+@login_required
+def state_json(exercise_id):
+    """Team state for polling - 304 while the version (the ETag) is unchanged
+
+    ?since=<version> limits the decision log to the decisions made after it.
+    """
+    version = teams.version_for(exercise_id, current_user.id)
+    if version is None:
+        return jsonify({'error': 'You are not in this team'}), 404
+    etag = f'team-{exercise_id}-{version}'
+    if request.if_none_match.contains_weak(etag):  # Compressed responses carry it weakened
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(teams.current_state(exercise_id, current_user.id,
+                                               since=request.args.get('since', 0, type=int)))
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@team_bp.route('/<int:exercise_id>/roles', methods=['POST'])
+@login_required
+def claim_roles(exercise_id):
+    """Set the roles the current user owns"""
+    data = request.get_json(silent=True) or {}
+    roles = data.get('roles')
+    if not isinstance(roles, list) or not all(isinstance(role, str) for role in roles):
+        return jsonify({'error': 'No roles provided'}), 400
+    try:
+        teams.claim_roles(exercise_id, current_user.id, roles)
+    except TeamError as e:
+        db.session.rollback()
+        return _error(e, exercise_id)
+    since = data.get('since')
+    return jsonify(teams.current_state(exercise_id, current_user.id, since=since if isinstance(since, int) else 0))
+
+@team_bp.route('/<int:exercise_id>/decide', methods=['POST'])
+@login_required
+def decide(exercise_id):
+    """Apply a decision to the shared state (409 with the current state if a teammate got there first)"""
+    data = request.get_json(silent=True) or {}
+    stage, option, version = data.get('stage'), data.get('option'), data.get('version')
+    if not all(isinstance(value, int) for value in (stage, option)) or not isinstance(version, (int, type(None))):
+        return jsonify({'error': 'stage and option must be numbers'}), 400
+    try:
+        return jsonify(teams.decide(exercise_id, current_user.id, stage, option, version))
+    except TeamError as e:
+        db.session.rollback()
+        return _error(e, exercise_id)
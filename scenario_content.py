@@ -0,0 +1,167 @@
+"""
+Helpers for the scenario_content JSON
+{"intro": "...", "stages": [{"stage", "content", "question", "options": [{"text", "points", "next"}]}]}
+
+Published versions are addressed by version_hash(): the same content and
+max points always give the same hash, whatever the JSON formatting.
+"""
+
+import hashlib
+import json
+import math
+import re
+
+CATEGORIES = ('detection', 'containment', 'eradication', 'recovery', 'communication')
+
+
+def parse(content):
+    """Scenario content as a dict; empty structure if it isn't valid JSON"""
+    if isinstance(content, dict):
+        return content
+    try:
+        data = json.loads(content or '{}')
+        if isinstance(data, str):
+            data = json.loads(data)  # Older scenarios stored the JSON double-encoded
+    except (TypeError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def searchable_text(content):
+    """Intro, stage narratives, questions and option texts as one string for the search index"""
+    data = parse(content)
+    parts = [data.get('intro')]
+    for stage in data.get('stages') or []:
+        if not isinstance(stage, dict):
+            continue
+        parts += [stage.get('content'), stage.get('question')]
+        parts += [option.get('text') for option in stage.get('options') or [] if isinstance(option, dict)]
+    return '\n'.join(part for part in parts if isinstance(part, str) and part)
+
+
+def best_path_points(content):
+    """Sum of each stage's highest option points (the auto max points rule), or 100 if that's 0"""
+    total = 0
+    for stage in parse(content).get('stages') or []:
+        if isinstance(stage, dict) and stage.get('options'):
+            total += max(0, *(int(option.get('points', 0)) for option in stage['options']))
+    return total if total > 0 else 100
+
+
+LEADING_INT = re.compile(r'\s*([+-]?\d+)')
+
+
+def js_int(value):
+    """JavaScript parseInt(value) || 0, as play.html reads option points and stage indexes"""
+    if isinstance(value, bool):
+        return 0
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value) if math.isfinite(value) else 0
+    match = LEADING_INT.match(value) if isinstance(value, str) else None
+    return int(match.group(1)) if match else 0
+
+
+def option_gains(option):
+    """Points an option adds to each category, in CATEGORIES order
+
+    As play.html awards them: a positive option's points go to categories in
+    proportion to its "metrics" weights, or evenly without any. Other options
+    add nothing.
+    """
+    points = js_int(option.get('points'))
+    if points <= 0:
+        return [0.0] * len(CATEGORIES)
+    weights = option.get('metrics') if isinstance(option.get('metrics'), dict) else {}
+    weights = {name: weight for name, weight in weights.items()
+               if isinstance(weight, (int, float)) and not isinstance(weight, bool)}
+    total = sum(weights.values())
+    if total <= 0:
+        return [points / len(CATEGORIES)] * len(CATEGORIES)
+    return [points * weights.get(category, 0) / total for category in CATEGORIES]
+
+
+def category_points(content):
+    """Best-path points per category (each stage's highest-scoring option), in CATEGORIES order"""
+    totals = [0.0] * len(CATEGORIES)
+    for stage in parse(content).get('stages') or []:
+        options = [option for option in (stage.get('options') if isinstance(stage, dict) else None) or []
+                   if isinstance(option, dict)]
+        best = max(options, key=lambda option: js_int(option.get('points')), default=None)
+        if best is not None:
+            totals = [total + gain for total, gain in zip(totals, option_gains(best))]
+    return totals
+
+
+def stage_roles(content):
+    """Team role (a category) that owns each stage in a team exercise
+
+    Its "role"; else its "stage" name if that is a category; else the
+    category its options score most in. None where no category leads.
+    """
+    stages = parse(content).get('stages')
+    roles = []
+    for stage in stages if isinstance(stages, list) else []:
+        stage = stage if isinstance(stage, dict) else {}
+        named = [stage.get(key) for key in ('role', 'stage') if stage.get(key) in CATEGORIES]
+        if named:
+            roles.append(named[0])
+            continue
+        options = stage.get('options') if isinstance(stage.get('options'), list) else []
+        totals = [sum(gains) for gains in zip(*(option_gains(option) for option in options
+                                                if isinstance(option, dict)))] or [0.0]
+        best = max(totals)
+        roles.append(CATEGORIES[totals.index(best)] if best > 0 and totals.count(best) == 1 else None)
+    return roles
+
+
+def version_hash(content, max_points):
+    """sha256 of a playable version - canonical content JSON (text or parsed) plus its max points"""
+    try:
+        data = content if isinstance(content, (dict, list)) else json.loads(content)
+        canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    except (TypeError, ValueError):
+        canonical = content or ''
+    return hashlib.sha256(f'{int(max_points)}\n{canonical}'.encode('utf-8')).hexdigest()
+
+
+def validate(content, max_errors=10):
+    """Problems that would stop the content from playing, as messages (empty if it's playable)"""
+    data = parse(content)
+    stages = data.get('stages')
+    if not isinstance(stages, list) or not stages:
+        return ['"stages" must be a non-empty list']
+
+    names = {stage.get('stage') for stage in stages
+             if isinstance(stage, dict) and isinstance(stage.get('stage'), str)}
+    errors = []
+    for index, stage in enumerate(stages):
+        where = f'stage {index}'
+        if not isinstance(stage, dict):
+            errors.append(f'{where} must be an object')
+            continue
+        if 'role' in stage and stage['role'] not in CATEGORIES:
+            errors.append(f'{where}: "role" must be one of {", ".join(CATEGORIES)}')
+        options = stage.get('options')
+        if not isinstance(options, list) or not options:
+            errors.append(f'{where}: "options" must be a non-empty list')
+            continue
+        for number, option in enumerate(options):
+            where = f'stage {index} option {number}'
+            if not isinstance(option, dict) or not isinstance(option.get('text'), str):
+                errors.append(f'{where} needs a "text" string')
+                continue
+            try:
+                int(option.get('points', 0))
+            except (TypeError, ValueError):
+                errors.append(f'{where}: "points" must be a whole number')
+            target = option.get('next')
+            if target is None or (isinstance(target, str) and (target in ('', 'END') or target in names)):
+                continue
+            if isinstance(target, (int, str)) and str(target).isdigit() and int(target) < len(stages):
+                continue
+            errors.append(f'{where}: "next" {target!r} is not a stage index, stage name or "END"')
+        if len(errors) >= max_errors:
+            break
+    return errors[:max_errors]
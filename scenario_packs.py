@@ -0,0 +1,390 @@
+"""
+Scenario packs
+Many scenarios in one file, for moving a scenario library between
+environments. Two layouts, both read and written one scenario at a time:
+
+- JSONL, optionally gzipped: a header line, then one scenario per line
+    {"format": "dont-panic-scenario-pack", "version": 1, "exported_at": "...", "scenarios": 500}
+    {"title": "...", "description": "...", "incident_type": "phishing", "difficulty_level": 3,
+     "estimated_time": 30, "max_points": 120, "is_active": true, "content": {"intro": ..., "stages": [...]}}
+- zip: pack.json (the header) plus one scenario object per scenarios/*.json
+  member. A member without a "content" key is read as bare content like
+  example_scenario.json, titled after its file name.
+
+Imports hand chunks of raw entries to a process pool for parsing and
+validation (a bounded number of chunks in flight, so memory stays flat)
+and write the valid ones with Core executemany batches, all in one
+transaction. A pack with any invalid entry imports nothing unless
+skip_invalid is set. Existing scenarios are matched by title: identical
+content is left alone, changed content is published as a new version only
+with update=True.
+"""
+
+import gzip
+import io
+import itertools
+import json
+import os
+import re
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from models import db, Scenario, ScenarioVersion, ScenarioPublication
+from scenario_content import parse, validate, best_path_points, version_hash
+from search import index_scenarios
+
+PACK_FORMAT = 'dont-panic-scenario-pack'
+PACK_VERSION = 1
+HEADER_MEMBER = 'pack.json'
+MAX_ENTRY_BYTES = 1024 * 1024  # One scenario; larger entries are rejected unread
+MAX_REPORTED_ERRORS = 50
+
+# Defaults match admin.create_scenario
+DEFAULTS = {'incident_type': 'ransomware', 'difficulty_level': 3, 'estimated_time': 30, 'is_active': True}
+
+
+class PackError(ValueError):
+    """The file isn't a scenario pack this version can read"""
+
+
+# ========================
+# Reading
+# ========================
+def _check_header(header):
+    if header.get('format') != PACK_FORMAT:
+        raise PackError(f'not a scenario pack (format should be "{PACK_FORMAT}")')
+    if not isinstance(header.get('version'), int) or header['version'] > PACK_VERSION:
+        raise PackError(f'unsupported pack version {header.get("version")!r}')
+    return header
+
+
+def _jsonl_entries(lines, first_line=1):
+    for number, line in enumerate(lines, start=first_line):
+        if len(line) > MAX_ENTRY_BYTES:
+            yield number, f'line {number}', None
+        elif line.strip():
+            yield number, f'line {number}', line
+
+
+def _read_jsonl(fileobj):
+    lines = io.TextIOWrapper(fileobj, encoding='utf-8')
+    first = lines.readline(MAX_ENTRY_BYTES)
+    try:
+        header = json.loads(first)
+    except ValueError:
+        raise PackError('the first line must be the pack header')
+    if not isinstance(header, dict):
+        raise PackError('the first line must be the pack header')
+    return _check_header(header), _jsonl_entries(lines, first_line=2)
+
+
+def _zip_entries(archive, members):
+    for number, info in enumerate(members, start=1):
+        if info.file_size > MAX_ENTRY_BYTES:
+            yield number, info.filename, None
+        else:
+            yield number, info.filename, archive.read(info).decode('utf-8', errors='replace')
+
+
+def _read_zip(fileobj):
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile as e:
+        raise PackError(f'unreadable zip: {e}')
+    try:
+        header = json.loads(archive.read(HEADER_MEMBER))
+    except KeyError:
+        raise PackError(f'{HEADER_MEMBER} is missing')
+    except ValueError:
+        raise PackError(f'{HEADER_MEMBER} is not valid JSON')
+    members = sorted((info for info in archive.infolist()
+                      if info.filename.endswith('.json') and info.filename != HEADER_MEMBER
+                      and not info.is_dir()), key=lambda info: info.filename)
+    return _check_header(header), _zip_entries(archive, members)
+
+
+def read_pack(fileobj):
+    """(header, entries) for a binary file; entries yields (position, source, raw text) lazily"""
+    magic = fileobj.read(4)
+    fileobj.seek(0)
+    if magic.startswith(b'PK'):
+        return _read_zip(fileobj)
+    if magic.startswith(b'\x1f\x8b'):
+        return _read_jsonl(gzip.GzipFile(fileobj=fileobj))
+    return _read_jsonl(fileobj)
+
+
+# ========================
+# Validation (runs in the worker pool)
+# ========================
+def _title_from(source):
+    name = os.path.splitext(os.path.basename(source))[0]
+    return re.sub(r'^\d+-', '', name).replace('-', ' ').replace('_', ' ').strip().title()
+
+
+def _whole_number(entry, field, low, high, errors):
+    value = entry.get(field)
+    if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+        errors.append(f'"{field}" must be a whole number from {low} to {high}')
+    return value
+
+
+def validate_entry(item):
+    """(position, source, row or None, errors) for one raw pack entry"""
+    position, source, text = item
+    if text is None:
+        return position, source, None, [f'larger than {MAX_ENTRY_BYTES // 1024} KB']
+    try:
+        entry = json.loads(text)
+    except ValueError as e:
+        return position, source, None, [f'invalid JSON: {e}']
+    if not isinstance(entry, dict):
+        return position, source, None, ['must be a JSON object']
+    if 'content' not in entry and 'stages' in entry:
+        # Bare content file (example_scenario.json)
+        entry = {'title': entry.get('title') or _title_from(source), 'content': entry}
+    entry = {**DEFAULTS, **entry}
+
+    errors = []
+    title = entry.get('title')
+    if not isinstance(title, str) or not title.strip() or len(title) > 200:
+        errors.append('"title" must be 1-200 characters')
+    incident_type = entry.get('incident_type')
+    if not isinstance(incident_type, str) or not incident_type or len(incident_type) > 50:
+        errors.append('"incident_type" must be 1-50 characters')
+    _whole_number(entry, 'difficulty_level', 1, 5, errors)
+    _whole_number(entry, 'estimated_time', 1, 24 * 60, errors)
+    if not isinstance(entry.get('is_active'), bool):
+        errors.append('"is_active" must be true or false')
+
+    content = parse(entry.get('content'))
+    errors += validate(content)
+    if 'max_points' in entry:
+        _whole_number(entry, 'max_points', 1, 100000, errors)
+    if errors:
+        return position, source, None, errors
+
+    description = entry.get('description')
+    if not isinstance(description, str) or not description.strip():
+        intro = content.get('intro')
+        description = intro[:500] if isinstance(intro, str) and intro.strip() else title
+    max_points = entry.get('max_points') or best_path_points(content)
+    scenario_content = json.dumps(content)
+    return position, source, {
+        'title': title.strip(),
+        'description': description,
+        'incident_type': incident_type,
+        'difficulty_level': entry['difficulty_level'],
+        'estimated_time': entry['estimated_time'],
+        'max_points': max_points,
+        'is_active': entry['is_active'],
+        'scenario_content': scenario_content,
+        'version_hash': version_hash(content, max_points),  # Same hash as the text, without re-parsing it
+    }, []
+
+
+def _validate_chunk(chunk):
+    return [validate_entry(item) for item in chunk]
+
+
+def _chunks(entries, size):
+    entries = iter(entries)
+    while True:
+        chunk = list(itertools.islice(entries, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def validated(entries, workers=0, chunk_size=100):
+    """validate_entry results in pack order
+
+    Chunks go to a process pool, at most two per worker in flight. A pack
+    that fits in one chunk is validated here - starting workers would cost
+    more than it saves.
+    """
+    chunks = _chunks(entries, chunk_size)
+    first = next(chunks, [])
+    second = next(chunks, None)
+    if second is None or workers < 2:
+        for chunk in itertools.chain([first], [second] if second else [], chunks):
+            yield from _validate_chunk(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        for chunk in itertools.chain([first, second], chunks):
+            in_flight.append(pool.submit(_validate_chunk, chunk))
+            if len(in_flight) >= workers * 2:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+# ========================
+# Import
+# ========================
+def _write_batch(creates, updates, imported_by, now):
+    """Core executemany writes for one batch of validated rows (inside the caller's transaction)"""
+    hashes = {row['version_hash'] for row in creates} | {row['version_hash'] for _, row in updates}
+    known = {key for (key,) in db.session.query(ScenarioVersion.hash).filter(ScenarioVersion.hash.in_(hashes))}
+    new_versions = {}
+    for row in creates + [row for _, row in updates]:
+        if row['version_hash'] not in known:
+            new_versions.setdefault(row['version_hash'], {
+                'hash': row['version_hash'], 'scenario_content': row['scenario_content'],
+                'max_points': row['max_points'], 'created_at': now})
+    if new_versions:
+        db.session.execute(ScenarioVersion.__table__.insert(), list(new_versions.values()))
+
+    scenarios = Scenario.__table__
+    ids = []
+    if creates:
+        ids = db.session.execute(
+            scenarios.insert().returning(scenarios.c.id, sort_by_parameter_order=True),
+            [{**row, 'created_by': imported_by, 'created_at': now, 'updated_at': now,
+              'times_played': 0, 'average_score': 0.0} for row in creates]).scalars().all()
+    if updates:
+        db.session.execute(
+            scenarios.update().where(scenarios.c.id == db.bindparam('scenario_id')),
+            [{**row, 'scenario_id': scenario_id, 'updated_at': now} for scenario_id, row in updates])
+
+    changed = list(zip(ids, creates)) + updates
+    db.session.execute(ScenarioPublication.__table__.insert(), [
+        {'scenario_id': scenario_id, 'version_hash': row['version_hash'],
+         'published_by': imported_by, 'published_at': now} for scenario_id, row in changed])
+    index_scenarios((scenario_id, row['title'], row['description'], row['scenario_content'])
+                    for scenario_id, row in changed)
+
+
+def import_pack(fileobj, imported_by, update=False, skip_invalid=False, dry_run=False,
+                workers=0, chunk_size=100, batch_size=500):
+    """Validate a pack and write it in one transaction; returns a summary dict
+
+    Raises PackError if the file isn't a readable pack.
+    """
+    started = time.perf_counter()
+    header, entries = read_pack(fileobj)
+    summary = {'pack': {key: header.get(key) for key in ('name', 'exported_at', 'scenarios')},
+               'entries': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0, 'invalid': 0,
+               'errors': [], 'imported': False, 'dry_run': dry_run}
+
+    # Title -> (id, current version) for matching; the lowest id wins if titles repeat
+    existing = {}
+    for scenario_id, title, current in db.session.query(Scenario.id, Scenario.title, Scenario.version_hash) \
+            .order_by(Scenario.id.desc()):
+        existing[title] = (scenario_id, current)
+
+    seen = set()
+    creates, updates = [], []
+    now = datetime.utcnow()
+    writing = not dry_run
+    try:
+        for position, source, row, errors in validated(entries, workers, chunk_size):
+            summary['entries'] += 1
+            if row is not None and row['title'] in seen:
+                errors, row = ['duplicate title in this pack'], None
+            if row is None:
+                summary['invalid'] += 1
+                if len(summary['errors']) < MAX_REPORTED_ERRORS:
+                    summary['errors'].append({'position': position, 'source': source, 'errors': errors})
+                writing = writing and skip_invalid  # Keep validating to report every problem
+                continue
+            seen.add(row['title'])
+
+            match = existing.get(row['title'])
+            if match is None:
+                creates.append(row)
+                summary['created'] += 1
+            elif match[1] == row['version_hash']:
+                summary['unchanged'] += 1
+            elif update:
+                updates.append((match[0], row))
+                summary['updated'] += 1
+            else:
+                summary['skipped'] += 1
+
+            if len(creates) + len(updates) >= batch_size:
+                if writing:
+                    _write_batch(creates, updates, imported_by, now)
+                creates, updates = [], []
+
+        if writing and (creates or updates):
+            _write_batch(creates, updates, imported_by, now)
+        if writing:
+            db.session.commit()
+            summary['imported'] = True
+        else:
+            db.session.rollback()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+# ========================
+# Export
+# ========================
+class _Drain(io.RawIOBase):
+    """Write-only, unseekable sink for ZipFile; drain() hands back what was written since last time"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _entry(row):
+    """Pack entry for one (id, title, ...) scenario row"""
+    return {'title': row.title, 'description': row.description, 'incident_type': row.incident_type,
+            'difficulty_level': row.difficulty_level, 'estimated_time': row.estimated_time,
+            'max_points': row.max_points, 'is_active': row.is_active,
+            'version_hash': row.version_hash, 'content': parse(row.scenario_content)}
+
+
+def _slug(title):
+    return re.sub(r'[^a-z0-9]+', '-', (title or '').lower()).strip('-')[:60] or 'scenario'
+
+
+def export_pack(scenario_ids=None, fmt='jsonl', name=None, batch_size=200):
+    """Generator of pack bytes (fmt 'jsonl' or 'zip'), reading scenarios batch_size at a time"""
+    table = Scenario.__table__
+    criteria = [table.c.id.in_(scenario_ids)] if scenario_ids is not None else []
+    count = db.session.execute(db.select(db.func.count()).select_from(table).where(*criteria)).scalar()
+    header = {'format': PACK_FORMAT, 'version': PACK_VERSION, 'name': name,
+              'exported_at': datetime.utcnow().isoformat(timespec='seconds'), 'scenarios': count}
+    rows = db.session.execute(
+        db.select(table.c.id, table.c.title, table.c.description, table.c.incident_type,
+                  table.c.difficulty_level, table.c.estimated_time, table.c.max_points,
+                  table.c.is_active, table.c.version_hash, table.c.scenario_content)
+        .where(*criteria).order_by(table.c.id).execution_options(yield_per=batch_size))
+
+    if fmt == 'zip':
+        sink = _Drain()
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(HEADER_MEMBER, json.dumps(header, indent=2))
+            for row in rows:
+                archive.writestr(f'scenarios/{row.id:06d}-{_slug(row.title)}.json',
+                                 json.dumps(_entry(row), indent=2))
+                yield sink.drain()
+        yield sink.drain()
+        return
+
+    yield (json.dumps(header) + '\n').encode('utf-8')
+    for batch in rows.partitions():
+        yield ''.join(json.dumps(_entry(row)) + '\n' for row in batch).encode('utf-8')
@@ -0,0 +1,247 @@
+"""
+Background maintenance scheduler
+A daemon thread in every worker ticks every SCHEDULER_TICK_SECONDS. Only
+the worker holding the 'maintenance' lease row runs jobs. The lease is
+taken or renewed with a single conditional UPDATE, so across gunicorn
+workers (or hosts sharing the database) exactly one process leads, and
+another takes over within SCHEDULER_LEASE_SECONDS if the leader dies.
+
+Job run times live in the scheduled_jobs table, so a new leader doesn't
+re-run everything straight away. Each run covers the control database and
+then every active organisation's (see tenancy.py). Jobs can also be run once from the
+command line: python scripts/run_maintenance.py --job reap_abandoned
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import request
+from sqlalchemy.exc import IntegrityError
+
+from models import (db, Scenario, ScenarioVersion, TrainingSession, LeaderboardEntry,
+                    SchedulerLock, ScheduledJob, RateLimitBucket, TeamExercise)
+from archive import archive_sessions
+from tenancy import for_each_tenant, tenant_dir
+
+LOCK_NAME = 'maintenance'
+
+
+# ========================
+# Jobs
+# ========================
+def reap_abandoned(app):
+    """Mark in-progress sessions older than SESSION_ABANDON_AFTER_HOURS as abandoned, in batches"""
+    cutoff = datetime.utcnow() - timedelta(hours=app.config['SESSION_ABANDON_AFTER_HOURS'])
+    batch_size = app.config['REAPER_BATCH_SIZE']
+    reaped = 0
+
+    while True:
+        ids = [row.id for row in db.session.query(TrainingSession.id).filter(
+            TrainingSession.status == 'in_progress', TrainingSession.started_at < cutoff
+        ).order_by(TrainingSession.id).limit(batch_size)]
+        if not ids:
+            break
+        # Re-check the status so a session completed in between isn't overwritten
+        reaped += db.session.query(TrainingSession).filter(
+            TrainingSession.id.in_(ids), TrainingSession.status == 'in_progress'
+        ).update({'status': 'abandoned'}, synchronize_session=False)
+        db.session.commit()
+
+    # Team exercises nobody has acted in for as long - the version bump tells pages still open
+    teams = TeamExercise.query.filter(
+        TeamExercise.status == 'in_progress', TeamExercise.updated_at < cutoff
+    ).update({'status': 'abandoned', 'version': TeamExercise.version + 1}, synchronize_session=False)
+    db.session.commit()
+
+    return {'reaped': reaped, 'team_exercises': teams}
+
+
+def refresh_scenario_stats(app):
+    """Recompute the denormalised times_played / average_score columns"""
+    Scenario.refresh_statistics()
+    db.session.commit()
+    return {'scenarios': Scenario.query.count()}
+
+
+def archive_old_sessions(app):
+    """Archive sessions past ARCHIVE_RETENTION_DAYS (bounded work per run)"""
+    stats = archive_sessions(tenant_dir(app.config['ARCHIVE_DIR']), app.config['ARCHIVE_RETENTION_DAYS'],
+                             batch_size=app.config['ARCHIVE_BATCH_SIZE'],
+                             max_batches=app.config['ARCHIVE_MAX_BATCHES_PER_RUN'])
+    return {'archived': stats['archived'], 'months': sorted(stats['months'])}
+
+
+def prune_leaderboards(app):
+    """Drop weekly/monthly boards outside the retention window"""
+    pruned = LeaderboardEntry.prune()
+    db.session.commit()
+    return {'pruned': pruned}
+
+
+def prune_scenario_versions(app):
+    """Drop scenario versions left behind by deleted scenarios and their sessions"""
+    pruned = ScenarioVersion.prune()
+    db.session.commit()
+    return {'pruned': pruned}
+
+
+def prune_rate_limits(app):
+    """Drop idle rate limit buckets (database backend only - the others are bounded in size)"""
+    if app.config.get('RATE_LIMIT_BACKEND') != 'database':
+        return {'pruned': 0}
+    pruned = RateLimitBucket.prune(app.config['RATE_LIMIT_IDLE_SECONDS'])
+    db.session.commit()
+    return {'pruned': pruned}
+
+
+JOBS = {
+    'reap_abandoned': reap_abandoned,
+    'refresh_scenario_stats': refresh_scenario_stats,
+    'archive_sessions': archive_old_sessions,
+    'prune_leaderboards': prune_leaderboards,
+    'prune_scenario_versions': prune_scenario_versions,
+    'prune_rate_limits': prune_rate_limits,
+}
+CONTROL_JOBS = {'prune_rate_limits'}  # Only touch the control database; the rest also run per organisation
+
+
+def run_job(app, name):
+    """Run one job now (control database, then each organisation's) and record the outcome in scheduled_jobs"""
+    started = time.perf_counter()
+    try:
+        result = JOBS[name](app)
+        if name not in CONTROL_JOBS:
+            tenants = for_each_tenant(app, JOBS[name])
+            if tenants:
+                result['tenants'] = tenants
+        status = 'ok'
+    except Exception as e:
+        db.session.rollback()
+        result = f'{type(e).__name__}: {e}'
+        status = 'error'
+        app.logger.exception(f"Scheduled job {name} failed")
+
+    job = db.session.get(ScheduledJob, name) or ScheduledJob(name=name, run_count=0)
+    job.last_run_at = datetime.utcnow()
+    job.last_status = status
+    job.last_duration_ms = int((time.perf_counter() - started) * 1000)
+    job.last_result = json.dumps(result, default=str) if status == 'ok' else result
+    job.run_count = (job.run_count or 0) + 1
+    db.session.add(job)
+    db.session.commit()
+    return status, result
+
+
+# ========================
+# Leader election
+# ========================
+def acquire_lease(holder, lease_seconds, now=None):
+    """Take or renew the lease; True if `holder` is the leader afterwards"""
+    now = now or datetime.utcnow()
+    if db.session.get(SchedulerLock, LOCK_NAME) is None:
+        try:
+            db.session.add(SchedulerLock(name=LOCK_NAME, holder=None, expires_at=now))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()  # Another worker created it first
+
+    # Atomic compare-and-set: renew our own lease or take an expired one
+    taken = db.session.query(SchedulerLock).filter(
+        SchedulerLock.name == LOCK_NAME,
+        db.or_(SchedulerLock.holder == holder, SchedulerLock.expires_at <= now)
+    ).update({'holder': holder, 'expires_at': now + timedelta(seconds=lease_seconds)},
+             synchronize_session=False)
+    db.session.commit()
+    return taken == 1
+
+
+def release_lease(holder):
+    """Give the lease up early (clean shutdown)"""
+    db.session.query(SchedulerLock).filter_by(name=LOCK_NAME, holder=holder).update(
+        {'expires_at': datetime.utcnow() - timedelta(seconds=1)}, synchronize_session=False)
+    db.session.commit()
+
+
+def due_jobs(intervals, now=None):
+    """Names of jobs whose interval has passed since their last run"""
+    now = now or datetime.utcnow()
+    last_runs = dict(db.session.query(ScheduledJob.name, ScheduledJob.last_run_at))
+    return [name for name, seconds in intervals.items()
+            if name in JOBS and seconds and
+            (last_runs.get(name) is None or now - last_runs[name] >= timedelta(seconds=seconds))]
+
+
+class Scheduler:
+    """Tick loop run on a daemon thread in each worker process"""
+
+    def __init__(self, app):
+        self.app = app
+        self.holder = f'{socket.gethostname()}:{os.getpid()}'
+        self.tick = app.config['SCHEDULER_TICK_SECONDS']
+        self.lease = app.config['SCHEDULER_LEASE_SECONDS']
+        self.intervals = app.config['SCHEDULER_JOBS']
+        self.is_leader = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        """One tick: (re)acquire the lease and, if leading, run the jobs that are due"""
+        with self.app.app_context():
+            try:
+                self.is_leader = acquire_lease(self.holder, self.lease)
+                if not self.is_leader:
+                    return []
+                ran = []
+                for name in due_jobs(self.intervals):
+                    run_job(self.app, name)
+                    ran.append(name)
+                    # Long jobs mustn't outlive the lease
+                    acquire_lease(self.holder, self.lease)
+                return ran
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception("Scheduler tick failed")
+                return []
+            finally:
+                db.session.remove()
+
+    def _loop(self):
+        while not self._stop.wait(self.tick):
+            self.run_once()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='maintenance-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.is_leader:
+            with self.app.app_context():
+                release_lease(self.holder)
+
+
+def init_scheduler(app):
+    """Start the scheduler thread on the first request of each process (after any fork)"""
+    if not app.config.get('SCHEDULER_ENABLED', False):
+        return
+
+    state = {'pid': None}
+    lock = threading.Lock()
+
+    @app.before_request
+    def ensure_scheduler():
+        # Cheap pid comparison per request; a thread started before a fork would be dead
+        if state['pid'] == os.getpid() or request.endpoint == 'static':
+            return
+        with lock:
+            if state['pid'] != os.getpid():
+                scheduler = Scheduler(app)
+                scheduler.start()
+                app.extensions['scheduler'] = scheduler
+                state['pid'] = os.getpid()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Give an existing database the ON DELETE CASCADE foreign keys from models.py.
+
+Usage:
+  cd <repo-root>
+  python scripts/add_cascade_foreign_keys.py              # development database
+  python scripts/add_cascade_foreign_keys.py --config production
+
+New databases get the cascades from db.create_all(). Older ones were
+created without them, and user/scenario deletes rely on the database
+removing sessions, memberships, rollups, summaries and leaderboard rows.
+
+SQLite can't alter a constraint, so each affected table is rebuilt:
+renamed, re-created from the model, copied and dropped, all in one
+transaction with foreign keys off, then checked with foreign_key_check.
+PostgreSQL constraints are dropped and re-added. Back up the database
+first; it is safe to run more than once.
+"""
+
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import inspect  # noqa: E402
+from sqlalchemy.schema import CreateIndex, CreateTable  # noqa: E402
+
+from app import create_app  # noqa: E402
+from models import db  # noqa: E402
+
+
+def cascading_tables():
+    """Model tables with at least one ON DELETE CASCADE foreign key"""
+    return [table for table in db.metadata.sorted_tables
+            if any(fk.ondelete == 'CASCADE' for fk in table.foreign_keys)]
+
+
+def migrate_sqlite(engine, tables):
+    existing = set(inspect(engine).get_table_names())
+    raw = engine.raw_connection()
+    try:
+        connection = raw.driver_connection
+        connection.isolation_level = None  # Explicit BEGIN/COMMIT below
+        cursor = connection.cursor()
+
+        todo = []
+        for table in tables:
+            if table.name not in existing:
+                continue
+            on_delete = {row[3]: row[6] for row in cursor.execute(f'PRAGMA foreign_key_list("{table.name}")')}
+            wanted = {fk.parent.name for fk in table.foreign_keys if fk.ondelete == 'CASCADE'}
+            if any(on_delete.get(column) != 'CASCADE' for column in wanted):
+                todo.append(table)
+        if not todo:
+            print("✅ Foreign keys already cascade. No action needed.")
+            return
+
+        cursor.execute('PRAGMA foreign_keys=OFF')  # Only takes effect outside a transaction
+        cursor.execute('PRAGMA legacy_alter_table=ON')  # Don't repoint other tables at the _old copy
+        cursor.execute('BEGIN')
+        try:
+            for table in todo:
+                old_name = f'{table.name}_old'
+                columns = ', '.join(f'"{row[1]}"' for row in cursor.execute(f'PRAGMA table_info("{table.name}")')
+                                    if row[1] in table.c)
+                old_indexes = [row[1] for row in cursor.execute(f'PRAGMA index_list("{table.name}")')
+                               if not row[1].startswith('sqlite_autoindex')]
+
+                cursor.execute(f'ALTER TABLE "{table.name}" RENAME TO "{old_name}"')
+                for index in old_indexes:
+                    cursor.execute(f'DROP INDEX IF EXISTS "{index}"')
+                cursor.execute(str(CreateTable(table).compile(engine)))
+                for index in table.indexes:
+                    cursor.execute(str(CreateIndex(index).compile(engine)))
+                cursor.execute(f'INSERT INTO "{table.name}" ({columns}) SELECT {columns} FROM "{old_name}"')
+                cursor.execute(f'DROP TABLE "{old_name}"')
+                print(f"🔧 Rebuilt {table.name}")
+
+            problems = cursor.execute('PRAGMA foreign_key_check').fetchall()
+            if problems:
+                raise RuntimeError(f'{len(problems)} rows reference missing parents, e.g. {problems[:5]}')
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+        finally:
+            cursor.execute('PRAGMA legacy_alter_table=OFF')
+            cursor.execute('PRAGMA foreign_keys=ON')
+    finally:
+        raw.close()
+    print(f"✅ {len(todo)} table(s) now cascade deletes.")
+
+
+def migrate_postgresql(engine, tables):
+    inspector = inspect(engine)
+    changed = 0
+    with engine.begin() as connection:
+        for table in tables:
+            if not inspector.has_table(table.name):
+                continue
+            for fk in inspector.get_foreign_keys(table.name):
+                model_fk = next((c for c in table.foreign_key_constraints
+                                 if [col.name for col in c.columns] == fk['constrained_columns']), None)
+                if model_fk is None or model_fk.ondelete != 'CASCADE':
+                    continue
+                if (fk.get('options') or {}).get('ondelete', '').upper() == 'CASCADE':
+                    continue
+                columns = ', '.join(fk['constrained_columns'])
+                referred = ', '.join(fk['referred_columns'])
+                connection.exec_driver_sql(f'ALTER TABLE {table.name} DROP CONSTRAINT {fk["name"]}')
+                connection.exec_driver_sql(
+                    f'ALTER TABLE {table.name} ADD CONSTRAINT {fk["name"]} FOREIGN KEY ({columns}) '
+                    f'REFERENCES {fk["referred_table"]} ({referred}) ON DELETE CASCADE')
+                changed += 1
+                print(f"🔧 {table.name}.{columns} now cascades")
+    print(f"✅ {changed} foreign key(s) updated." if changed else "✅ Foreign keys already cascade. No action needed.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Add ON DELETE CASCADE to existing foreign keys')
+    parser.add_argument('--config', default='development', help='app config name (default: development)')
+    args = parser.parse_args()
+
+    app = create_app(args.config)
+    with app.app_context():
+        engine = db.engine
+        db.session.remove()
+        if engine.dialect.name == 'sqlite':
+            migrate_sqlite(engine, cascading_tables())
+        elif engine.dialect.name == 'postgresql':
+            migrate_postgresql(engine, cascading_tables())
+        else:
+            print(f"ERROR: no migration for {engine.dialect.name}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
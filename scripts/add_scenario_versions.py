@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Add scenario versioning to an existing database.
+
+Usage:
+  cd <repo-root>
+  python scripts/add_scenario_versions.py              # development database
+  python scripts/add_scenario_versions.py --config production
+
+New databases get everything from db.create_all(). Older ones have the
+scenario_versions and scenario_publications tables created when the app
+starts, but not the version_hash columns on scenarios and
+training_sessions. This script:
+- adds both columns (and the session index) if they are missing
+- publishes every scenario's current content as its first version
+- pins in-progress sessions to that version, since that is the content
+  they have been playing. Finished sessions stay unpinned (NULL): which
+  content they were played on wasn't recorded.
+
+It is safe to run more than once.
+"""
+
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import inspect  # noqa: E402
+from sqlalchemy.schema import CreateIndex  # noqa: E402
+
+from app import create_app  # noqa: E402
+from models import db, Scenario, ScenarioVersion, ScenarioPublication, TrainingSession  # noqa: E402
+
+
+def add_columns(engine):
+    """ALTER TABLE ... ADD COLUMN version_hash where it's missing; returns the tables changed"""
+    inspector = inspect(engine)
+    changed = []
+    with engine.begin() as connection:
+        for model in (Scenario, TrainingSession):
+            table = model.__table__
+            if 'version_hash' in {column['name'] for column in inspector.get_columns(table.name)}:
+                continue
+            connection.exec_driver_sql(
+                f'ALTER TABLE {table.name} ADD COLUMN version_hash VARCHAR(64) REFERENCES scenario_versions (hash)')
+            for index in table.indexes:
+                if [column.name for column in index.columns] == ['version_hash']:
+                    connection.execute(CreateIndex(index))
+            changed.append(table.name)
+            print(f"🔧 Added {table.name}.version_hash")
+    return changed
+
+
+def publish_unversioned():
+    """First version and publication for every scenario without one; returns the count"""
+    table = Scenario.__table__
+    rows = db.session.execute(db.select(
+        table.c.id, table.c.scenario_content, table.c.max_points, table.c.created_by,
+        db.func.coalesce(table.c.updated_at, table.c.created_at),
+    ).where(table.c.version_hash.is_(None)).order_by(table.c.id)).all()
+
+    for scenario_id, content, max_points, created_by, published_at in rows:
+        version = ScenarioVersion.store(content, max_points or 100)
+        db.session.add(ScenarioPublication(scenario_id=scenario_id, version=version,
+                                           published_by=created_by, published_at=published_at))
+        db.session.flush()
+        # Core UPDATE, keeping updated_at - the content itself didn't change
+        db.session.execute(table.update().where(table.c.id == scenario_id)
+                           .values(version_hash=version.hash, updated_at=table.c.updated_at))
+    db.session.commit()
+    return len(rows)
+
+
+def pin_in_progress():
+    """Pin unpinned in-progress sessions to their scenario's current version; returns the count"""
+    sessions = TrainingSession.__table__
+    current = (db.select(Scenario.version_hash)
+               .where(Scenario.id == sessions.c.scenario_id).scalar_subquery())
+    pinned = db.session.execute(sessions.update().where(
+        sessions.c.status == 'in_progress', sessions.c.version_hash.is_(None),
+    ).values(version_hash=current)).rowcount
+    db.session.commit()
+    return pinned
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Add scenario versions to an existing database')
+    parser.add_argument('--config', default='development', help='app config name (default: development)')
+    args = parser.parse_args()
+
+    app = create_app(args.config)
+    with app.app_context():
+        db.session.remove()
+        add_columns(db.engine)
+        published = publish_unversioned()
+        pinned = pin_in_progress()
+        if published or pinned:
+            print(f"✅ {published} scenario(s) published, {pinned} in-progress session(s) pinned.")
+        else:
+            print("✅ Every scenario already has a version. No action needed.")
+
+
+if __name__ == '__main__':
+    main()
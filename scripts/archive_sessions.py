@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Move old training sessions out of the hot table into compressed archives.
+
+Usage:
+  cd <repo-root>
+  python scripts/archive_sessions.py --dry-run           # how many would move
+  python scripts/archive_sessions.py                     # ARCHIVE_RETENTION_DAYS from config
+  python scripts/archive_sessions.py --days 180 --batch-size 10000
+
+Completed and abandoned sessions that ended before the cutoff are written
+to ARCHIVE_DIR/sessions-YYYY-MM.jsonl.gz. Their totals are added to
+session_summaries and the rows are deleted, one transaction per batch.
+In-progress sessions are never archived. Safe to re-run or interrupt.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import create_app  # noqa: E402
+from models import db, TrainingSession  # noqa: E402
+from archive import archive_sessions  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive old training sessions')
+    parser.add_argument('--config', default='development', help='app config name (default: development)')
+    parser.add_argument('--days', type=int, help='retention window in days (default: ARCHIVE_RETENTION_DAYS)')
+    parser.add_argument('--batch-size', type=int, help='sessions per transaction (default: ARCHIVE_BATCH_SIZE)')
+    parser.add_argument('--dry-run', action='store_true', help='only count what would be archived')
+    args = parser.parse_args()
+
+    app = create_app(args.config)
+    with app.app_context():
+        days = args.days if args.days is not None else app.config['ARCHIVE_RETENTION_DAYS']
+        batch_size = args.batch_size or app.config['ARCHIVE_BATCH_SIZE']
+
+        started = time.perf_counter()
+        stats = archive_sessions(app.config['ARCHIVE_DIR'], days, batch_size=batch_size, dry_run=args.dry_run)
+
+        print("\n" + "="*50)
+        if args.dry_run:
+            print(f"🔍 {stats['archived']:,} sessions ended before {stats['cutoff']:%Y-%m-%d} and would be archived")
+        else:
+            print(f"📦 Archived {stats['archived']:,} sessions in {stats['batches']} batch(es) "
+                  f"({time.perf_counter() - started:.1f}s)")
+            if stats['months']:
+                print(f"   Months: {', '.join(sorted(stats['months']))}")
+            print(f"   Archive: {app.config['ARCHIVE_DIR']}")
+        print(f"   Sessions still in training_sessions: {db.session.query(db.func.count(TrainingSession.id)).scalar():,}")
+        print("="*50)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Convert scenario_content and session_data to the compressed encoding (compact_json.py).
+
+Usage:
+  cd <repo-root>
+  python scripts/compress_json_columns.py --dry-run        # sizes before and after, nothing written
+  python scripts/compress_json_columns.py                  # development database
+  python scripts/compress_json_columns.py --config production --batch-size 2000 --vacuum
+  python scripts/compress_json_columns.py --all-tenants    # every organisation database too
+
+The app reads both forms, so this runs while it serves traffic. Rows are
+converted in short batches, each its own transaction. A row the app rewrote
+in the meantime is left alone (it is already compressed). SQLite keeps the
+blobs in the existing TEXT columns; --vacuum hands the freed pages back to
+the file system. PostgreSQL needs the columns changed from TEXT to BYTEA,
+which the old code can't read: deploy with --schema-only, then run again
+without it. Safe to re-run or interrupt.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import inspect  # noqa: E402
+
+from app import create_app  # noqa: E402
+from models import db, Scenario, ScenarioVersion, TrainingSession  # noqa: E402
+import compact_json  # noqa: E402
+import tenancy  # noqa: E402
+
+COLUMNS = [
+    (Scenario.__table__, 'scenario_content'),
+    (ScenarioVersion.__table__, 'scenario_content'),
+    (TrainingSession.__table__, 'session_data'),
+]
+
+
+def database_bytes(engine):
+    """Size of the database on disk, or None if it can't be told"""
+    with engine.connect() as connection:
+        if engine.dialect.name == 'sqlite':
+            page_count = connection.exec_driver_sql('PRAGMA page_count').scalar()
+            free = connection.exec_driver_sql('PRAGMA freelist_count').scalar()
+            return (page_count - free) * connection.exec_driver_sql('PRAGMA page_size').scalar()
+        if engine.dialect.name == 'postgresql':
+            return connection.exec_driver_sql('SELECT pg_database_size(current_database())').scalar()
+    return None
+
+
+def binary_columns(engine):
+    """PostgreSQL: TEXT -> BYTEA, keeping the text as UTF-8 bytes (read back as legacy values)"""
+    if engine.dialect.name != 'postgresql':
+        return []
+    inspector = inspect(engine)
+    changed = []
+    with engine.begin() as connection:
+        for table, column in COLUMNS:
+            types = {col['name']: col['type'] for col in inspector.get_columns(table.name)}
+            if column in types and not isinstance(types[column], db.LargeBinary):
+                connection.exec_driver_sql(f"ALTER TABLE {table.name} ALTER COLUMN {column} "
+                                           f"TYPE BYTEA USING convert_to({column}, 'UTF8')")
+                changed.append(f'{table.name}.{column}')
+    return changed
+
+
+def convert(table, column, batch_size, pause=0.0, dry_run=False):
+    """Re-encode one column's legacy values in keyset batches; returns a stats dict"""
+    key = next(iter(table.primary_key.columns))
+    stored = db.type_coerce(table.c[column], db.LargeBinary)  # The bytes (or legacy text) as stored
+    legacy_type = db.Text if db.session.get_bind().dialect.name == 'sqlite' else db.LargeBinary
+    update = table.update().where(
+        key == db.bindparam('row_key'),
+        db.type_coerce(table.c[column], legacy_type) == db.bindparam('old', type_=legacy_type),
+    ).values({column: db.bindparam('new', type_=db.LargeBinary)})
+
+    stats = {'rows': 0, 'converted': 0, 'changed_meanwhile': 0, 'bytes_before': 0, 'bytes_after': 0}
+    last = None
+    while True:
+        query = db.select(key, stored).where(table.c[column].isnot(None)).order_by(key).limit(batch_size)
+        if last is not None:
+            query = query.where(key > last)
+        rows = db.session.execute(query).all()
+        if not rows:
+            break
+        last = rows[-1][0]
+
+        updates = []
+        for row_key, value in rows:
+            size = len(value.encode('utf-8')) if isinstance(value, str) else len(value)
+            stats['rows'] += 1
+            stats['bytes_before'] += size
+            if compact_json.is_encoded(value):
+                stats['bytes_after'] += size
+                continue
+            encoded = compact_json.encode(compact_json.decode(value))
+            stats['bytes_after'] += len(encoded)
+            updates.append({'row_key': row_key, 'old': value, 'new': encoded})
+
+        if updates and not dry_run:
+            written = db.session.execute(update, updates).rowcount
+            db.session.commit()
+            stats['converted'] += written
+            stats['changed_meanwhile'] += len(updates) - written
+        elif dry_run:
+            stats['converted'] += len(updates)
+        if pause:
+            time.sleep(pause)
+    return stats
+
+
+def vacuum(engine):
+    if engine.dialect.name == 'sqlite':
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.exec_driver_sql('VACUUM')
+        return True
+    return False
+
+
+def migrate(args, label):
+    engine = db.session.get_bind()
+    print(f"🗄️  {label} ({engine.dialect.name})")
+    size_before = database_bytes(engine)
+
+    if not args.dry_run:
+        for name in binary_columns(engine):
+            print(f"🔧 {name} is now BYTEA")
+    if args.schema_only:
+        return
+
+    for table, column in COLUMNS:
+        started = time.perf_counter()
+        stats = convert(table, column, args.batch_size, args.pause, args.dry_run)
+        ratio = stats['bytes_after'] / stats['bytes_before'] if stats['bytes_before'] else 1
+        print(f"   {table.name}.{column}: {stats['converted']:,} of {stats['rows']:,} rows "
+              f"{'would be ' if args.dry_run else ''}converted, "
+              f"{stats['bytes_before']:,} -> {stats['bytes_after']:,} bytes ({ratio:.0%}) "
+              f"in {time.perf_counter() - started:.1f}s")
+        if stats['changed_meanwhile']:
+            print(f"   {stats['changed_meanwhile']:,} rows were rewritten by the app meanwhile (already compressed)")
+
+    db.session.remove()
+    if args.vacuum and not args.dry_run and not vacuum(engine):
+        print("   --vacuum only applies to SQLite; PostgreSQL reuses the space, or run VACUUM FULL in a quiet hour")
+    size_after = database_bytes(engine)
+    if size_before and size_after and not args.dry_run:
+        print(f"✅ Database {size_before:,} -> {size_after:,} bytes"
+              f"{'' if args.vacuum else ' (use --vacuum to shrink the file)'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Store scenario_content and session_data compressed')
+    parser.add_argument('--config', default='development', help='app config name (default: development)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='rows per transaction (default: 1000)')
+    parser.add_argument('--pause', type=float, default=0.0, help='seconds between batches')
+    parser.add_argument('--dry-run', action='store_true', help='only report sizes')
+    parser.add_argument('--schema-only', action='store_true', help='only change PostgreSQL columns to BYTEA')
+    parser.add_argument('--vacuum', action='store_true', help='SQLite: shrink the file afterwards')
+    parser.add_argument('--all-tenants', action='store_true', help='also every organisation database')
+    args = parser.parse_args()
+
+    app = create_app(args.config)
+    with app.app_context():
+        migrate(args, 'control database')
+    for organisation in tenancy.active_organisations(app) if args.all_tenants else []:
+        with tenancy.tenant_context(app, organisation):
+            migrate(args, f'organisation {organisation.slug}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Move per-template inline CSS into cacheable per-section stylesheets.
+
+Usage:
+  cd <repo-root>
+  python scripts/extract_template_css.py            # extract and rewrite templates
+  python scripts/extract_template_css.py --dry-run  # only report what would change
+
+For every template whose `{% block extra_css %}` holds nothing but a
+<style> element, this script will:
+- Scope each rule to that page with `:where(html[data-page="<page-id>"])`.
+  :where() adds no specificity, so the cascade against main.css is
+  exactly what it was when the CSS was inline.
+- Write the rules into static/css/<section>.css, where the section is the
+  template's folder (admin, scenarios, ...). Each page gets its own marked
+  segment, so re-running after editing a template replaces only that segment.
+- Replace the <style> element with a <link> to the section stylesheet and
+  add `{% set page_id = ... %}` so base.html can emit the data-page attribute.
+
+The stylesheets are served through the asset manifest (assets.py), so
+they get content-hashed URLs and a year-long immutable Cache-Control.
+
+Blocks smaller than --min-bytes stay inline - a separate request for a
+few bytes of CSS costs more than it saves.
+
+It is safe to run multiple times.
+"""
+
+import argparse
+import os
+import re
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATES_DIR = os.path.join(ROOT, 'templates')
+CSS_DIR = os.path.join(ROOT, 'static', 'css')
+
+# Top-level templates (dashboard.html, index.html, ...) share this section
+ROOT_SECTION = 'pages'
+
+EXTRA_CSS_RE = re.compile(
+    r'(\{% block extra_css %\}\s*)<style>(?P<css>.*?)</style>(\s*\{% endblock %\})',
+    re.S,
+)
+EXTENDS_RE = re.compile(r'\{% extends [^%]*%\}\n?')
+SEGMENT_RE = r'/\* === page: {page} .*?/\* === end page: {page} === \*/\n?'
+
+
+def page_id_for(template):
+    """'admin/reports.html' -> 'admin-reports'"""
+    return os.path.splitext(template)[0].replace('/', '-')
+
+
+def section_for(template):
+    """'admin/reports.html' -> 'admin', 'dashboard.html' -> ROOT_SECTION"""
+    return template.split('/')[0] if '/' in template else ROOT_SECTION
+
+
+# ========================
+# CSS scoping
+# ========================
+def split_top_level(text, sep):
+    """Split on `sep` outside of parentheses and strings"""
+    parts, depth, quote, current = [], 0, None, []
+    for ch in text:
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in '"\'':
+            quote = ch
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == sep and depth == 0:
+            parts.append(''.join(current))
+            current = []
+            continue
+        current.append(ch)
+    parts.append(''.join(current))
+    return parts
+
+
+def scope_selector(selector, scope):
+    """Prefix a single selector so it only matches on one page"""
+    selector = selector.strip()
+    match = re.match(r'(:root|html)\b(.*)', selector, re.S)
+    if match:
+        # The page attribute lives on <html> itself
+        return f'{match.group(1)}:where({scope}){match.group(2)}'
+    return f':where(html{scope}) {selector}'
+
+
+def scope_css(css, scope):
+    """Rewrite every selector in a stylesheet; @media bodies are recursed into"""
+    out, i, n = [], 0, len(css)
+    while i < n:
+        brace = css.find('{', i)
+        if brace == -1:
+            out.append(css[i:])
+            break
+
+        prelude = css[i:brace]
+        # Find the matching closing brace
+        depth, j = 1, brace + 1
+        while j < n and depth:
+            if css[j] == '{':
+                depth += 1
+            elif css[j] == '}':
+                depth -= 1
+            j += 1
+        body = css[brace + 1:j - 1]
+
+        # Keep comments and whitespace before the prelude untouched
+        lead = re.match(r'(\s*(?:/\*.*?\*/\s*)*)', prelude, re.S).group(1)
+        head = prelude[len(lead):]
+        trail = head[len(head.rstrip()):]
+        head = head.rstrip()
+
+        if head.startswith('@media') or head.startswith('@supports'):
+            body = scope_css(body, scope)
+        elif head.startswith('@'):
+            pass  # @keyframes, @font-face, ... are not selectors
+        else:
+            head = ', '.join(scope_selector(s, scope) for s in split_top_level(head, ','))
+
+        out.append(f'{lead}{head}{trail}{{{body}}}')
+        i = j
+    return ''.join(out)
+
+
+def dedent(css):
+    """Strip the template's indentation from a <style> body"""
+    lines = css.strip('\n').split('\n')
+    indents = [len(l) - len(l.lstrip()) for l in lines if l.strip()]
+    cut = min(indents) if indents else 0
+    return '\n'.join(l[cut:] for l in lines).strip() + '\n'
+
+
+# ========================
+# Section stylesheets
+# ========================
+def write_segment(section, page, template, css, dry_run):
+    """Insert or replace one page's segment in a section stylesheet"""
+    path = os.path.join(CSS_DIR, f'{section}.css')
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            existing = f.read()
+    else:
+        source = 'templates/' if section == ROOT_SECTION else f'templates/{section}/'
+        existing = (
+            f'/* {section}.css - page styles extracted from {source}\n'
+            f' * Generated by scripts/extract_template_css.py. Each page segment is\n'
+            f' * scoped with :where(html[data-page="..."]) and replaced on re-run. */\n'
+        )
+
+    segment = (
+        f'\n/* === page: {page} ({template}) === */\n'
+        f'{css}'
+        f'/* === end page: {page} === */\n'
+    )
+    pattern = re.compile(r'\n?' + SEGMENT_RE.format(page=re.escape(page)), re.S)
+    if pattern.search(existing):
+        updated = pattern.sub(lambda _: segment, existing)
+    else:
+        updated = existing + segment
+
+    if not dry_run:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(updated)
+    return path
+
+
+def rewrite_template(source, page, section):
+    """Swap the <style> for a <link> and declare the page id"""
+    link = (
+        "<link rel=\"stylesheet\" href=\"{{ url_for('static', filename='css/"
+        f"{section}.css') }}}}\">"
+    )
+    source = EXTRA_CSS_RE.sub(lambda m: f'{m.group(1)}{link}{m.group(3)}', source, count=1)
+
+    if '{% set page_id' not in source:
+        declaration = f"{{% set page_id = '{page}' %}}\n"
+        extends = EXTENDS_RE.search(source)
+        if extends:
+            source = source[:extends.end()] + declaration + source[extends.end():]
+        else:
+            source = declaration + source
+    return source
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--dry-run', action='store_true', help='report only, write nothing')
+    parser.add_argument('--min-bytes', type=int, default=512,
+                        help='leave smaller <style> blocks inline (default: 512)')
+    args = parser.parse_args()
+
+    total_before = total_after = 0
+    for dirpath, _dirs, files in os.walk(TEMPLATES_DIR):
+        for name in sorted(files):
+            if not name.endswith('.html'):
+                continue
+            path = os.path.join(dirpath, name)
+            template = os.path.relpath(path, TEMPLATES_DIR).replace(os.sep, '/')
+            with open(path, encoding='utf-8') as f:
+                source = f.read()
+
+            match = EXTRA_CSS_RE.search(source)
+            if not match:
+                continue
+            if len(match.group('css').encode('utf-8')) < args.min_bytes:
+                print(f"  skip  {template} (inline CSS under {args.min_bytes} bytes)")
+                continue
+
+            page, section = page_id_for(template), section_for(template)
+            scoped = scope_css(dedent(match.group('css')), f'[data-page="{page}"]')
+            css_path = write_segment(section, page, template, scoped, args.dry_run)
+            updated = rewrite_template(source, page, section)
+
+            before, after = len(source.encode('utf-8')), len(updated.encode('utf-8'))
+            total_before += before
+            total_after += after
+            print(f"  {template:34} {before:7,} -> {after:7,} bytes  "
+                  f"-> {os.path.relpath(css_path, ROOT)}")
+
+            if not args.dry_run:
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(updated)
+
+    if total_before:
+        print(f"\nTemplate source: {total_before:,} -> {total_after:,} bytes "
+              f"({total_before - total_after:,} bytes of CSS moved to static/css/)")
+    else:
+        print("No inline extra_css blocks found. Nothing to do.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic data generator for load and performance testing.
+
+Usage:
+  cd <repo-root>
+  python scripts/generate_data.py --users 2000 --scenarios 300 --sessions 1000000
+  python scripts/generate_data.py --reset --seed 7 --now 2026-01-01 --config testing ...
+
+Unlike create_db.py (one scenario, two trainees, one session) this builds
+classroom-scale data:
+- N trainees named trainee000000, trainee000001, ... plus a few instructors
+  (instructor000, ...). All share one password (--password) so the
+  load driver (scripts/load_test.py) can log in as any of them.
+- M branching scenarios with 4-10 stages, 3-4 options per stage, option
+  metric weights and `next` jumps (including early END exits).
+- Millions of training sessions. Most are completed and some are in
+  progress or abandoned. Start times are spread over the year before
+  --now (default: today, midnight UTC).
+
+Rows go in with Core bulk inserts in batches (--batch-size), one
+transaction per batch. The same --seed and --now always produce the same
+data (only the password hash salt differs).
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import create_app  # noqa: E402
+from models import db, User, Scenario, ScenarioVersion, ScenarioPublication, TrainingSession, LeaderboardEntry  # noqa: E402
+from scenario_content import CATEGORIES, best_path_points, version_hash  # noqa: E402
+from search import rebuild_index  # noqa: E402
+from recommender import rebuild_profiles  # noqa: E402
+
+INCIDENT_TYPES = ['ransomware', 'data_breach', 'ddos', 'phishing', 'insider_threat', 'malware']
+STAGE_NAMES = ['detection', 'containment', 'eradication', 'recovery', 'communication']
+
+# Session status mix
+STATUS_WEIGHTS = [('completed', 0.80), ('in_progress', 0.15), ('abandoned', 0.05)]
+
+WORDS = ('incident server breach alert credentials firewall backup endpoint '
+         'attacker network malware phishing escalate isolate restore notify '
+         'forensics evidence patch outage customer database ransom payload').split()
+
+
+def sentence(rng, words=12):
+    """Filler text - deterministic for a given rng state"""
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def build_scenario_content(rng):
+    """A branching scenario in the example_scenario.json format"""
+    stage_count = rng.randint(4, 10)
+    stages = []
+    for index in range(stage_count):
+        options = []
+        for _ in range(rng.randint(3, 4)):
+            option = {'text': sentence(rng, 8), 'points': rng.choice([-40, -10, 0, 5, 10, 15, 20, 25, 30, 35])}
+            if rng.random() < 0.5:
+                option['metrics'] = {c: rng.randint(0, 3) for c in rng.sample(CATEGORIES, 2)}
+            roll = rng.random()
+            if roll < 0.15 and index < stage_count - 2:
+                option['next'] = rng.randint(index + 2, stage_count - 1)  # skip ahead
+            elif roll < 0.20:
+                option['next'] = 'END'
+            options.append(option)
+        stages.append({
+            'stage': STAGE_NAMES[index % len(STAGE_NAMES)],
+            'content': ' '.join(sentence(rng) for _ in range(rng.randint(3, 8))),
+            'question': sentence(rng, 6).rstrip('.') + '?',
+            'options': options,
+        })
+    return {'intro': ' '.join(sentence(rng) for _ in range(3)), 'stages': stages}
+
+
+def bulk_insert(table, rows):
+    """Core executemany insert - no ORM identity map, no per-row flush"""
+    if rows:
+        db.session.execute(table.insert(), rows)
+        db.session.commit()
+
+
+def today():
+    """Midnight UTC today - the default reference time"""
+    return datetime.combine(datetime.utcnow().date(), datetime.min.time())
+
+
+def generate(args):
+    rng = random.Random(args.seed)
+    now = getattr(args, 'now', None) or today()  # Dates are relative to this, not to the time of the run
+    password_hash = generate_password_hash(args.password)  # Hashing is slow - do it once
+
+    # Users
+    started = time.perf_counter()
+    users = [{
+        'username': f'instructor{i:03d}',
+        'email': f'instructor{i:03d}@dontpanic.test',
+        'password_hash': password_hash,
+        'role': 'instructor',
+        'created_at': now - timedelta(days=400),
+        'is_active': True,
+    } for i in range(args.instructors)]
+    users += [{
+        'username': f'trainee{i:06d}',
+        'email': f'trainee{i:06d}@dontpanic.test',
+        'password_hash': password_hash,
+        'role': 'trainee',
+        'created_at': now - timedelta(days=rng.randint(0, 365)),
+        'is_active': True,
+    } for i in range(args.users)]
+    for start in range(0, len(users), args.batch_size):
+        bulk_insert(User.__table__, users[start:start + args.batch_size])
+
+    instructor_ids = [row.id for row in db.session.query(User.id).filter(
+        User.username.like('instructor%')).order_by(User.id)]
+    trainee_ids = [row.id for row in db.session.query(User.id).filter(
+        User.username.like('trainee%')).order_by(User.id)]
+    print(f"✅ {len(users):,} users in {time.perf_counter() - started:.1f}s")
+
+    # Scenarios
+    started = time.perf_counter()
+    scenarios = []
+    versions = {}  # hash -> row; identical content is stored once
+    for i in range(args.scenarios):
+        content = build_scenario_content(rng)
+        created = now - timedelta(days=rng.randint(0, 365))
+        scenario_content, max_points = json.dumps(content), best_path_points(content)
+        key = version_hash(scenario_content, max_points)
+        versions.setdefault(key, {'hash': key, 'scenario_content': scenario_content,
+                                  'max_points': max_points, 'created_at': created})
+        scenarios.append({
+            'title': f'{rng.choice(INCIDENT_TYPES).replace("_", " ").title()} Exercise {i:04d}',
+            'description': sentence(rng, 20),
+            'incident_type': rng.choice(INCIDENT_TYPES),
+            'difficulty_level': rng.randint(1, 5),
+            'estimated_time': rng.choice([15, 20, 30, 45, 60]),
+            'max_points': max_points,
+            'scenario_content': scenario_content,
+            'version_hash': key,
+            'created_by': rng.choice(instructor_ids) if instructor_ids else 1,
+            'created_at': created,
+            'updated_at': created,
+            'is_active': True,
+            'times_played': 0,
+            'average_score': 0.0,
+        })
+    bulk_insert(ScenarioVersion.__table__, list(versions.values()))
+    for start in range(0, len(scenarios), args.batch_size):
+        bulk_insert(Scenario.__table__, scenarios[start:start + args.batch_size])
+
+    rebuild_index()  # Core inserts bypass the search index's mapper events
+    scenario_rows = db.session.query(Scenario.id, Scenario.max_points, Scenario.version_hash,
+                                     Scenario.created_by, Scenario.created_at).order_by(Scenario.id).all()
+    bulk_insert(ScenarioPublication.__table__, [{
+        'scenario_id': scenario_id, 'version_hash': key, 'published_by': created_by, 'published_at': created,
+    } for scenario_id, _, key, created_by, created in scenario_rows])
+    print(f"✅ {len(scenarios):,} scenarios in {time.perf_counter() - started:.1f}s")
+
+    # Training sessions
+    started = time.perf_counter()
+    statuses = [s for s, _ in STATUS_WEIGHTS]
+    weights = [w for _, w in STATUS_WEIGHTS]
+    batch = []
+    for i in range(args.sessions):
+        scenario_id, max_points, key, _, _ = rng.choice(scenario_rows)
+        status = rng.choices(statuses, weights)[0]
+        started_at = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+        row = {
+            'user_id': rng.choice(trainee_ids),
+            'scenario_id': scenario_id,
+            'version_hash': key,
+            'started_at': started_at,
+            'created_at': started_at,
+            'status': status,
+            'completed_at': None,
+            'time_taken': None,
+            'score': 0,
+            'outcome': None,
+            'session_data': None,
+            'detection_score': 0,
+            'containment_score': 0,
+            'eradication_score': 0,
+            'recovery_score': 0,
+            'communication_score': 0,
+        }
+        if status == 'completed':
+            time_taken = rng.randint(300, 3600)
+            score = max(0, min(max_points, int(rng.gauss(max_points * 0.65, max_points * 0.2))))
+            # Split the score across categories, as play.html does
+            shares = [rng.random() for _ in CATEGORIES]
+            categories = [int(score * share / sum(shares)) for share in shares]
+            row.update({
+                'completed_at': started_at + timedelta(seconds=time_taken),
+                'time_taken': time_taken,
+                'score': score,
+                'outcome': TrainingSession.outcome_for(score),
+                'detection_score': categories[0],
+                'containment_score': categories[1],
+                'eradication_score': categories[2],
+                'recovery_score': categories[3],
+                'communication_score': categories[4],
+            })
+        batch.append(row)
+
+        if len(batch) >= args.batch_size:
+            bulk_insert(TrainingSession.__table__, batch)
+            batch = []
+            if (i + 1) % (args.batch_size * 20) == 0:
+                rate = (i + 1) / (time.perf_counter() - started)
+                print(f"   ... {i + 1:,} sessions ({rate:,.0f}/s)")
+    bulk_insert(TrainingSession.__table__, batch)
+    print(f"✅ {args.sessions:,} sessions in {time.perf_counter() - started:.1f}s")
+
+    # Denormalised scenario statistics in one set-based UPDATE
+    Scenario.refresh_statistics()
+    db.session.commit()
+    print("✅ Scenario statistics updated")
+
+    entries = LeaderboardEntry.rebuild(batch_size=args.batch_size)
+    db.session.commit()
+    print(f"✅ {entries:,} leaderboard entries rebuilt")
+
+    started = time.perf_counter()
+    profiles = rebuild_profiles()
+    db.session.commit()
+    print(f"✅ {profiles:,} skill profiles in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic Don\'t Panic data')
+    parser.add_argument('--config', default='development', help='app config name (default: development)')
+    parser.add_argument('--users', type=int, default=1000, help='trainees to create')
+    parser.add_argument('--instructors', type=int, default=5, help='instructors to create')
+    parser.add_argument('--scenarios', type=int, default=100, help='scenarios to create')
+    parser.add_argument('--sessions', type=int, default=100000, help='training sessions to create')
+    parser.add_argument('--password', default='password123', help='password for every generated user')
+    parser.add_argument('--seed', type=int, default=42, help='random seed (same seed and --now, same data)')
+    parser.add_argument('--now', type=datetime.fromisoformat, default=None,
+                        help='reference time, e.g. 2026-01-01 (default: today, midnight UTC)')
+    parser.add_argument('--batch-size', type=int, default=10000, help='rows per bulk insert')
+    parser.add_argument('--reset', action='store_true', help='drop and recreate all tables first')
+    args = parser.parse_args()
+
+    app = create_app(args.config)
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+            db.create_all()
+            print("🗄️  Tables recreated")
+
+        started = time.perf_counter()
+        generate(args)
+
+        print("\n" + "="*50)
+        print(f"🎉 Done in {time.perf_counter() - started:.1f}s")
+        print("="*50)
+        print(f"   Users: {User.query.count():,}")
+        print(f"   Scenarios: {Scenario.query.count():,}")
+        print(f"   Training Sessions: {TrainingSession.query.count():,}")
+        print(f"   Password for all generated users: {args.password}")
+        print("="*50)
+
+
+if __name__ == '__main__':
+    main()
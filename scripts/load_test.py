@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Scripted load driver - replays a classroom and reports latency per endpoint.
+
+Usage:
+  cd <repo-root>
+  python scripts/generate_data.py --users 500 --scenarios 100 --sessions 200000
+  python scripts/load_test.py --trainees 30 --rounds 2               # in-process
+  python scripts/load_test.py --url http://localhost:5000 --trainees 30
+
+Each virtual trainee runs in its own thread and does what a class does:
+  login -> scenario list -> start -> play page -> content.json
+        -> one decision per stage -> complete -> results
+Virtual instructors (--instructors) keep refreshing the admin dashboard,
+reports and user list at the same time.
+
+Without --url, requests go through the Flask test client against the
+configured database (--config). There is no network, so the numbers show
+app and DB cost only. With --url, a plain HTTP client hits a running
+server (gunicorn, run.py, ...).
+
+Users come from scripts/generate_data.py: trainee000000..., instructor000...
+all with the same password.
+
+The configured RATE_LIMITS apply (e.g. scenarios.complete lets each user
+finish 5 scenarios in a burst, then one every 5 seconds). A 429 is counted
+in its own column, not as an error or a latency sample, and the request is
+retried after its Retry-After, as the browser does. To measure the app
+without throttling, run against a config with RATE_LIMITS = {}.
+"""
+
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# ========================
+# Clients
+# ========================
+class TestClientDriver:
+    """In-process requests through the Flask test client"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None, json_body=None):
+        response = self.client.open(path, method=method, data=data, json=json_body)
+        return response.status_code, response.headers, response.get_data(as_text=True)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpDriver:
+    """Real HTTP requests against a running server, one cookie jar per user"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method, path, data=None, json_body=None):
+        headers = {}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode('utf-8')
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                return response.status, response.headers, response.read().decode('utf-8', 'replace')
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read().decode('utf-8', 'replace')
+
+
+# ========================
+# Recording
+# ========================
+THROTTLED_RETRIES = 5  # 429s in a row before a request counts as an error
+
+
+def retry_after(headers):
+    """Seconds to wait before retrying a 429 (1 if the header is missing or a date)"""
+    try:
+        return max(1, int(headers.get('Retry-After', 1)))
+    except ValueError:
+        return 1
+
+
+class Recorder:
+    """Latency samples, errors and 429s per endpoint label"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.throttled = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def timed(self, driver, label, method, path, expect=(200, 302), **kwargs):
+        """Time a request - a 429 is counted apart and sent again after its Retry-After"""
+        for attempt in range(THROTTLED_RETRIES + 1):
+            started = time.perf_counter()
+            status, headers, body = driver.request(method, path, **kwargs)
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                if status == 429:
+                    self.throttled[label] += 1
+                    if attempt == THROTTLED_RETRIES:
+                        self.errors[label] += 1
+                else:
+                    self.samples[label].append(elapsed)
+                    if status not in expect:
+                        self.errors[label] += 1
+            if status != 429 or attempt == THROTTLED_RETRIES:
+                break
+            time.sleep(retry_after(headers))  # Waiting isn't latency - it's not in the samples
+        return status, headers.get('Location'), body
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def report(recorder, wall_seconds):
+    total = sum(len(v) for v in recorder.samples.values())
+    throttled = sum(recorder.throttled.values())
+    print("\n" + "="*96)
+    print(f"{'endpoint':28} {'count':>7} {'errors':>7} {'429s':>7} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    print("-"*96)
+    for label in sorted(set(recorder.samples) | set(recorder.throttled)):
+        values = sorted(recorder.samples[label])
+        print(f"{label:28} {len(values):7d} {recorder.errors[label]:7d} {recorder.throttled[label]:7d} "
+              f"{percentile(values, 50) * 1000:9.1f} {percentile(values, 95) * 1000:9.1f} "
+              f"{percentile(values, 99) * 1000:9.1f} {(values[-1] if values else 0.0) * 1000:9.1f}")
+    print("-"*96)
+    print(f"{total:,} requests in {wall_seconds:.1f}s ({total / wall_seconds:,.1f} req/s)")
+    if throttled:
+        print(f"{throttled:,} rate limited (429) and retried - see RATE_LIMITS in config.py")
+    print("="*96)
+
+
+# ========================
+# Classroom scripts
+# ========================
+SESSION_URL = re.compile(r'/scenarios/session/(\d+)')
+START_URL = re.compile(r'/scenarios/(\d+)/start')
+
+
+def trainee_flow(driver, recorder, username, password, rounds, rng):
+    recorder.timed(driver, 'auth.login', 'POST', '/auth/login',
+                   data={'username': username, 'password': password})
+
+    for _ in range(rounds):
+        _status, _loc, body = recorder.timed(driver, 'scenarios.list', 'GET', '/scenarios/')
+        scenario_ids = START_URL.findall(body)
+        if not scenario_ids:
+            return
+        scenario_id = rng.choice(scenario_ids)
+
+        _status, location, _body = recorder.timed(driver, 'scenarios.start', 'POST',
+                                                  f'/scenarios/{scenario_id}/start')
+        match = SESSION_URL.search(location or '')
+        if not match:
+            continue
+        session_id = match.group(1)
+
+        recorder.timed(driver, 'scenarios.play', 'GET', f'/scenarios/session/{session_id}')
+        _status, _loc, body = recorder.timed(driver, 'scenarios.content', 'GET',
+                                             f'/scenarios/{scenario_id}/content.json')
+        try:
+            stages = json.loads(body).get('stages', [])
+        except ValueError:
+            stages = []
+
+        score = 0
+        for index, stage in enumerate(stages):
+            options = stage.get('options') or [{}]
+            choice = rng.randrange(len(options))
+            score += int(options[choice].get('points', 0))
+            recorder.timed(driver, 'scenarios.submit_decision', 'POST',
+                           f'/scenarios/session/{session_id}/submit',
+                           json_body={'decision': {'stage': index, 'option': choice}})
+
+        score = max(0, score)
+        metrics = {c: score // 5 for c in ('detection', 'containment', 'eradication', 'recovery', 'communication')}
+        recorder.timed(driver, 'scenarios.complete', 'POST', f'/scenarios/session/{session_id}/complete',
+                       json_body={'score': score, 'metrics': metrics})
+        recorder.timed(driver, 'scenarios.results', 'GET', f'/scenarios/session/{session_id}/results')
+
+
+def instructor_flow(driver, recorder, username, password, stop):
+    recorder.timed(driver, 'auth.login', 'POST', '/auth/login',
+                   data={'username': username, 'password': password})
+    pages = [('admin.dashboard', '/admin/dashboard'), ('admin.reports', '/admin/reports'),
+             ('admin.users', '/admin/users'), ('admin.manage_scenarios', '/admin/scenarios/manage')]
+    while not stop.is_set():
+        for label, path in pages:
+            if stop.is_set():
+                break
+            recorder.timed(driver, label, 'GET', path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a classroom against the app')
+    parser.add_argument('--url', help='base URL of a running server (default: in-process test client)')
+    parser.add_argument('--config', default='development', help='app config for in-process mode')
+    parser.add_argument('--trainees', type=int, default=20, help='concurrent virtual trainees')
+    parser.add_argument('--instructors', type=int, default=1, help='concurrent virtual instructors')
+    parser.add_argument('--rounds', type=int, default=1, help='scenarios each trainee plays')
+    parser.add_argument('--user-offset', type=int, default=0, help='first trainee number to use')
+    parser.add_argument('--password', default='password123')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if args.url:
+        make_driver = lambda: HttpDriver(args.url)  # noqa: E731
+    else:
+        from app import create_app
+        app = create_app(args.config)
+        make_driver = lambda: TestClientDriver(app)  # noqa: E731
+
+    recorder = Recorder()
+    stop = threading.Event()
+
+    trainees = [threading.Thread(target=trainee_flow, args=(
+        make_driver(), recorder, f'trainee{args.user_offset + i:06d}', args.password,
+        args.rounds, random.Random(args.seed + i))) for i in range(args.trainees)]
+    instructors = [threading.Thread(target=instructor_flow, args=(
+        make_driver(), recorder, f'instructor{i:03d}', args.password, stop))
+        for i in range(args.instructors)]
+
+    print(f"🚀 {args.trainees} trainees x {args.rounds} round(s), {args.instructors} instructor(s) "
+          f"-> {args.url or 'in-process test client'}")
+    started = time.perf_counter()
+    for thread in instructors + trainees:
+        thread.start()
+    for thread in trainees:
+        thread.join()
+    stop.set()
+    for thread in instructors:
+        thread.join()
+
+    report(recorder, time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    main()
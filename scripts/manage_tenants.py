@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Create, list and move client organisations between database shards.
+
+Usage:
+  cd <repo-root>
+  python scripts/manage_tenants.py list
+  python scripts/manage_tenants.py create acme "Acme Corp" --shard local --password 's3cret'
+  python scripts/manage_tenants.py move acme eu-2 --config production
+  python scripts/manage_tenants.py suspend acme        # 403 until resumed
+  python scripts/manage_tenants.py resume acme         # also after an interrupted move
+  python scripts/manage_tenants.py reset-password acme admin   # prints a new random password
+
+Each organisation's data lives in its own database on a shard from
+TENANT_SHARDS (see tenancy.py). It is served at <slug>.TENANT_DOMAIN.
+A move answers 503 for that organisation while its tables are copied, then
+switches the shard map. The old database is kept for you to remove.
+"""
+
+import argparse
+import json
+import os
+import secrets
+import sys
+
+from sqlalchemy.engine import make_url
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import create_app  # noqa: E402
+from models import db, Organisation  # noqa: E402
+import tenancy  # noqa: E402
+
+
+def list_(app, args):
+    engines = app.extensions['tenancy'].engines
+    organisations = Organisation.query.order_by(Organisation.slug).all()
+    if not organisations:
+        print("No organisations - every request is served from the control database")
+    for organisation in organisations:
+        url = make_url(engines.url(organisation.shard, organisation.slug)) \
+            if organisation.shard in engines.shards else None
+        print(f"{organisation.slug:<24} {organisation.status:<10} {organisation.shard:<12} "
+              f"{url.render_as_string(hide_password=True) if url else '(shard missing from TENANT_SHARDS)'}")
+
+
+def _password(args):
+    """--password, or a random one (printed once - it isn't stored anywhere readable)"""
+    return args.password or secrets.token_urlsafe(12)
+
+
+def create(app, args):
+    password = _password(args)
+    organisation = tenancy.create_organisation(app, args.slug, args.name or args.slug, args.shard, password)
+    print(f"✅ Created {organisation.slug} on {organisation.shard}")
+    if not args.password:
+        print(f"   Its 'admin' instructor's password is {password} - it won't be shown again")
+
+
+def reset_password(app, args):
+    password = _password(args)
+    tenancy.set_password(app, args.slug, args.username, password)
+    print(f"✅ Password for {args.username} in {args.slug} reset")
+    if not args.password:
+        print(f"   The new password is {password} - it won't be shown again")
+
+
+def move(app, args):
+    stats = tenancy.move_organisation(app, args.slug, args.shard, drain_seconds=args.drain_seconds,
+                                      batch_size=args.batch_size, log=print)
+    print(json.dumps(stats, indent=2))
+    print(f"✅ Moved {stats['rows']:,} rows in {stats['seconds']}s - {stats['source']} can be removed")
+
+
+def set_status(app, args):
+    organisation = Organisation.query.filter_by(slug=args.slug).first()
+    if organisation is None:
+        raise tenancy.TenantError(f'no organisation {args.slug!r}')
+    organisation.status = 'suspended' if args.command == 'suspend' else 'active'
+    db.session.commit()
+    print(f"✅ {organisation.slug} is {organisation.status} "
+          f"(workers notice within TENANT_CACHE_SECONDS={app.config['TENANT_CACHE_SECONDS']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage client organisations and their database shards')
+    parser.add_argument('--config', default='development', help='app config name (default: development)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('list', help='show organisations and where their data lives')
+
+    create_parser = commands.add_parser('create', help='add an organisation and set up its database')
+    create_parser.add_argument('slug', help='subdomain (lower-case letters, digits and hyphens)')
+    create_parser.add_argument('name', nargs='?', help='display name (default: the slug)')
+    create_parser.add_argument('--shard', default='local', help='key of TENANT_SHARDS (default: local)')
+    create_parser.add_argument('--password', help="password for the organisation's 'admin' instructor "
+                                                  "(default: random, printed once)")
+
+    reset_parser = commands.add_parser('reset-password', help="set a password in an organisation's database")
+    reset_parser.add_argument('slug')
+    reset_parser.add_argument('username', nargs='?', default='admin', help='user to reset (default: admin)')
+    reset_parser.add_argument('--password', help='new password (default: random, printed once)')
+
+    move_parser = commands.add_parser('move', help="copy an organisation's database to another shard")
+    move_parser.add_argument('slug')
+    move_parser.add_argument('shard', help='key of TENANT_SHARDS to move to')
+    move_parser.add_argument('--drain-seconds', type=float,
+                             help='wait after marking it read-only (default: TENANT_CACHE_SECONDS + 5)')
+    move_parser.add_argument('--batch-size', type=int, default=1000, help='rows per insert (default: 1000)')
+
+    for command in ('suspend', 'resume'):
+        status_parser = commands.add_parser(command, help=f'{command} serving an organisation')
+        status_parser.add_argument('slug')
+    args = parser.parse_args()
+
+    handlers = {'list': list_, 'create': create, 'move': move, 'suspend': set_status, 'resume': set_status,
+                'reset-password': reset_password}
+    app = create_app(args.config)
+    with app.app_context():
+        try:
+            handlers[args.command](app, args)
+        except tenancy.TenantError as e:
+            print(f"ERROR: {e}")
+            sys.exit(1)
+        finally:
+            db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
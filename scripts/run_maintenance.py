@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Run background maintenance jobs once, outside the scheduler.
+
+Usage:
+  cd <repo-root>
+  python scripts/run_maintenance.py --list
+  python scripts/run_maintenance.py --job reap_abandoned
+  python scripts/run_maintenance.py --all
+
+Runs are recorded in scheduled_jobs like scheduled ones, so the
+scheduler won't repeat a job that was just run by hand. Useful from cron
+when SCHEDULER_ENABLED is off.
+"""
+
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import create_app  # noqa: E402
+from scheduler import JOBS, run_job  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run maintenance jobs once')
+    parser.add_argument('--config', default='development', help='app config name (default: development)')
+    parser.add_argument('--job', action='append', choices=sorted(JOBS), help='job to run (repeatable)')
+    parser.add_argument('--all', action='store_true', help='run every job')
+    parser.add_argument('--list', action='store_true', help='list the jobs and exit')
+    args = parser.parse_args()
+
+    if args.list:
+        for name, job in JOBS.items():
+            print(f"{name:24} {job.__doc__}")
+        return
+    names = list(JOBS) if args.all else args.job
+    if not names:
+        parser.error('give --job NAME, --all or --list')
+
+    app = create_app(args.config)
+    failed = False
+    with app.app_context():
+        for name in names:
+            status, result = run_job(app, name)
+            icon = '✅' if status == 'ok' else '❌'
+            print(f"{icon} {name}: {result}")
+            failed = failed or status != 'ok'
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Export scenarios to a pack file, or import one.
+
+Usage:
+  cd <repo-root>
+  python scripts/scenario_pack.py export library.jsonl            # every scenario
+  python scripts/scenario_pack.py export library.zip --ids 3,4,9
+  python scripts/scenario_pack.py import library.jsonl --dry-run  # validate only
+  python scripts/scenario_pack.py import library.zip --update --config production
+
+The format is picked from the file name (.zip, else JSONL; .gz is
+compressed). Imports run in one transaction: nothing is written if any
+entry is invalid, unless --skip-invalid. Scenarios whose title already
+exists are left alone, or get the pack's content as a new version with
+--update. The same format is used by Manage Scenarios -> Import / Export.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import create_app  # noqa: E402
+from models import db, User  # noqa: E402
+import scenario_packs  # noqa: E402
+
+
+def export(app, args):
+    ids = [int(item_id) for item_id in args.ids.split(',')] if args.ids else None
+    fmt = 'zip' if args.path.endswith('.zip') else 'jsonl'
+    started = time.perf_counter()
+    opener = gzip.open if args.path.endswith('.gz') else open
+    with opener(args.path, 'wb') as f:
+        for chunk in scenario_packs.export_pack(ids, fmt, name=args.name):
+            f.write(chunk)
+    print(f"📦 Wrote {args.path} ({os.path.getsize(args.path):,} bytes) in {time.perf_counter() - started:.1f}s")
+
+
+def import_(app, args):
+    importer = User.query.filter_by(username=args.user).first()
+    if importer is None:
+        print(f"ERROR: no user named {args.user!r} (imported scenarios need a creator)")
+        sys.exit(1)
+    with open(args.path, 'rb') as f:
+        try:
+            summary = scenario_packs.import_pack(
+                f, importer.id, update=args.update, skip_invalid=args.skip_invalid, dry_run=args.dry_run,
+                workers=app.config['PACK_IMPORT_WORKERS'] if args.workers is None else args.workers,
+                chunk_size=app.config['PACK_IMPORT_CHUNK_SIZE'],
+                batch_size=app.config['PACK_IMPORT_BATCH_SIZE'])
+        except scenario_packs.PackError as e:
+            print(f"ERROR: {e}")
+            sys.exit(1)
+
+    for error in summary.pop('errors'):
+        print(f"❌ {error['source']}: {'; '.join(error['errors'])}")
+    print(json.dumps(summary, indent=2))
+    if summary['imported']:
+        print(f"✅ {summary['created']} created, {summary['updated']} updated in {summary['seconds']}s")
+    elif summary['invalid']:
+        print("❌ Nothing imported - fix the entries above or use --skip-invalid")
+        sys.exit(1)
+    else:
+        print("🔍 Dry run - nothing written")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export or import a scenario pack')
+    parser.add_argument('--config', default='development', help='app config name (default: development)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = commands.add_parser('export', help='write scenarios to a pack file')
+    export_parser.add_argument('path', help='output file (.jsonl, .jsonl.gz or .zip)')
+    export_parser.add_argument('--ids', help='comma-separated scenario ids (default: all)')
+    export_parser.add_argument('--name', help='pack name stored in the header')
+
+    import_parser = commands.add_parser('import', help='load scenarios from a pack file')
+    import_parser.add_argument('path', help='pack file (.jsonl, .jsonl.gz or .zip)')
+    import_parser.add_argument('--user', default='admin', help='instructor recorded as creator (default: admin)')
+    import_parser.add_argument('--update', action='store_true', help='publish changed content over same-titled scenarios')
+    import_parser.add_argument('--skip-invalid', action='store_true', help='import the valid entries anyway')
+    import_parser.add_argument('--dry-run', action='store_true', help='validate only')
+    import_parser.add_argument('--workers', type=int, help='validation processes (default: PACK_IMPORT_WORKERS)')
+    args = parser.parse_args()
+
+    app = create_app(args.config)
+    with app.app_context():
+        if args.command == 'export':
+            export(app, args)
+        else:
+            import_(app, args)
+        db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+"""
+Scenario search
+Full-text search over title, description and the stage text inside
+scenario_content, with facet counts by incident type and difficulty.
+
+Backends, picked per kind of database (organisation shards may differ, see tenancy.py):
+- 'fts5'      SQLite FTS5 table scenario_fts (rowid = scenario id), bm25 ranking
+- 'tsvector'  PostgreSQL table scenario_search with a weighted tsvector and a GIN index
+- 'like'      anything else (or SQLite built without FTS5): ILIKE over titles,
+              descriptions and table scenario_text, the stage text as plain text
+              (scenario_content itself is stored compressed)
+
+The index is kept in sync by mapper events on Scenario, inside the same
+flush as the change, so it covers every ORM create/edit/delete. Core bulk
+inserts call index_scenarios() (scenario pack imports) or rebuild_index()
+(scripts/generate_data.py) afterwards.
+"""
+
+import math
+import re
+from types import SimpleNamespace
+
+from flask import current_app, has_app_context
+from markupsafe import Markup, escape
+from sqlalchemy import column, event, inspect, table
+from sqlalchemy.exc import OperationalError
+
+from models import db, Scenario
+from scenario_content import searchable_text
+
+TOKEN = re.compile(r'\w+', re.UNICODE)
+FACETS = ('incident_type', 'difficulty_level')
+TEXT_FIELDS = ('title', 'description', 'scenario_content')
+
+# Snippet markers - control characters can't come from the escaped text
+MARK_START, MARK_END = '\x02', '\x03'
+
+FTS5_DDL = ("CREATE VIRTUAL TABLE IF NOT EXISTS scenario_fts "
+            "USING fts5(title, description, body, tokenize='porter unicode61')")
+TSVECTOR_DDL = (
+    "CREATE TABLE IF NOT EXISTS scenario_search ("
+    "scenario_id INTEGER PRIMARY KEY REFERENCES scenarios(id) ON DELETE CASCADE, "
+    "document TSVECTOR NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_scenario_search_document ON scenario_search USING GIN (document)",
+)
+TEXT_DDL = ("CREATE TABLE IF NOT EXISTS scenario_text ("
+            "scenario_id INTEGER PRIMARY KEY REFERENCES scenarios(id) ON DELETE CASCADE, "
+            "body TEXT NOT NULL)")
+SCENARIO_TEXT = table('scenario_text', column('scenario_id'), column('body'))
+INDEX_TABLES = {'fts5': 'scenario_fts', 'tsvector': 'scenario_search', 'like': 'scenario_text'}
+TSVECTOR_DOCUMENT = ("setweight(to_tsvector('english', :title), 'A') || "
+                     "setweight(to_tsvector('english', :description), 'B') || "
+                     "setweight(to_tsvector('english', :body), 'C')")
+
+
+def _backend(bind=None):
+    """Backend for the database being used (the request's organisation, see tenancy.py)"""
+    if not has_app_context():
+        return None
+    dialect = (bind or db.session.get_bind()).dialect.name
+    backends = current_app.extensions.get('search')
+    if backends is None:
+        return None
+    if dialect not in backends:  # An organisation shard of another kind than the control database
+        backends[dialect] = _dialect_backend(dialect)
+    return backends[dialect]
+
+
+def _terms(query):
+    """Lower-cased word tokens of a user query (punctuation and operators dropped)"""
+    return [term.lower() for term in TOKEN.findall(query or '')][:10]
+
+
+# ========================
+# Index maintenance
+# ========================
+def _index_row(scenario_id, title, description, content):
+    return {'id': scenario_id, 'title': title or '', 'description': description or '',
+            'body': searchable_text(content)}
+
+
+def _write(connection, backend, rows):
+    """Insert or replace index rows"""
+    if not rows:
+        return
+    if backend == 'fts5':
+        connection.execute(db.text("DELETE FROM scenario_fts WHERE rowid = :id"), rows)
+        connection.execute(db.text(
+            "INSERT INTO scenario_fts (rowid, title, description, body) "
+            "VALUES (:id, :title, :description, :body)"), rows)
+    elif backend == 'tsvector':
+        connection.execute(db.text(
+            f"INSERT INTO scenario_search (scenario_id, document) VALUES (:id, {TSVECTOR_DOCUMENT}) "
+            "ON CONFLICT (scenario_id) DO UPDATE SET document = excluded.document"), rows)
+    else:
+        connection.execute(db.text("DELETE FROM scenario_text WHERE scenario_id = :id"), rows)
+        connection.execute(db.text("INSERT INTO scenario_text (scenario_id, body) VALUES (:id, :body)"), rows)
+
+
+def _remove(connection, backend, scenario_id):
+    if backend == 'fts5':
+        connection.execute(db.text("DELETE FROM scenario_fts WHERE rowid = :id"), {'id': scenario_id})
+    else:
+        connection.execute(db.text(f"DELETE FROM {INDEX_TABLES[backend]} WHERE scenario_id = :id"), {'id': scenario_id})
+
+
+@event.listens_for(Scenario, 'after_insert')
+def _index_inserted(mapper, connection, target):
+    backend = _backend(connection)
+    if backend:
+        _write(connection, backend, [_index_row(target.id, target.title, target.description,
+                                                target.scenario_content)])
+
+
+@event.listens_for(Scenario, 'after_update')
+def _index_updated(mapper, connection, target):
+    backend = _backend(connection)
+    state = inspect(target)
+    # Play counts and averages are updated far more often than the text
+    if backend and any(
+            state.attrs[field].history.has_changes() for field in TEXT_FIELDS):
+        _write(connection, backend, [_index_row(target.id, target.title, target.description,
+                                                target.scenario_content)])
+
+
+@event.listens_for(Scenario, 'after_delete')
+def _index_deleted(mapper, connection, target):
+    backend = _backend(connection)
+    if backend:
+        _remove(connection, backend, target.id)
+
+
+def index_scenarios(rows):
+    """Add or replace the index rows for (id, title, description, scenario_content) tuples
+
+    For scenarios written with Core statements, which the mapper events don't
+    see. Runs in the session's transaction.
+    """
+    backend = _backend()
+    if backend:
+        _write(db.session.connection(), backend, [_index_row(*row) for row in rows])
+
+
+def rebuild_index(batch_size=1000):
+    """Re-index every scenario (after bulk inserts, or to repair); returns the count"""
+    backend = _backend()
+    if backend is None:
+        return 0
+
+    _create_index(db.session.get_bind())  # drop_all() removes it
+    connection = db.session.connection()
+    connection.execute(db.text(f"DELETE FROM {INDEX_TABLES[backend]}"))
+    indexed = 0
+    batch = []
+    rows = db.session.query(Scenario.id, Scenario.title, Scenario.description,
+                            Scenario.scenario_content).order_by(Scenario.id).yield_per(batch_size)
+    for row in rows:
+        batch.append(_index_row(*row))
+        if len(batch) >= batch_size:
+            _write(connection, backend, batch)
+            indexed += len(batch)
+            batch = []
+    _write(connection, backend, batch)
+    indexed += len(batch)
+    db.session.commit()
+    return indexed
+
+
+def _create_index(engine):
+    """Create the index for this database and return the backend name"""
+    dialect = engine.dialect.name
+    with engine.begin() as connection:
+        if dialect == 'sqlite':
+            try:
+                connection.execute(db.text(FTS5_DDL))
+                return 'fts5'
+            except OperationalError:
+                pass  # SQLite compiled without FTS5
+        elif dialect == 'postgresql':
+            for statement in TSVECTOR_DDL:
+                connection.execute(db.text(statement))
+            return 'tsvector'
+        connection.execute(db.text(TEXT_DDL))
+    return 'like'
+
+
+def _dialect_backend(dialect):
+    """Backend a database of this kind gets from _create_index, without connecting to one"""
+    if dialect == 'sqlite':
+        return _create_index(db.create_engine('sqlite://'))
+    return 'tsvector' if dialect == 'postgresql' else 'like'
+
+
+def prepare_database(engine):
+    """Create the facet indexes and the search index in a database; returns the backend"""
+    # For databases created before the facet index existed
+    for index in Scenario.__table__.indexes:
+        index.create(engine, checkfirst=True)
+    return _create_index(engine)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def _drop_index(target, connection, **kw):
+    """drop_all() would otherwise leave the FTS table and its rows behind"""
+    if connection.dialect.name == 'sqlite':
+        connection.execute(db.text("DROP TABLE IF EXISTS scenario_fts"))
+    elif connection.dialect.name == 'postgresql':
+        connection.execute(db.text("DROP TABLE IF EXISTS scenario_search"))
+    connection.execute(db.text("DROP TABLE IF EXISTS scenario_text"))
+
+
+# ========================
+# Queries
+# ========================
+def _matches(backend, terms, with_snippet=False):
+    """Subquery of (scenario_id, rank[, snippet]) for the terms, or None for the LIKE backend"""
+    if backend == 'fts5':
+        # Every term must match, as a prefix: "ransom"* "backup"*
+        match = ' '.join(f'"{term}"*' for term in terms)
+        snippet = (f", snippet(scenario_fts, -1, '{MARK_START}', '{MARK_END}', '…', 16) AS snippet"
+                   if with_snippet else '')
+        sql = ("SELECT rowid AS scenario_id, bm25(scenario_fts, 10.0, 5.0, 1.0) AS rank"
+               f"{snippet} FROM scenario_fts WHERE scenario_fts MATCH :match")
+        columns = dict(scenario_id=db.Integer, rank=db.Float)
+        if with_snippet:
+            columns['snippet'] = db.String
+        return db.text(sql).bindparams(match=match).columns(**columns).subquery('matches')
+
+    if backend == 'tsvector':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        # ts_rank is higher-is-better; negate so ascending rank sorts best first like bm25
+        return db.text(
+            "SELECT scenario_id, -ts_rank(document, to_tsquery('english', :tsquery)) AS rank "
+            "FROM scenario_search WHERE document @@ to_tsquery('english', :tsquery)"
+        ).bindparams(tsquery=tsquery).columns(scenario_id=db.Integer, rank=db.Float).subquery('matches')
+    return None
+
+
+def _base_query(backend, terms, entities, with_snippet=False):
+    """Query over scenarios restricted to the search terms; returns (query, matches)"""
+    query = db.session.query(*entities)
+    if not terms:
+        return query, None
+    matches = _matches(backend, terms, with_snippet)
+    if matches is not None:
+        return query.join(matches, matches.c.scenario_id == Scenario.id), matches
+    # scenario_content is stored compressed - its text is matched in scenario_text
+    for term in terms:
+        pattern = f'%{term}%'
+        in_body = db.select(SCENARIO_TEXT.c.scenario_id).where(SCENARIO_TEXT.c.body.ilike(pattern))
+        query = query.filter(db.or_(Scenario.title.ilike(pattern), Scenario.description.ilike(pattern),
+                                    Scenario.id.in_(in_body)))
+    return query, None
+
+
+def _filtered(query, filters, skip=None):
+    for facet, value in filters.items():
+        if facet != skip and value is not None:
+            query = query.filter(getattr(Scenario, facet) == value)
+    return query
+
+
+def highlight(snippet):
+    """Escape an index snippet and turn its match markers into <mark> tags"""
+    if not snippet:
+        return None
+    return Markup(str(escape(snippet)).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+def search_scenarios(query='', incident_type=None, difficulty_level=None, page=1, per_page=20):
+    """One page of matching scenarios plus facet counts
+
+    Each facet is counted with the other facet's filter applied, so the
+    counts say how many results picking that value would give.
+    """
+    backend = _backend() or 'like'
+    terms = _terms(query)
+    filters = {'incident_type': incident_type or None, 'difficulty_level': difficulty_level}
+
+    # Facet counts (grouped on the indexed facet columns)
+    facets = {}
+    for facet in FACETS:
+        column = getattr(Scenario, facet)
+        counts, _ = _base_query(backend, terms, [column, db.func.count(Scenario.id)])
+        facets[facet] = _filtered(counts, filters, skip=facet).group_by(column).order_by(column).all()
+
+    # The incident type facet is already filtered by difficulty; picking out the
+    # selected type (or summing them all) gives the total without another COUNT
+    total = sum(count for value, count in facets['incident_type']
+                if filters['incident_type'] is None or value == filters['incident_type'])
+    pages = max(1, math.ceil(total / per_page))
+    page = min(max(1, page), pages)
+
+    results_query, matches = _base_query(backend, terms, [Scenario], with_snippet=True)
+    if matches is not None:
+        entities = [matches.c.snippet] if 'snippet' in matches.c else []
+        results_query = results_query.add_columns(*entities).order_by(matches.c.rank, Scenario.id)
+    else:
+        results_query = results_query.order_by(Scenario.title, Scenario.id)
+    rows = _filtered(results_query, filters).limit(per_page).offset((page - 1) * per_page).all()
+
+    results = []
+    for row in rows:
+        if isinstance(row, Scenario):
+            results.append(SimpleNamespace(scenario=row, snippet=None))
+        else:
+            results.append(SimpleNamespace(scenario=row[0], snippet=highlight(row[1]) if len(row) > 1 else None))
+
+    return SimpleNamespace(query=query or '', terms=terms, backend=backend, results=results,
+                           total=total, page=page, pages=pages, per_page=per_page,
+                           facets=facets, filters=filters)
+
+
+def init_search(app):
+    """Create the search index for this database and fill it if it's new"""
+    with app.app_context():
+        engine = db.engine
+        backend = prepare_database(engine)
+        app.extensions['search'] = {engine.dialect.name: backend}  # Dialect -> backend
+        empty = db.session.execute(db.text(f"SELECT count(*) FROM {INDEX_TABLES[backend]}")).scalar() == 0
+        if empty and db.session.query(Scenario.id).first() is not None:
+            print(f"🔎 Search index built for {rebuild_index():,} scenarios")
+        db.session.remove()
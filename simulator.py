@@ -0,0 +1,321 @@
+"""
+Scenario simulator for authors
+Plays a scenario's stages / options / next graph the way play.html does:
+- points go to categories by option metrics
+- `next` jumps to an index, a stage name or END, falling back to the next stage
+- play finishes early once every category reaches 80 points
+- the final score is capped at max points
+
+It reports what a player picking options at random would score, how often
+each stage is reached, and the chance of each outcome band
+(TrainingSession.outcome_for).
+
+Two methods, picked per scenario:
+- 'exact'    When the graph has no cycles and the early finish can't trigger,
+             each stage's distribution of points still to come is built once
+             from its successors' (memoised), so shared sub-paths are
+             enumerated once however many paths run through them.
+- 'sampled'  Otherwise `runs` playthroughs advance together as NumPy arrays,
+             one vectorised step per decision.
+"""
+
+import math
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from models import TrainingSession
+from scenario_content import CATEGORIES, LEADING_INT, best_path_points, js_int, option_gains, parse
+
+END = -1  # The scenario completes
+STUCK = -2  # Play can't go on: a stage without options, or a `next` play.html doesn't act on
+EARLY_FINISH_POINTS = 80  # play.html completes once every category has this many points
+MAX_STEPS = 500  # Decisions per sampled playthrough before it counts as looping
+MAX_SUPPORT = 20_000  # Distinct point totals per stage before 'exact' gives way to sampling
+SAMPLE_CHUNK = 50_000  # Playthroughs simulated together (bounds the runs x stages visit matrix)
+HISTOGRAM_BINS = 20
+
+COMPLETED, STUCK_AT, LOOPING = 0, 1, 2
+
+
+def _next_stage(target, index, names, count):
+    """Where play.html goes after an option with this `next`"""
+    sequential = index + 1 if index < count - 1 else END
+    if target is None or target == '':
+        return sequential
+    if target == 'END':
+        return END
+    if isinstance(target, bool) or not isinstance(target, (int, float, str)):
+        return STUCK
+    if isinstance(target, float) and not math.isfinite(target):
+        return sequential
+    if not isinstance(target, str) or LEADING_INT.match(target):
+        position = js_int(target)  # parseInt, so "2nd" jumps to stage 2
+        return position if 0 <= position < count else sequential
+    return names.get(target, sequential)
+
+
+def compile_graph(content):
+    """Option tables for a scenario: category gains (stages, options, 5) and next stage (stages, options)"""
+    stages = parse(content).get('stages')
+    stages = [stage if isinstance(stage, dict) else {} for stage in stages] if isinstance(stages, list) else []
+    count = len(stages)
+    names = {}
+    for index, stage in enumerate(stages):
+        if isinstance(stage.get('stage'), str):
+            names.setdefault(stage['stage'], index)
+    options = [[option if isinstance(option, dict) else {} for option in stage.get('options')]
+               if isinstance(stage.get('options'), list) else [] for stage in stages]
+
+    width = max((len(stage_options) for stage_options in options), default=0) or 1
+    gains = np.zeros((count, width, len(CATEGORIES)))
+    next_stage = np.full((count, width), STUCK, dtype=np.int64)
+    for index, stage_options in enumerate(options):
+        for number, option in enumerate(stage_options):
+            gains[index, number] = option_gains(option)
+            next_stage[index, number] = _next_stage(option.get('next'), index, names, count)
+
+    return SimpleNamespace(
+        names=[stage.get('stage') if isinstance(stage.get('stage'), str) else f'Stage {index + 1}'
+               for index, stage in enumerate(stages)],
+        n_options=np.array([len(stage_options) for stage_options in options], dtype=np.int64),
+        gains=gains,
+        totals=gains.sum(axis=2),
+        next=next_stage,
+    )
+
+
+def _topological(graph):
+    """Stages reachable from the first, each before its successors; None if a cycle is reachable"""
+    if not len(graph.n_options):
+        return []
+    state = {0: 'open'}
+    order, stack = [], [(0, iter(graph.next[0, :max(graph.n_options[0], 1)].tolist()))]
+    while stack:
+        stage, successors = stack[-1]
+        for successor in successors:
+            if successor < 0:
+                continue
+            if state.get(successor) == 'open':
+                return None
+            if successor not in state:
+                state[successor] = 'open'
+                stack.append((successor, iter(graph.next[successor, :max(graph.n_options[successor], 1)].tolist())))
+                break
+        else:
+            stack.pop()
+            state[stage] = 'done'
+            order.append(stage)
+    order.reverse()
+    return order
+
+
+def _path_extremes(graph, order, values):
+    """Highest and lowest sum of `values` (stages, options, ...) over paths that complete, per stage"""
+    shape = values.shape[2:]
+    best, worst = {}, {}
+    for stage in reversed(order):
+        n = graph.n_options[stage]
+        highs, lows = [], []
+        for number in range(n):
+            target = graph.next[stage, number]
+            if target == END:
+                rest_high = rest_low = np.zeros(shape)
+            elif target >= 0 and target in best:
+                rest_high, rest_low = best[target], worst[target]
+            else:
+                continue  # Stuck, or every path on from there gets stuck
+            highs.append(values[stage, number] + rest_high)
+            lows.append(values[stage, number] + rest_low)
+        if highs:
+            best[stage], worst[stage] = np.max(highs, axis=0), np.min(lows, axis=0)
+    return best, worst
+
+
+def _exact(graph, order):
+    """Completed-score support and probabilities, outcome shares and stage reach - None if too many totals"""
+    remaining = {}  # stage -> {(status, points still to come): probability}
+    for stage in reversed(order):
+        n = graph.n_options[stage]
+        if n == 0:
+            remaining[stage] = {(STUCK_AT, 0.0): 1.0}
+            continue
+        merged = {}
+        for number in range(n):
+            target = graph.next[stage, number]
+            gain = graph.totals[stage, number]
+            if target >= 0:
+                tail = remaining[target]
+            else:
+                tail = {(COMPLETED if target == END else STUCK_AT, 0.0): 1.0}
+            for (status, points), probability in tail.items():
+                key = (status, round(points + gain, 9))
+                merged[key] = merged.get(key, 0.0) + probability / n
+        if len(merged) > MAX_SUPPORT:
+            return None
+        remaining[stage] = merged
+
+    reach = np.zeros(len(graph.n_options))
+    if order:
+        reach[0] = 1.0
+    for stage in order:
+        n = graph.n_options[stage]
+        for number in range(n):
+            target = graph.next[stage, number]
+            if target >= 0:
+                reach[target] += reach[stage] / n
+
+    start = remaining.get(0, {(STUCK_AT, 0.0): 1.0})
+    completed = [(points, probability) for (status, points), probability in start.items() if status == COMPLETED]
+    totals = np.array([points for points, _ in completed])
+    weights = np.array([probability for _, probability in completed])
+    statuses = {COMPLETED: weights.sum(), STUCK_AT: 1.0 - weights.sum(), LOOPING: 0.0}
+    return totals, weights, statuses, reach
+
+
+def _sample(graph, runs, rng):
+    """Point totals of completed playthroughs, outcome shares and stage reach from `runs` random playthroughs"""
+    count = len(graph.n_options)
+    if count == 0:
+        return np.zeros(0), np.zeros(0), {COMPLETED: 0.0, STUCK_AT: 1.0, LOOPING: 0.0}, np.zeros(0)
+
+    completed_totals = []
+    status_counts = np.zeros(3, dtype=np.int64)
+    reached = np.zeros(count, dtype=np.int64)
+    for start in range(0, runs, SAMPLE_CHUNK):
+        size = min(SAMPLE_CHUNK, runs - start)
+        categories = np.zeros((size, len(CATEGORIES)))
+        visited = np.zeros((size, count), dtype=bool)
+        status = np.full(size, LOOPING, dtype=np.int8)
+        stage = np.zeros(size, dtype=np.int64)
+        active = np.arange(size)
+        for _ in range(MAX_STEPS):
+            if not active.size:
+                break
+            current = stage[active]
+            visited[active, current] = True
+            # Options with no choices pick column 0, whose next is STUCK
+            choice = (rng.random(active.size) * graph.n_options[current]).astype(np.int64)
+            categories[active] += graph.gains[current, choice]
+            target = graph.next[current, choice]
+            early = (categories[active] >= EARLY_FINISH_POINTS).all(axis=1)
+            finished = early | (target == END)
+            stuck = ~early & (target == STUCK)
+            status[active[finished]] = COMPLETED
+            status[active[stuck]] = STUCK_AT
+            stage[active] = target
+            active = active[~(finished | stuck)]
+
+        completed_totals.append(categories[status == COMPLETED].sum(axis=1))
+        status_counts += np.bincount(status, minlength=3)
+        reached += visited.sum(axis=0)
+
+    totals = np.concatenate(completed_totals)
+    statuses = {code: status_counts[code] / runs for code in (COMPLETED, STUCK_AT, LOOPING)}
+    return totals, np.full(totals.size, 1.0 / runs), statuses, reached / runs
+
+
+def _percentile(scores, weights, fraction):
+    order = np.argsort(scores, kind='stable')
+    cumulative = np.cumsum(weights[order])
+    return float(scores[order][min(np.searchsorted(cumulative, fraction * cumulative[-1]), len(order) - 1)])
+
+
+def simulate(content, max_points=None, runs=100_000, seed=0, method=None):
+    """Score distribution, stage reach and outcome chances for random play of a scenario
+
+    max_points defaults to the auto rule (best_path_points). method is
+    'exact', 'sampled' or None to use 'exact' where the graph allows it;
+    runs and seed only matter when sampling.
+    """
+    started = time.perf_counter()
+    max_points = int(max_points) if max_points else best_path_points(content)
+    graph = compile_graph(content)
+    order = _topological(graph)
+
+    best_path = worst_path = None
+    exact = None
+    if order is not None:
+        best, worst = _path_extremes(graph, order, graph.totals)
+        if 0 in best:
+            best_path, worst_path = float(best[0]), float(worst[0])
+        # The early finish depends on the categories so far, which the per-stage totals don't carry
+        category_best, _ = _path_extremes(graph, order, graph.gains)
+        early_finish = 0 in category_best and (category_best[0] >= EARLY_FINISH_POINTS).all()
+        if method != 'sampled' and not early_finish:
+            exact = _exact(graph, order)
+
+    if exact is not None:
+        method = 'exact'
+        totals, weights, statuses, reach = exact
+    else:
+        method = 'sampled'
+        totals, weights, statuses, reach = _sample(graph, runs, np.random.default_rng(seed))
+
+    # play.html: Math.round(Math.min(total, maxPoints))
+    scores = np.floor(np.minimum(totals, max_points) + 0.5)
+    completed = float(weights.sum())
+    report = {
+        'method': method,
+        'runs': runs if method == 'sampled' else None,
+        'max_points': max_points,
+        'best_path': best_path,
+        'worst_path': worst_path,
+        'completed': round(completed, 6),
+        'stuck': round(float(statuses[STUCK_AT]), 6),
+        'looping': round(float(statuses[LOOPING]), 6),
+        'stages': [{'index': index, 'name': name, 'reach': round(float(reach[index]), 6)}
+                   for index, name in enumerate(graph.names)],
+    }
+
+    bands = ('success', 'partial_success', 'failure')
+    if completed > 0:
+        shares = weights / completed
+        outcome = np.where(scores >= TrainingSession.SUCCESS_SCORE, 0,
+                           np.where(scores >= TrainingSession.PARTIAL_SUCCESS_SCORE, 1, 2))
+        counts, edges = np.histogram(scores, bins=min(HISTOGRAM_BINS, max_points + 1),
+                                     range=(0, max_points), weights=shares)
+        report.update({
+            'mean': round(float(scores @ shares), 2),
+            'percentiles': {f'p{int(fraction * 100)}': _percentile(scores, shares, fraction)
+                            for fraction in (0.1, 0.5, 0.9)},
+            'capped': round(float(shares[totals > max_points].sum()), 6),
+            'outcomes': {band: round(float(shares[outcome == number].sum()), 6)
+                         for number, band in enumerate(bands)},
+            'histogram': [{'from': round(float(low), 1), 'to': round(float(high), 1),
+                           'probability': round(float(count), 6)}
+                          for low, high, count in zip(edges[:-1], edges[1:], counts)],
+        })
+    else:
+        report.update({'mean': None, 'percentiles': None, 'capped': 0.0,
+                       'outcomes': dict.fromkeys(bands, 0.0), 'histogram': []})
+
+    report['warnings'] = _warnings(report)
+    report['seconds'] = round(time.perf_counter() - started, 4)
+    return report
+
+
+def _warnings(report):
+    """Plain-language problems with the scenario's scoring or branching"""
+    warnings = []
+    max_points, best_path = report['max_points'], report['best_path']
+    success = TrainingSession.SUCCESS_SCORE
+    if max_points < success:
+        warnings.append(f'Max points ({max_points}) is below the success score ({success}), so nobody can succeed.')
+    elif best_path is not None and best_path < success:
+        warnings.append(f'The best path earns {best_path:g} points, below the success score ({success}).')
+    if best_path is not None and best_path > max_points:
+        warnings.append(f'The best path earns {best_path:g} points but scores are capped at {max_points}.')
+    elif best_path is not None and best_path < max_points:
+        warnings.append(f'No path reaches max points ({max_points}); the best earns {best_path:g}.')
+    unreached = [stage['name'] for stage in report['stages'] if stage['reach'] == 0]
+    if unreached:
+        warnings.append(f'Never reached: {", ".join(unreached[:10])}{" ..." if len(unreached) > 10 else ""}.')
+    if report['stuck']:
+        warnings.append(f'{report["stuck"]:.1%} of playthroughs get stuck at a stage without options '
+                        f'or on a "next" the player can\'t follow.')
+    if report['looping']:
+        warnings.append(f'{report["looping"]:.1%} of playthroughs were still going after {MAX_STEPS} decisions '
+                        f'- check for "next" loops.')
+    return warnings
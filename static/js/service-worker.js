@@ -1,66 +1,314 @@
 // Don't Panic Service Worker
-const CACHE_NAME = 'dont-panic-v1';
-const urlsToCache = [
-    '/',
-    '/static/css/main.css',
-    '/static/js/main.js',
-    '/static/img/Don\'t Panic logo.png',
-    '/templates/index.html',
-];
+// Served from /service-worker.js - the server prepends ASSET_VERSION and
+// PRECACHE_URLS from the asset manifest, so the cache name changes
+// automatically whenever any static file changes.
+//
+// Strategies by route:
+//   /static/<name>.<hash>.<ext>       cache-first (hashed files never change)
+//   /scenarios/versions/<hash>.json   cache-first, LRU-bounded (versions never change)
+//   /scenarios/<id>/content.json      stale-while-revalidate, LRU-bounded
+//   /, /dashboard, /scenarios/, play  network-first, cached for offline use
+//   /admin/*, /auth/*, /teams/*,      network only - never cached (team
+//   everything else                   state must be live)
+//   POST submit / complete            queued in IndexedDB when offline (or
+//                                     refused with 429) and replayed in
+//                                     order once back online / after Retry-After
+const STATIC_CACHE = 'dont-panic-static-' + (self.ASSET_VERSION || 'dev');
+const SCENARIO_CACHE = 'dont-panic-scenarios-v1';
+const PAGE_CACHE = 'dont-panic-pages-v1';
+const KEEP_CACHES = [STATIC_CACHE, SCENARIO_CACHE, PAGE_CACHE];
+const urlsToCache = self.PRECACHE_URLS || ['/'];
+
+const MAX_SCENARIO_ENTRIES = 50;
+const MAX_PAGE_ENTRIES = 20;
+
+const HASHED_STATIC = /^\/static\/.+\.[0-9a-f]{10}\.[a-z0-9]+$/i;
+const SCENARIO_JSON = /^\/scenarios\/\d+\/content\.json$/;
+const SCENARIO_VERSION_JSON = /^\/scenarios\/versions\/[0-9a-f]{64}\.json$/;
+const OFFLINE_PAGES = /^\/(dashboard|scenarios\/|scenarios\/session\/\d+)?$/;
+const QUEUEABLE_POSTS = /^\/scenarios\/session\/\d+\/(submit|complete)$/;
+
+const QUEUE_DB = 'dont-panic-offline';
+const QUEUE_STORE = 'requests';
+const SYNC_TAG = 'replay-decisions';
 
 // Install event
 self.addEventListener('install', event => {
     event.waitUntil(
-        caches.open(CACHE_NAME)
+        caches.open(STATIC_CACHE)
             .then(cache => cache.addAll(urlsToCache))
             .catch(err => console.log('Cache failed:', err))
     );
     self.skipWaiting();
 });
 
-// Activate event
+// Activate event - drop caches from older asset versions
 self.addEventListener('activate', event => {
     event.waitUntil(
         caches.keys().then(cacheNames => {
             return Promise.all(
                 cacheNames.map(cacheName => {
-                    if (cacheName !== CACHE_NAME) {
+                    if (!KEEP_CACHES.includes(cacheName)) {
                         return caches.delete(cacheName);
                     }
                 })
             );
-        })
+        }).then(() => replayQueue())
     );
     self.clients.claim();
 });
 
-// Fetch event - Network first, fallback to cache
+// Fetch event - route to a strategy
 self.addEventListener('fetch', event => {
-    // Skip non-GET requests
+    const url = new URL(event.request.url);
+    if (url.origin !== self.location.origin) {
+        return;
+    }
+
+    if (event.request.method === 'POST') {
+        if (QUEUEABLE_POSTS.test(url.pathname)) {
+            event.respondWith(postOrQueue(event.request));
+        }
+        return;
+    }
+
     if (event.request.method !== 'GET') {
         return;
     }
 
-    event.respondWith(
-        fetch(event.request)
-            .then(response => {
-                // Cache successful responses
-                if (!response || response.status !== 200 || response.type === 'error') {
-                    return response;
-                }
+    // Logging out must not leave one user's pages behind for the next
+    if (url.pathname === '/auth/logout') {
+        event.waitUntil(Promise.all([caches.delete(PAGE_CACHE), caches.delete(SCENARIO_CACHE)]));
+        return;
+    }
 
-                const responseToCache = response.clone();
-                caches.open(CACHE_NAME)
-                    .then(cache => {
-                        cache.put(event.request, responseToCache);
-                    });
+    if (HASHED_STATIC.test(url.pathname)) {
+        event.respondWith(cacheFirst(event.request, STATIC_CACHE));
+    } else if (SCENARIO_VERSION_JSON.test(url.pathname)) {
+        event.respondWith(cacheFirst(event.request, SCENARIO_CACHE, MAX_SCENARIO_ENTRIES));
+    } else if (SCENARIO_JSON.test(url.pathname)) {
+        event.respondWith(staleWhileRevalidate(event, SCENARIO_CACHE, MAX_SCENARIO_ENTRIES));
+    } else if (event.request.mode === 'navigate' && OFFLINE_PAGES.test(url.pathname)) {
+        event.respondWith(networkFirst(event.request, PAGE_CACHE, MAX_PAGE_ENTRIES));
+    }
+    // Anything else (admin, auth, unhashed static) goes straight to the network
+});
 
+// Background Sync (where supported) and pages coming back online
+self.addEventListener('sync', event => {
+    if (event.tag === SYNC_TAG) {
+        event.waitUntil(replayQueue());
+    }
+});
+
+self.addEventListener('message', event => {
+    if (event.data && event.data.type === 'replay-queue') {
+        event.waitUntil(replayQueue());
+    }
+});
+
+// ========================
+// Caching strategies
+// ========================
+// maxEntries bounds the cache as an LRU; without it entries are kept
+// until the cache itself is replaced
+function cacheFirst(request, cacheName, maxEntries) {
+    return caches.open(cacheName).then(cache =>
+        cache.match(request).then(cached => {
+            if (cached) {
+                return maxEntries ? touchLru(cache, request, cached, maxEntries) : cached;
+            }
+            return fetch(request).then(response => {
+                if (response.ok && !response.redirected) {
+                    if (maxEntries) {
+                        return putLru(cache, request, response.clone(), maxEntries).then(() => response);
+                    }
+                    cache.put(request, response.clone());
+                }
                 return response;
-            })
-            .catch(() => {
-                // Return cached version if network fails
-                return caches.match(event.request)
-                    .then(response => response || new Response('Offline - content not available'));
-            })
+            });
+        })
     );
-});
+}
+
+function staleWhileRevalidate(event, cacheName, maxEntries) {
+    return caches.open(cacheName).then(cache =>
+        cache.match(event.request).then(cached => {
+            const refresh = fetch(event.request).then(response => {
+                if (response.ok) {
+                    return putLru(cache, event.request, response.clone(), maxEntries)
+                        .then(() => response);
+                }
+                return response;
+            });
+
+            if (cached) {
+                // Serve the cached copy now, refresh it in the background
+                event.waitUntil(refresh.catch(() => {}));
+                return touchLru(cache, event.request, cached, maxEntries);
+            }
+            return refresh;
+        })
+    );
+}
+
+function networkFirst(request, cacheName, maxEntries) {
+    return fetch(request)
+        .then(response => {
+            // Redirects (e.g. to the login page) are never cached
+            if (response.ok && !response.redirected) {
+                caches.open(cacheName)
+                    .then(cache => putLru(cache, request, response.clone(), maxEntries));
+            }
+            return response;
+        })
+        .catch(() => {
+            return caches.match(request)
+                .then(response => response || new Response('Offline - content not available', {
+                    status: 503,
+                    headers: { 'Content-Type': 'text/plain' }
+                }));
+        });
+}
+
+// Cache.keys() lists entries in insertion order, so re-inserting an entry
+// moves it to the back and the oldest entries sit at the front.
+function putLru(cache, request, response, maxEntries) {
+    return cache.delete(request)
+        .then(() => cache.put(request, response))
+        .then(() => cache.keys())
+        .then(keys => Promise.all(
+            keys.slice(0, Math.max(0, keys.length - maxEntries)).map(key => cache.delete(key))
+        ));
+}
+
+function touchLru(cache, request, cached, maxEntries) {
+    return putLru(cache, request, cached.clone(), maxEntries).then(() => cached);
+}
+
+// ========================
+// Offline decision queue
+// ========================
+function openQueue() {
+    return new Promise((resolve, reject) => {
+        const open = indexedDB.open(QUEUE_DB, 1);
+        open.onupgradeneeded = () => {
+            open.result.createObjectStore(QUEUE_STORE, { keyPath: 'id', autoIncrement: true });
+        };
+        open.onsuccess = () => resolve(open.result);
+        open.onerror = () => reject(open.error);
+    });
+}
+
+function queueTransaction(mode, work) {
+    return openQueue().then(db => new Promise((resolve, reject) => {
+        const tx = db.transaction(QUEUE_STORE, mode);
+        const result = work(tx.objectStore(QUEUE_STORE));
+        tx.oncomplete = () => resolve(result && 'result' in result ? result.result : undefined);
+        tx.onerror = () => reject(tx.error);
+    }));
+}
+
+function enqueue(entry) {
+    return queueTransaction('readwrite', store => store.add(entry));
+}
+
+function queuedEntries() {
+    return queueTransaction('readonly', store => store.getAll());
+}
+
+function dequeue(id) {
+    return queueTransaction('readwrite', store => store.delete(id));
+}
+
+function queuedResponse(reason) {
+    const body = reason === 'busy'
+        ? { success: true, queued: true, reason: 'busy', message: 'Server busy - will retry shortly' }
+        : { success: true, queued: true, reason: 'offline', message: 'Saved offline - will sync when back online' };
+    return new Response(JSON.stringify(body), {
+        status: 202,
+        headers: { 'Content-Type': 'application/json' }
+    });
+}
+
+function postOrQueue(request) {
+    return request.clone().text().then(body => {
+        const entry = {
+            url: request.url,
+            body: body,
+            contentType: request.headers.get('Content-Type') || 'application/json',
+            queuedAt: Date.now()
+        };
+
+        // Keep decisions in order: once something is queued, queue behind it
+        return queuedEntries().then(pending => {
+            if (pending.length > 0) {
+                return enqueue(entry).then(() => {
+                    replayQueue();
+                    return queuedResponse();
+                });
+            }
+            return fetch(request).then(response => {
+                if (response.status !== 429) {
+                    return response;
+                }
+                // Rate limited - keep it and send it again once the server says so
+                return enqueue(entry).then(() => {
+                    retryAfter(response);
+                    return queuedResponse('busy');
+                });
+            }).catch(() =>
+                enqueue(entry)
+                    .then(() => self.registration.sync && self.registration.sync.register(SYNC_TAG))
+                    .catch(() => {})
+                    .then(() => queuedResponse())
+            );
+        });
+    });
+}
+
+let replaying = null;
+let retryTimer = null;
+
+function retryAfter(response) {
+    const seconds = parseInt(response.headers.get('Retry-After'), 10) || 5;
+    clearTimeout(retryTimer);
+    retryTimer = setTimeout(replayQueue, seconds * 1000);
+}
+
+function replayQueue() {
+    // One replay at a time, otherwise entries could be sent twice
+    if (!replaying) {
+        replaying = replayNext().finally(() => { replaying = null; });
+    }
+    return replaying;
+}
+
+function replayNext() {
+    return queuedEntries().then(pending => {
+        if (pending.length === 0) {
+            return;
+        }
+        const entry = pending[0];
+        return fetch(entry.url, {
+            method: 'POST',
+            body: entry.body,
+            headers: { 'Content-Type': entry.contentType },
+            credentials: 'same-origin',
+            redirect: 'manual'
+        }).then(response => {
+            if (response.type === 'opaqueredirect' || response.status >= 500) {
+                // Logged out or server trouble - keep it and try again later
+                return;
+            }
+            if (response.status === 429) {
+                retryAfter(response);
+                return;
+            }
+            // Success, or a 4xx the server will never accept (e.g. 403)
+            return dequeue(entry.id).then(() => replayNext());
+        });
+    }).catch(() => {
+        // Still offline - the next sync or 'online' event retries
+    });
+}
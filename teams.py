@@ -0,0 +1,320 @@
+"""
+Team exercises
+Several trainees play one scenario together. Each member owns roles - the
+score categories, e.g. communication or containment - and the member
+owning a stage's role (scenario_content.stage_roles) makes its decision.
+Stages whose role nobody owns are open to the whole team.
+
+The shared state is one team_exercises row. Every change to it - a join, a
+role claim, a decision - is a compare-and-swap on its version column
+(TeamExercise.compare_and_swap): UPDATE ... WHERE version = <version read>.
+Nothing is locked while a decision is worked out, so teams never wait on
+each other and a slow request can't hold up its teammates. A write based
+on a stale read changes nothing: decisions are refused with 409 and the
+current state (the stage was already decided), joins and role claims are
+retried on a fresh read.
+
+Teammates see each other's changes by polling state.json every
+TEAM_POLL_SECONDS with the version as ETag - an unchanged exercise costs
+one indexed read and a 304.
+
+When play ends each member gets an ordinary completed TrainingSession with
+the team's score, so results pages, leaderboards, cohort rollups and skill
+profiles work as for solo play.
+"""
+
+import json
+import math
+import secrets
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from types import SimpleNamespace
+
+from flask import current_app, url_for
+from sqlalchemy.orm import joinedload
+
+from metrics import SESSIONS_STARTED, SESSIONS_COMPLETED, TEAM_CONFLICTS
+from models import (db, CohortRollup, LeaderboardEntry, ScenarioVersion, TeamDecision, TeamExercise,
+                    TeamMember, TrainingSession)
+from recommender import record_completion
+from scenario_content import CATEGORIES, js_int, parse, stage_roles
+from simulator import EARLY_FINISH_POINTS, compile_graph
+
+CODE_ALPHABET = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'  # No 0/O or 1/I
+CODE_LENGTH = 6
+PLAY_CACHE_SIZE = 256  # Compiled versions kept per worker
+
+
+class TeamError(Exception):
+    """A refused team action; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+# Versions never change, so their compiled graph is kept by hash (the same in every organisation)
+_plays = OrderedDict()
+_plays_lock = threading.Lock()
+
+
+def _play(version_hash):
+    """Option graph, raw option points, stage roles and max points of a scenario version"""
+    with _plays_lock:
+        play = _plays.get(version_hash)
+        if play is not None:
+            _plays.move_to_end(version_hash)
+            return play
+
+    version = db.session.get(ScenarioVersion, version_hash)
+    stages = parse(version.scenario_content).get('stages')
+    stages = [stage if isinstance(stage, dict) else {} for stage in stages] if isinstance(stages, list) else []
+    play = SimpleNamespace(
+        graph=compile_graph(version.scenario_content),
+        points=[[js_int(option.get('points')) if isinstance(option, dict) else 0 for option in stage['options']]
+                if isinstance(stage.get('options'), list) else [] for stage in stages],
+        roles=stage_roles(version.scenario_content),
+        max_points=version.max_points or 100,
+    )
+    with _plays_lock:
+        _plays[version_hash] = play
+        while len(_plays) > PLAY_CACHE_SIZE:
+            _plays.popitem(last=False)
+    return play
+
+
+def _js_round(value):
+    """Math.round, as play.html rounds scores"""
+    return int(math.floor(value + 0.5))
+
+
+def _with_retries(action, attempt):
+    """Commit attempt()'s result; None means its compare-and-swap lost, so read again and retry"""
+    for _ in range(current_app.config['TEAM_CAS_RETRIES']):
+        result = attempt()
+        if result is not None:
+            db.session.commit()
+            return result
+        db.session.rollback()
+        TEAM_CONFLICTS.inc(action=action)
+    raise TeamError('The team is busy - please try again', 409)
+
+
+def load(exercise_id, user_id):
+    """The exercise and its members (with users); TeamError unless user_id is one of them"""
+    exercise = db.session.get(TeamExercise, exercise_id)
+    if exercise is None:
+        raise TeamError('No such team exercise', 404)
+    members = TeamMember.query.options(joinedload(TeamMember.user)).filter_by(
+        exercise_id=exercise_id).order_by(TeamMember.joined_at).all()
+    if not any(member.user_id == user_id for member in members):
+        raise TeamError('You are not in this team', 403)
+    return exercise, members
+
+
+def create(scenario, user_id):
+    """Start a team exercise on the scenario's current version with user_id as its first member; returns its id"""
+    if scenario.version_hash is None:
+        scenario.publish()  # Scenarios created before versioning get their first version now
+
+    join_code = None
+    while join_code is None or TeamExercise.query.filter_by(join_code=join_code).first():
+        join_code = ''.join(secrets.choice(CODE_ALPHABET) for _ in range(CODE_LENGTH))
+
+    exercise = TeamExercise(scenario_id=scenario.id, version_hash=scenario.version_hash,
+                            created_by=user_id, join_code=join_code)
+    db.session.add(exercise)
+    db.session.flush()
+    db.session.add(TeamMember(exercise_id=exercise.id, user_id=user_id))
+    CohortRollup.record_start(user_id, scenario.id)
+    exercise_id, scenario_id = exercise.id, scenario.id
+    db.session.commit()
+    SESSIONS_STARTED.inc(scenario_id=scenario_id)
+    return exercise_id
+
+
+def join(join_code, user_id):
+    """Add user_id to the exercise with this code (no-op if they're in it); returns its id"""
+    join_code = (join_code or '').strip().upper()
+
+    def attempt():
+        exercise = TeamExercise.query.filter_by(join_code=join_code).first()
+        if exercise is None:
+            raise TeamError('No team exercise has that code', 404)
+        if db.session.get(TeamMember, (exercise.id, user_id)) is not None:
+            return exercise.id, None
+        if exercise.status != 'in_progress':
+            raise TeamError('That team exercise has finished', 409)
+        if TeamMember.query.filter_by(exercise_id=exercise.id).count() >= current_app.config['TEAM_MAX_MEMBERS']:
+            raise TeamError('That team is full', 409)
+        # The version check keeps two late joiners from both taking the last place
+        if not TeamExercise.compare_and_swap(exercise.id, exercise.version):
+            return None
+        db.session.add(TeamMember(exercise_id=exercise.id, user_id=user_id))
+        CohortRollup.record_start(user_id, exercise.scenario_id)
+        return exercise.id, exercise.scenario_id
+
+    exercise_id, scenario_id = _with_retries('join', attempt)
+    if scenario_id is not None:
+        SESSIONS_STARTED.inc(scenario_id=scenario_id)
+    return exercise_id
+
+
+def claim_roles(exercise_id, user_id, roles):
+    """Make `roles` (categories) exactly the ones user_id owns; TeamError if a teammate owns one"""
+    unknown = set(roles) - set(CATEGORIES)
+    if unknown:
+        raise TeamError(f'Unknown roles: {", ".join(sorted(map(str, unknown)))}')
+    roles = [category for category in CATEGORIES if category in roles]
+
+    def attempt():
+        exercise, members = load(exercise_id, user_id)
+        if exercise.status != 'in_progress':
+            raise TeamError('This team exercise has finished', 409)
+        me = next(member for member in members if member.user_id == user_id)
+        for member in members:
+            taken = [role for role in member.role_list() if role in roles]
+            if member is not me and taken:
+                raise TeamError(f'{member.user.username} already owns {taken[0]}', 409)
+        if me.role_list() == roles:
+            return exercise_id
+        if not TeamExercise.compare_and_swap(exercise.id, exercise.version):
+            return None
+        me.roles = ','.join(roles)
+        return exercise_id
+
+    _with_retries('claim_roles', attempt)
+
+
+def decide(exercise_id, user_id, stage, option, version=None):
+    """Apply a member's decision to the shared state; returns the new state
+
+    `version` is the one the member was shown - if a teammate changed the
+    exercise since, nothing is applied (TeamError 409).
+    """
+    exercise, members = load(exercise_id, user_id)
+    if exercise.status != 'in_progress':
+        raise TeamError('This team exercise has finished', 409)
+    if (version is not None and version != exercise.version) or stage != exercise.stage_index:
+        raise TeamError('A teammate changed the exercise first', 409)
+
+    play = _play(exercise.version_hash)
+    graph = play.graph
+    if not 0 <= stage < len(graph.n_options) or not 0 <= option < graph.n_options[stage]:
+        raise TeamError('No such option')
+    role = play.roles[stage]
+    owner = next((member for member in members if role in member.role_list()), None)
+    if owner is not None and owner.user_id != user_id:
+        raise TeamError(f'{owner.user.username} owns {role} and makes this decision', 403)
+
+    now = datetime.utcnow()
+    metrics = [float(points + gain) for points, gain in zip(exercise.metrics(), graph.gains[stage, option])]
+    target = int(graph.next[stage, option])
+    # Ends where play.html would: END, every category at the early finish, or nowhere left to go
+    finished = target < 0 or graph.n_options[target] == 0 or all(points >= EARLY_FINISH_POINTS for points in metrics)
+    values = dict(zip(CATEGORIES, metrics))
+    if finished:
+        values.update(status='completed', completed_at=now,
+                      score=_js_round(min(sum(metrics), play.max_points)))
+    else:
+        values['stage_index'] = target
+
+    if not TeamExercise.compare_and_swap(exercise.id, exercise.version, **values):
+        db.session.rollback()
+        TEAM_CONFLICTS.inc(action='decide')
+        raise TeamError('A teammate changed the exercise first', 409)
+
+    decision = TeamDecision(exercise_id=exercise.id, seq=exercise.version + 1, user_id=user_id, role=role,
+                            stage=stage, option=option, points=play.points[stage][option], recorded_at=now)
+    db.session.add(decision)
+
+    # Read everything for the response before commit - the stale exercise row must not be reloaded
+    after = SimpleNamespace(**{column.key: getattr(exercise, column.key) for column in TeamExercise.__table__.columns})
+    vars(after).update(values, version=exercise.version + 1, updated_at=now)
+    sessions = _complete(exercise, members, after, play.max_points) if finished else []
+    completed_labels = [dict(scenario_id=session.scenario_id, outcome=session.outcome) for session in sessions]
+    result = state(after, members, user_id, [decision])
+    db.session.commit()
+
+    for labels in completed_labels:
+        SESSIONS_COMPLETED.inc(**labels)
+    return result
+
+
+def _complete(exercise, members, after, max_points):
+    """A completed TrainingSession per member with the team's score, folded into rollups and boards"""
+    decisions = TeamDecision.query.filter_by(exercise_id=exercise.id).order_by(TeamDecision.seq).all()
+    log = [{'decision': {'stage': d.stage, 'option': d.option, 'points': d.points},
+            'recorded_at': d.recorded_at.isoformat(), 'user_id': d.user_id, 'role': d.role}
+           for d in decisions]
+    categories = {f'{category}_score': _js_round(min(getattr(after, category), max_points)) for category in CATEGORIES}
+
+    sessions = []
+    for member in members:
+        session = TrainingSession(
+            user_id=member.user_id, scenario_id=exercise.scenario_id, version_hash=exercise.version_hash,
+            status='completed', started_at=member.joined_at, completed_at=after.completed_at,
+            time_taken=int((after.completed_at - member.joined_at).total_seconds()),
+            score=after.score, outcome=TrainingSession.outcome_for(after.score),
+            session_data=json.dumps({'team_exercise': exercise.id, 'roles': member.role_list(), 'decisions': log},
+                                    separators=(',', ':')),
+            **categories)
+        db.session.add(session)
+        sessions.append(session)
+    db.session.flush()
+
+    for member, session in zip(members, sessions):
+        member.session_id = session.id
+        CohortRollup.record_completion(session)
+        LeaderboardEntry.record(session.user_id, session.scenario_id, session.score, session.completed_at)
+        record_completion(session)
+    return sessions
+
+
+def version_for(exercise_id, user_id):
+    """The exercise's version if user_id is a member, else None - all a poll needs to answer 304"""
+    return db.session.execute(
+        db.select(TeamExercise.version)
+        .join(TeamMember, TeamMember.exercise_id == TeamExercise.id)
+        .where(TeamExercise.id == exercise_id, TeamMember.user_id == user_id)
+    ).scalar()
+
+
+def current_state(exercise_id, user_id, since=0):
+    """State for a member, with the decisions made after version `since`"""
+    exercise, members = load(exercise_id, user_id)
+    decisions = []
+    if since < exercise.version:
+        decisions = TeamDecision.query.filter(TeamDecision.exercise_id == exercise_id,
+                                              TeamDecision.seq > since).order_by(TeamDecision.seq).all()
+    return state(exercise, members, user_id, decisions)
+
+
+def state(exercise, members, user_id, decisions):
+    """JSON-able team state as the member user_id sees it"""
+    play = _play(exercise.version_hash)
+    names = {member.user_id: member.user.username for member in members}
+    me = next(member for member in members if member.user_id == user_id)
+
+    playing = exercise.status == 'in_progress'
+    role = play.roles[exercise.stage_index] if playing and exercise.stage_index < len(play.roles) else None
+    owner = next((member for member in members if role and role in member.role_list()), None)
+    return {
+        'id': exercise.id,
+        'version': exercise.version,
+        'status': exercise.status,
+        'join_code': exercise.join_code,
+        'stage': exercise.stage_index,
+        'stage_role': role,
+        'stage_owner': owner.user.username if owner else None,
+        'can_decide': playing and (owner is None or owner.user_id == user_id),
+        'metrics': {category: round(getattr(exercise, category) or 0, 1) for category in CATEGORIES},
+        'score': exercise.score,
+        'members': [{'username': member.user.username, 'roles': member.role_list(), 'you': member is me}
+                    for member in members],
+        'decisions': [{'seq': d.seq, 'username': names.get(d.user_id), 'role': d.role,
+                       'stage': d.stage, 'option': d.option, 'points': d.points,
+                       'recorded_at': d.recorded_at.isoformat()} for d in decisions],
+        'results_url': url_for('scenarios.results', session_id=me.session_id) if me.session_id else None,
+    }
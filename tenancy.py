@@ -0,0 +1,403 @@
+"""
+Multi-tenant organisations
+Each client organisation has its own database, so one client's reporting
+load can't slow the others down. The control database
+(SQLALCHEMY_DATABASE_URI) holds the shard map - the organisations table -
+and still serves every request that doesn't name an organisation, so a
+single-tenant install works as before.
+
+Per request, the organisation comes from:
+- the subdomain: acme.<TENANT_DOMAIN> (TENANT_DOMAIN defaults to the domain in CNAME)
+- or the TENANT_HEADER header, if a trusted proxy sets it
+Unknown organisations get 404, suspended ones 403, and ones being moved 503
+with Retry-After. Shard map lookups are cached for TENANT_CACHE_SECONDS.
+
+Shards (TENANT_SHARDS) are database URL templates with a {tenant}
+placeholder: a directory of SQLite files, or a PostgreSQL server with one
+database per organisation. Engines are made on first use with the shard's
+pool options. Past TENANT_MAX_ENGINES, the least recently used is disposed.
+models.TenantSession points db.session at g.tenant.engine. Control tables
+always use the control database.
+
+Organisations are created and moved between shards with
+scripts/manage_tenants.py.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from types import SimpleNamespace
+
+from flask import abort, current_app, g, render_template, request
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.engine import make_url
+
+from models import db, CONTROL_TABLES, Organisation, User, tenant_key
+import search
+
+SLUG = re.compile(r'[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?')
+RESERVED_SLUGS = {'www', 'api', 'admin', 'static', 'mail'}
+UNTENANTED_ENDPOINTS = ('static', 'metrics')  # Served the same for every organisation
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+class TenantError(Exception):
+    """An organisation can't be created or moved as asked"""
+
+
+def tenant_tables():
+    """Tables in each organisation database, in foreign key order"""
+    return [table for table in db.metadata.sorted_tables if table.name not in CONTROL_TABLES]
+
+
+def _cname_domain():
+    try:
+        with open(os.path.join(ROOT, 'CNAME'), encoding='utf-8') as f:
+            return f.read().strip().lower() or None
+    except OSError:
+        return None
+
+
+# ========================
+# Shard engines
+# ========================
+class ShardEngines:
+    """One pooled engine per organisation database, made on first use
+
+    TENANT_SHARDS values are a URL template, or a dict with 'url' and engine
+    options for that shard (pool_size, max_overflow, ...) over
+    TENANT_ENGINE_OPTIONS.
+    """
+
+    def __init__(self, shards, options=None, max_engines=200):
+        self.shards = {}
+        for name, spec in shards.items():
+            spec = dict(spec) if isinstance(spec, dict) else {'url': spec}
+            if '{tenant}' not in spec.get('url', ''):
+                raise ValueError(f'TENANT_SHARDS[{name!r}]: the URL needs a {{tenant}} placeholder')
+            self.shards[name] = spec
+        self.options = dict(options or {})
+        self.max_engines = max_engines
+        self._engines = OrderedDict()  # (shard, slug) -> engine, least recently used first
+        self._lock = threading.Lock()
+
+    def url(self, shard, slug):
+        if shard not in self.shards:
+            raise TenantError(f'unknown shard {shard!r} (TENANT_SHARDS has {", ".join(sorted(self.shards))})')
+        return self.shards[shard]['url'].format(tenant=slug)
+
+    def get(self, shard, slug):
+        key = (shard, slug)
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is not None:
+                self._engines.move_to_end(key)
+                return engine
+
+            url = make_url(self.url(shard, slug))
+            if url.get_backend_name() == 'sqlite' and url.database:
+                os.makedirs(os.path.dirname(os.path.abspath(url.database)), exist_ok=True)
+            options = {**self.options, **{k: v for k, v in self.shards[shard].items() if k != 'url'}}
+            engine = self._engines[key] = create_engine(url, **options)
+            while len(self._engines) > self.max_engines:
+                # Connections in use finish normally; the pool is closed as they come back
+                self._engines.popitem(last=False)[1].dispose()
+            return engine
+
+    def dispose(self, shard, slug):
+        with self._lock:
+            engine = self._engines.pop((shard, slug), None)
+        if engine is not None:
+            engine.dispose()
+
+
+# ========================
+# Resolution
+# ========================
+class TenantResolver:
+    """Finds the request's organisation and points db.session at its database"""
+
+    def __init__(self, engines, domain=None, header=None, cache_seconds=30):
+        self.engines = engines
+        self.domain = domain.lower().strip('.') if domain else None
+        self.header = header
+        self.cache_seconds = cache_seconds
+        self._cache = {}  # slug -> (expires, (id, shard, status) or None)
+        self._lock = threading.Lock()
+
+    def slug(self):
+        """Organisation slug named by the request, or None for the control database"""
+        if self.header:
+            named = request.headers.get(self.header, '').strip().lower()
+            if named:
+                return named
+        host = request.host.rsplit(':', 1)[0].lower()
+        if self.domain and host.endswith('.' + self.domain):
+            sub = host[:-len(self.domain) - 1]
+            return None if sub == 'www' else sub
+        return None
+
+    def lookup(self, slug):
+        """(id, shard, status) from the shard map, cached; None if there's no such organisation"""
+        now = time.monotonic()
+        cached = self._cache.get(slug)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        row = None
+        if SLUG.fullmatch(slug):
+            with db.engine.connect() as connection:  # The control database, outside the request's session
+                row = connection.execute(db.select(Organisation.id, Organisation.shard, Organisation.status)
+                                         .where(Organisation.slug == slug)).first()
+        entry = tuple(row) if row is not None else None
+        with self._lock:
+            self._cache[slug] = (now + self.cache_seconds, entry)
+            if len(self._cache) > 10_000:  # Bound lookups of made-up subdomains
+                self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+        return entry
+
+    def forget(self, slug):
+        with self._lock:
+            self._cache.pop(slug, None)
+
+    def tenant(self, slug, organisation_id, shard):
+        return SimpleNamespace(slug=slug, id=organisation_id, shard=shard, engine=self.engines.get(shard, slug))
+
+    def resolve(self):
+        """before_request hook: sets g.tenant, or refuses the request"""
+        if request.endpoint in UNTENANTED_ENDPOINTS:
+            return None
+        slug = self.slug()
+        if slug is None:
+            return None
+        entry = self.lookup(slug)
+        if entry is None:
+            abort(404)
+        organisation_id, shard, status = entry
+        if status == 'suspended':
+            abort(403)
+        if status != 'active':
+            response = current_app.make_response((render_template('errors/503.html'), 503))
+            response.headers['Retry-After'] = str(max(1, self.cache_seconds))
+            return response
+        g.tenant = self.tenant(slug, organisation_id, shard)
+        return None
+
+
+def _resolver(app=None):
+    return (app or current_app).extensions['tenancy']
+
+
+@contextmanager
+def tenant_context(app, organisation):
+    """A fresh app context (and db.session) serving `organisation`; None for the control database
+
+    For scripts and scheduled jobs.
+    """
+    with app.app_context():
+        if organisation is not None:
+            g.tenant = _resolver(app).tenant(organisation.slug, organisation.id, organisation.shard)
+        try:
+            yield g.get('tenant')
+        finally:
+            db.session.remove()
+
+
+def active_organisations(app):
+    """Organisations that are being served, from the control database"""
+    with app.app_context():
+        organisations = Organisation.query.filter_by(status='active').order_by(Organisation.slug).all()
+        db.session.expunge_all()
+        return organisations
+
+
+def for_each_tenant(app, func):
+    """{slug: func(app)} run against each active organisation database; errors are reported, not raised"""
+    results = {}
+    for organisation in active_organisations(app):
+        with tenant_context(app, organisation):
+            try:
+                results[organisation.slug] = func(app)
+            except Exception as e:
+                db.session.rollback()
+                app.logger.exception(f"{func.__name__} failed for organisation {organisation.slug}")
+                results[organisation.slug] = f'{type(e).__name__}: {e}'
+    return results
+
+
+def tenant_dir(directory):
+    """Per-organisation subdirectory of a data directory (the directory itself for the control database)"""
+    slug = tenant_key()
+    return os.path.join(directory, 'tenants', slug) if slug else directory
+
+
+def login_user_id(login_id):
+    """User id from a Flask-Login id (see User.get_id), or None if it belongs to another organisation"""
+    slug, _, user_id = str(login_id).rpartition(':')
+    if slug != tenant_key() or not user_id.isdigit():
+        return None
+    return int(user_id)
+
+
+# ========================
+# Provisioning and moves
+# ========================
+def _prepare(engine):
+    """Create the organisation schema (idempotent); returns the search backend"""
+    db.metadata.create_all(engine, tables=tenant_tables())
+    return search.prepare_database(engine)
+
+
+def _row_counts(connection):
+    return {table.name: connection.execute(db.select(db.func.count()).select_from(table)).scalar()
+            for table in tenant_tables()}
+
+
+def create_organisation(app, slug, name, shard, admin_password=None):
+    """Add an organisation and set up its database with an 'admin' instructor; returns it"""
+    slug = slug.strip().lower()
+    if not SLUG.fullmatch(slug) or slug in RESERVED_SLUGS:
+        raise TenantError(f'{slug!r} is not a usable subdomain')
+    resolver = _resolver(app)
+    resolver.engines.url(shard, slug)  # Unknown shards fail before anything is written
+    if Organisation.query.filter_by(slug=slug).first() is not None:
+        raise TenantError(f'organisation {slug!r} already exists')
+
+    _prepare(resolver.engines.get(shard, slug))
+    organisation = Organisation(slug=slug, name=name, shard=shard, status='active')
+    with tenant_context(app, organisation):
+        if User.query.filter_by(role='instructor').first() is None:
+            admin = User(username='admin', email=f'admin@{slug}.invalid', role='instructor')
+            admin.set_password(admin_password or os.urandom(12).hex())
+            db.session.add(admin)
+            db.session.commit()
+    db.session.add(organisation)
+    db.session.commit()
+    resolver.forget(slug)
+    return organisation
+
+
+def set_password(app, slug, username, password):
+    """Set a user's password inside an organisation's database"""
+    organisation = Organisation.query.filter_by(slug=slug).first()
+    if organisation is None:
+        raise TenantError(f'no organisation {slug!r}')
+    with tenant_context(app, organisation):
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise TenantError(f'{slug} has no user {username!r}')
+        user.set_password(password)
+        db.session.commit()
+
+
+def _copy_table(source, target, table, batch_size):
+    copied = 0
+    result = source.execution_options(stream_results=True, yield_per=batch_size).execute(db.select(table))
+    for rows in result.mappings().partitions(batch_size):
+        target.execute(table.insert(), [dict(row) for row in rows])
+        copied += len(rows)
+    return copied
+
+
+def _reset_sequences(connection):
+    """PostgreSQL serial columns must continue after the copied ids"""
+    if connection.dialect.name != 'postgresql':
+        return
+    for table in tenant_tables():
+        column = table.autoincrement_column
+        if column is not None:
+            connection.execute(db.text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', '{column.name}'), "
+                f"COALESCE((SELECT MAX({column.name}) FROM {table.name}), 0) + 1, false)"))
+
+
+def move_organisation(app, slug, shard, drain_seconds=None, batch_size=1000, log=None):
+    """Copy an organisation's database to another shard and switch the shard map to it
+
+    The organisation answers 503 from the moment it is marked 'moving'. Then
+    drain_seconds passes (default TENANT_CACHE_SECONDS + 5) so every worker
+    has seen the mark and finished writing. The copy is checked row for row
+    before the switch. The old database is left in place. Returns a stats dict.
+    """
+    log = log or (lambda message: None)
+    resolver = _resolver(app)
+    organisation = Organisation.query.filter_by(slug=slug).first()
+    if organisation is None:
+        raise TenantError(f'no organisation {slug!r}')
+    if organisation.status != 'active':
+        raise TenantError(f'organisation {slug!r} is {organisation.status}')
+    if organisation.shard == shard:
+        raise TenantError(f'organisation {slug!r} is already on {shard!r}')
+    source_url = resolver.engines.url(organisation.shard, slug)
+    target_url = resolver.engines.url(shard, slug)
+    if make_url(source_url) == make_url(target_url):
+        raise TenantError(f'shards {organisation.shard!r} and {shard!r} map {slug!r} to the same database')
+
+    target = resolver.engines.get(shard, slug)
+    with target.connect() as connection:
+        existing = set(inspect(connection).get_table_names())
+        for table in tenant_tables():
+            if table.name in existing and connection.execute(db.select(table).limit(1)).first() is not None:
+                raise TenantError(f'{target_url} already has data for {slug!r}; remove it first')
+
+    started = time.perf_counter()
+    source_shard = organisation.shard
+    organisation.status = 'moving'
+    db.session.commit()
+    resolver.forget(slug)
+    drain = app.config['TENANT_CACHE_SECONDS'] + 5 if drain_seconds is None else drain_seconds
+    log(f"⏳ {slug} is read-only; waiting {drain}s for workers to notice")
+    time.sleep(drain)
+
+    try:
+        backend = _prepare(target)
+        source = resolver.engines.get(source_shard, slug)
+        copied = {}
+        with source.connect() as read, target.begin() as write:
+            for table in tenant_tables():
+                copied[table.name] = _copy_table(read, write, table, batch_size)
+                log(f"   {table.name}: {copied[table.name]:,} rows")
+            _reset_sequences(write)
+            expected = _row_counts(read)
+        if copied != expected:
+            raise TenantError(f'row counts changed during the copy: {expected} != {copied}')
+
+        moved = SimpleNamespace(slug=slug, id=organisation.id, shard=shard)
+        if backend:
+            with tenant_context(app, moved):
+                log(f"🔎 Search index rebuilt for {search.rebuild_index():,} scenarios")
+
+        organisation.shard = shard
+        organisation.status = 'active'
+        organisation.moved_at = datetime.utcnow()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        organisation.status = 'active'  # Back to serving from the source shard
+        db.session.commit()
+        raise
+    finally:
+        resolver.forget(slug)
+
+    resolver.engines.dispose(source_shard, slug)
+    return {'organisation': slug, 'from': source_shard, 'to': shard,
+            'rows': sum(copied.values()), 'tables': copied,
+            'source': make_url(source_url).render_as_string(hide_password=True),
+            'target': make_url(target_url).render_as_string(hide_password=True),
+            'seconds': round(time.perf_counter() - started, 2)}
+
+
+def init_tenancy(app):
+    """Resolve each request's organisation before anything touches the database (register after init_db)"""
+    engines = ShardEngines(app.config.get('TENANT_SHARDS', {}), app.config.get('TENANT_ENGINE_OPTIONS'),
+                           app.config.get('TENANT_MAX_ENGINES', 200))
+    resolver = TenantResolver(engines,
+                              domain=app.config.get('TENANT_DOMAIN') or _cname_domain(),
+                              header=app.config.get('TENANT_HEADER'),
+                              cache_seconds=app.config.get('TENANT_CACHE_SECONDS', 30))
+    app.extensions['tenancy'] = resolver
+    app.before_request(resolver.resolve)
+    return resolver
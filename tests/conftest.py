@@ -0,0 +1,70 @@
+"""Shared pytest fixtures - seeded apps at several data sizes and a SQL query counter"""
+
+import os
+import sys
+from argparse import Namespace
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+
+from app import create_app  # noqa: E402
+from models import db  # noqa: E402
+from generate_data import generate  # noqa: E402
+from instrumentation import QueryCounter  # noqa: E402
+
+PASSWORD = 'password123'
+
+# Synthetic data volumes (see scripts/generate_data.py)
+DATA_SIZES = {
+    'small': dict(users=20, instructors=1, scenarios=5, sessions=500),
+    'medium': dict(users=100, instructors=2, scenarios=20, sessions=5000),
+    'large': dict(users=300, instructors=3, scenarios=40, sessions=20000),
+}
+
+
+@pytest.fixture(scope='module', params=list(DATA_SIZES))
+def seeded_app(request):
+    """A testing app with an in-memory database filled by generate_data"""
+    size = DATA_SIZES[request.param]
+    app = create_app('testing')
+    with app.app_context():
+        generate(Namespace(password=PASSWORD, seed=42, batch_size=5000, **size))
+    app.data_size = SimpleNamespace(name=request.param, **size)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def app():
+    """A fresh testing app with the small data set - for tests that change data"""
+    app = create_app('testing')
+    with app.app_context():
+        generate(Namespace(password=PASSWORD, seed=42, batch_size=5000, **DATA_SIZES['small']))
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def login(client, username, password=PASSWORD):
+    """Log a test client in, starting from a logged-out state"""
+    client.get('/auth/logout')
+    response = client.post('/auth/login', data={'username': username, 'password': password})
+    assert response.status_code == 302, f'login failed for {username}'
+    return client
+
+
+@pytest.fixture
+def count_queries(seeded_app):
+    """count_queries() -> context manager; .count holds the number of statements"""
+    def factory():
+        with seeded_app.app_context():
+            engine = db.engine
+        return QueryCounter(engine)
+    return factory
@@ -0,0 +1,44 @@
+"""Session archival (archive.py)"""
+
+from archive import archive_sessions, iter_archived, list_archives, _append
+from models import db, Scenario, TrainingSession, User
+
+
+def _totals():
+    return ({user.id: user._session_totals() for user in User.query.all()},
+            {scenario.id: scenario._session_totals() for scenario in Scenario.query.all()})
+
+
+def test_archived_sessions_round_trip_and_keep_totals(app, tmp_path):
+    directory = str(tmp_path)
+    with app.app_context():
+        before = _totals()
+        table = TrainingSession.__table__
+        live = {row['id']: dict(row) for row in db.session.execute(db.select(table)).mappings()}
+
+        stats = archive_sessions(directory, retention_days=90, batch_size=100)
+        assert stats['archived'] > 0
+        assert stats['batches'] >= 2
+        assert {month for month, _path, _size in list_archives(directory)} == stats['months']
+
+        remaining = {row.id for row in db.session.execute(db.select(table.c.id))}
+        archived = {row['id']: row for row in iter_archived(directory)}
+        assert len(archived) == stats['archived']
+        assert not remaining & set(archived)
+        assert remaining | set(archived) == set(live)
+        for session_id, row in archived.items():
+            assert row == live[session_id]
+            assert row['status'] in ('completed', 'abandoned')
+
+        # Live rows and summaries together add up to what the sessions did before
+        assert _totals() == before
+        user = User.query.filter_by(username='trainee000001').one()
+        assert user.get_started_sessions_count() == before[0][user.id][0]
+
+        # A batch written again (its commit failed last time) reads back once
+        month, path, _size = list_archives(directory)[0]
+        rows = list(iter_archived(directory, months={month}))
+        _append(path, rows)
+        assert list(iter_archived(directory, months={month})) == rows
+
+        assert archive_sessions(directory, retention_days=90)['archived'] == 0
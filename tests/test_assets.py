@@ -0,0 +1,23 @@
+"""Static asset fingerprinting (assets.py)"""
+
+import gzip
+import re
+
+from app import create_app
+
+
+def test_precompressed_assets_keep_the_requested_name():
+    client = create_app('testing').test_client()
+    page = client.get('/auth/login').get_data(as_text=True)
+    url = re.search(r'/static/css/main\.[0-9a-f]{10}\.css', page).group(0)
+    name = url.rsplit('/', 1)[1]
+    plain = client.get(url)
+    assert plain.status_code == 200 and 'Content-Encoding' not in plain.headers
+
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert response.headers['Content-Disposition'] == f'inline; filename={name}'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert gzip.decompress(response.get_data()) == plain.get_data()
@@ -0,0 +1,501 @@
+"""
+Performance regression suite for hot routes and model methods.
+
+Each benchmark runs at every size in conftest.DATA_SIZES and also asserts
+a query-count budget, so an N+1 introduced anywhere fails the run even
+when the timing noise hides it.
+
+Save a baseline on the reference machine, then compare against it:
+  pytest tests/test_benchmarks.py --benchmark-autosave
+  pytest tests/test_benchmarks.py --benchmark-compare --benchmark-compare-fail=mean:20%
+
+Quick correctness-only pass (each benchmark runs once, budgets still checked):
+  pytest tests/test_benchmarks.py --benchmark-disable
+"""
+
+import io
+import json
+import os
+
+import pytest
+
+from conftest import PASSWORD, login
+from models import db, User, Scenario, TrainingSession, Organisation, TeamExercise
+from instrumentation import PeakMemory
+import compact_json
+import ratelimit
+import read_models
+import tenancy
+
+pytest.importorskip('pytest_benchmark')
+
+
+# Maximum SQL statements per call. Budgets that grow with the data are
+# known N+1s, spelled out so that a *new* one fails loudly.
+QUERY_BUDGETS = {
+    'auth.login': lambda size: 1,
+    # Refused before the view runs: no user load, no password hash
+    'auth.login (rate limited)': lambda size: 0,
+    'scenarios.start': lambda size: 6,
+    # +1 cohort rollup UPDATE, +3 leaderboard read and upserts (when the best improves),
+    # +1 skill profile UPDATE, +1 version category points (once per worker and version),
+    # +1 version (or scenario) max_points to clamp the posted score
+    'scenarios.complete': lambda size: 10,
+    # User load, library stamp, skill profile - ranked results are cached per user
+    'dashboard': lambda size: 3,
+    # User load, two facet GROUP BYs, one page of results - independent of library size
+    'scenarios.search': lambda size: 4,
+    # Read-model projections (read_models.py): joined/grouped selects, no lazy loads
+    'admin.reports': lambda size: 5,
+    'admin.users': lambda size: 2,
+    'admin.user_detail': lambda size: 3,
+    'admin.manage_scenarios': lambda size: 3,
+    # Scenario packs: one streamed select out; one title lookup in (re-importing writes nothing)
+    'admin.export_scenarios': lambda size: 3,
+    'admin.import_scenarios': lambda size: 2,
+    # Simulation is pure computation on the posted content - just the user load
+    'admin.simulate_scenario': lambda size: 1,
+    # Team exercises: user load and one membership + version read while nothing changed
+    'teams.state_json (unchanged)': lambda size: 2,
+    # User load, exercise, members, compare-and-swap UPDATE, decision INSERT (version graph cached per worker)
+    'teams.decide': lambda size: 5,
+    # Organisation requests go to the shard; the shard map lookup is cached
+    'tenant request (control database)': lambda size: 0,
+    'User.get_average_score': lambda size: 1,
+    'Scenario.update_average_score': lambda size: 1,
+}
+
+
+def assert_budget(name, app, counter):
+    budget = QUERY_BUDGETS[name](app.data_size)
+    assert counter.count <= budget, (
+        f'{name} issued {counter.count} queries at size {app.data_size.name!r} '
+        f'(budget {budget}):\n' + '\n'.join(counter.statements[:20])
+    )
+
+
+@pytest.fixture
+def uncached_app(seeded_app):
+    """Benchmarks measure the full render path, not fragment cache hits"""
+    cache = seeded_app.jinja_env.fragment_cache
+    seeded_app.jinja_env.fragment_cache = None
+    yield seeded_app
+    seeded_app.jinja_env.fragment_cache = cache
+
+
+def run_and_count(count_queries, func):
+    """Run once with the counter attached and return the counter"""
+    with count_queries() as counter:
+        func()
+    return counter
+
+
+# ========================
+# Routes
+# ========================
+def test_auth_login(benchmark, uncached_app, count_queries):
+    def do_login():
+        client = uncached_app.test_client()
+        response = client.post('/auth/login', data={'username': 'trainee000001', 'password': PASSWORD})
+        assert response.status_code == 302
+
+    benchmark.group = 'auth.login'
+    assert_budget('auth.login', uncached_app, run_and_count(count_queries, do_login))
+    benchmark(do_login)
+
+
+def test_auth_login_rate_limited(benchmark, uncached_app, count_queries, tmp_path):
+    limiter = uncached_app.extensions['rate_limiter']
+    store, limits = limiter.store, limiter.limits
+    limiter.store = ratelimit.SharedBuckets(str(tmp_path / 'buckets.bin'), 1024)
+    limiter.limits = {'auth.login': {'global': (0.001, 100), 'user': (0.001, 1)}}
+    client = uncached_app.test_client()
+
+    def do_login():
+        return client.post('/auth/login', data={'username': 'trainee000001', 'password': 'wrong'})
+
+    def refused_login():
+        response = do_login()
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) >= 1
+
+    try:
+        assert do_login().status_code == 200  # The user's one token: a normal failed login
+        benchmark.group = 'auth.login (rate limited)'
+        assert_budget('auth.login (rate limited)', uncached_app, run_and_count(count_queries, refused_login))
+        benchmark(refused_login)
+    finally:
+        limiter.store, limiter.limits = store, limits
+
+
+def test_scenarios_start(benchmark, uncached_app, count_queries):
+    client = login(uncached_app.test_client(), 'trainee000002')
+    with uncached_app.app_context():
+        user_id = User.query.filter_by(username='trainee000002').one().id
+
+    def clear_active():
+        # start() short-circuits on an existing in-progress session
+        with uncached_app.app_context():
+            TrainingSession.query.filter_by(user_id=user_id, status='in_progress').update(
+                {'status': 'abandoned'})
+            db.session.commit()
+
+    def do_start():
+        response = client.post('/scenarios/1/start')
+        assert response.status_code == 302
+        assert '/scenarios/session/' in response.headers['Location']
+
+    clear_active()
+    benchmark.group = 'scenarios.start'
+    assert_budget('scenarios.start', uncached_app, run_and_count(count_queries, do_start))
+    benchmark.pedantic(do_start, setup=clear_active, rounds=20)
+
+
+def test_scenarios_complete(benchmark, uncached_app, count_queries):
+    client = login(uncached_app.test_client(), 'trainee000003')
+    with uncached_app.app_context():
+        user_id = User.query.filter_by(username='trainee000003').one().id
+
+    def new_session():
+        with uncached_app.app_context():
+            session = TrainingSession(user_id=user_id, scenario_id=1, status='in_progress')
+            db.session.add(session)
+            db.session.commit()
+            return (session.id,), {}
+
+    def do_complete(session_id):
+        response = client.post(f'/scenarios/session/{session_id}/complete',
+                               json={'score': 72, 'metrics': {'detection': 20, 'containment': 15}})
+        assert response.status_code == 200
+
+    benchmark.group = 'scenarios.complete'
+    args, _ = new_session()
+    assert_budget('scenarios.complete', uncached_app,
+                  run_and_count(count_queries, lambda: do_complete(*args)))
+    benchmark.pedantic(do_complete, setup=new_session, rounds=20)
+
+
+def test_scenarios_search(benchmark, uncached_app, count_queries):
+    client = login(uncached_app.test_client(), 'trainee000003')
+
+    def do_search():
+        response = client.get('/scenarios/search?q=ransom+backup')
+        assert response.status_code == 200
+        assert b'result-card' in response.data
+
+    benchmark.group = 'scenarios.search'
+    assert_budget('scenarios.search', uncached_app, run_and_count(count_queries, do_search))
+    benchmark(do_search)
+
+
+def test_dashboard_recommendations(benchmark, uncached_app, count_queries):
+    client = login(uncached_app.test_client(), 'trainee000004')
+
+    def do_get():
+        response = client.get('/dashboard')
+        assert response.status_code == 200
+        assert b'Recommended Next' in response.data
+
+    do_get()  # Builds the library matrix and this user's ranking
+    benchmark.group = 'dashboard'
+    assert_budget('dashboard', uncached_app, run_and_count(count_queries, do_get))
+    benchmark(do_get)
+
+
+@pytest.mark.parametrize('endpoint, path', [
+    ('admin.reports', '/admin/reports'),
+    ('admin.users', '/admin/users'),
+    ('admin.user_detail', '/admin/users/5'),
+    ('admin.manage_scenarios', '/admin/scenarios/manage'),
+])
+def test_admin_pages(benchmark, uncached_app, count_queries, endpoint, path):
+    client = login(uncached_app.test_client(), 'instructor000')
+
+    def do_get():
+        response = client.get(path)
+        assert response.status_code == 200
+
+    benchmark.group = endpoint
+    assert_budget(endpoint, uncached_app, run_and_count(count_queries, do_get))
+    benchmark.pedantic(do_get, rounds=5, warmup_rounds=1)
+
+
+@pytest.mark.parametrize('method', ['exact', 'sampled'])
+def test_scenario_simulator(benchmark, uncached_app, count_queries, method):
+    client = login(uncached_app.test_client(), 'instructor000')
+    with uncached_app.app_context():
+        content = db.session.get(Scenario, 1).scenario_content
+    if method == 'sampled':
+        # A loop back to the first stage rules out exact enumeration
+        data = json.loads(content)
+        data['stages'][-1]['options'][0]['next'] = 0
+        content = json.dumps(data)
+
+    def do_simulate():
+        response = client.post('/admin/scenarios/simulate', json={'scenario_content': content, 'auto_max_points': True})
+        assert response.status_code == 200
+        report = response.get_json()
+        assert report['method'] == method
+        assert report['stages'][0]['reach'] == 1.0
+        assert abs(sum(report['outcomes'].values()) - 1) < 1e-3
+
+    benchmark.group = 'admin.simulate_scenario'
+    assert_budget('admin.simulate_scenario', uncached_app, run_and_count(count_queries, do_simulate))
+    benchmark.pedantic(do_simulate, rounds=3)
+
+
+def test_scenario_pack_round_trip(benchmark, uncached_app, count_queries):
+    client = login(uncached_app.test_client(), 'instructor000')
+    pack = {}
+
+    def do_export():
+        response = client.get('/admin/scenarios/export?format=jsonl')
+        assert response.status_code == 200
+        pack['data'] = response.data
+
+    def do_import():
+        response = client.post('/admin/scenarios/import', headers={'Accept': 'application/json'},
+                               data={'pack': (io.BytesIO(pack['data']), 'pack.jsonl')})
+        assert response.status_code == 200
+        summary = response.get_json()
+        assert summary['unchanged'] == uncached_app.data_size.scenarios
+        assert summary['created'] == summary['invalid'] == 0
+
+    benchmark.group = 'admin.scenario_packs'
+    assert_budget('admin.export_scenarios', uncached_app, run_and_count(count_queries, do_export))
+    assert_budget('admin.import_scenarios', uncached_app, run_and_count(count_queries, do_import))
+    benchmark.pedantic(lambda: (do_export(), do_import()), rounds=5)
+
+
+def test_tenant_routing(benchmark, uncached_app, count_queries, tmp_path):
+    resolver = uncached_app.extensions['tenancy']
+    engines, header = resolver.engines, resolver.header
+    resolver.engines = tenancy.ShardEngines({'a': f'sqlite:///{tmp_path}/a/{{tenant}}.db',
+                                             'b': f'sqlite:///{tmp_path}/b/{{tenant}}.db'})
+    resolver.header = 'X-Tenant'
+    tenant = {'X-Tenant': 'acme'}
+    client = uncached_app.test_client()
+
+    def tenant_search():
+        response = client.get('/scenarios/search?q=drill', headers=tenant)
+        assert response.status_code == 200
+        assert b'Acme tabletop drill' in response.data
+
+    try:
+        with uncached_app.app_context():
+            organisation = tenancy.create_organisation(uncached_app, 'acme', 'Acme', 'a', PASSWORD)
+            with tenancy.tenant_context(uncached_app, organisation):
+                admin = User.query.filter_by(username='admin').one()
+                db.session.add(Scenario(title='Acme tabletop drill', description='Only Acme sees this',
+                                        incident_type='phishing', created_by=admin.id,
+                                        scenario_content=json.dumps({'stages': []})))
+                db.session.commit()
+                assert Scenario.query.count() == 1
+
+        assert client.post('/auth/login', headers=tenant,
+                           data={'username': 'admin', 'password': PASSWORD}).status_code == 302
+        tenant_search()
+        # The cookie names its organisation, so it isn't a login on the control site (or another tenant)
+        assert client.get('/scenarios/').status_code == 302
+        assert client.get('/', headers={'X-Tenant': 'nope'}).status_code == 404
+        # Workers serve every organisation: no profiling or scheduler status for a tenant's instructors
+        profiler_enabled = uncached_app.config['PROFILER_ENABLED']
+        uncached_app.config['PROFILER_ENABLED'] = True
+        try:
+            assert client.get('/admin/profile?seconds=0.1', headers=tenant).status_code == 404
+        finally:
+            uncached_app.config['PROFILER_ENABLED'] = profiler_enabled
+        assert client.get('/admin/scheduler', headers=tenant).status_code == 404
+
+        benchmark.group = 'tenancy'
+        assert_budget('tenant request (control database)', uncached_app, run_and_count(count_queries, tenant_search))
+        benchmark(tenant_search)
+
+        with uncached_app.app_context():
+            stats = tenancy.move_organisation(uncached_app, 'acme', 'b', drain_seconds=0)
+            assert stats['tables']['scenarios'] == 1 and stats['tables']['users'] == 1
+            assert db.session.get(Organisation, organisation.id).shard == 'b'
+        tenant_search()  # Same session cookie, now served from shard b
+    finally:
+        with uncached_app.app_context():
+            Organisation.query.filter_by(slug='acme').delete()
+            db.session.commit()
+        resolver.forget('acme')
+        for shard in ('a', 'b'):
+            resolver.engines.dispose(shard, 'acme')
+        resolver.engines, resolver.header = engines, header
+
+
+def test_team_exercise(benchmark, uncached_app, count_queries):
+    lead, comms, third = (login(uncached_app.test_client(), f'trainee{n:06d}') for n in (5, 6, 7))
+    location = lead.post('/teams/start/1').headers['Location']
+    exercise_id = int(location.rsplit('/', 1)[1])
+    code = lead.get(f'/teams/{exercise_id}/state.json').get_json()['join_code']
+    for client in (comms, third):
+        assert client.post('/teams/join', data={'code': code.lower()}).status_code == 302
+    assert lead.get(f'/teams/{exercise_id}').status_code == 200
+
+    # Roles are exclusive
+    assert lead.post(f'/teams/{exercise_id}/roles', json={'roles': ['detection']}).status_code == 200
+    refused = comms.post(f'/teams/{exercise_id}/roles', json={'roles': ['detection', 'communication']})
+    assert refused.status_code == 409 and refused.get_json()['state']['members'][0]['roles'] == ['detection']
+    state = comms.post(f'/teams/{exercise_id}/roles', json={'roles': ['communication']}).get_json()
+    assert [member['roles'] for member in state['members']] == [['detection'], ['communication'], []]
+
+    # Polls are 304 until something changes
+    response = third.get(f'/teams/{exercise_id}/state.json')
+    etag = response.headers['ETag']
+
+    def unchanged_poll():
+        assert third.get(f'/teams/{exercise_id}/state.json', headers={'If-None-Match': etag}).status_code == 304
+
+    benchmark.group = 'teams'
+    assert_budget('teams.state_json (unchanged)', uncached_app, run_and_count(count_queries, unchanged_poll))
+    benchmark(unchanged_poll)
+
+    # Only the stage's owner decides it; anyone may decide stages nobody owns
+    owner = {'detection': lead, 'communication': comms}.get(state['stage_role'], third)
+    if owner is not third:
+        assert third.post(f'/teams/{exercise_id}/decide',
+                          json={'stage': 0, 'option': 0, 'version': state['version']}).status_code == 403
+
+    # Two decisions from the same version: the second one is refused, not applied twice
+    decided = run_and_count(count_queries, lambda: owner.post(
+        f'/teams/{exercise_id}/decide', json={'stage': 0, 'option': 0, 'version': state['version']}))
+    assert_budget('teams.decide', uncached_app, decided)
+    stale = owner.post(f'/teams/{exercise_id}/decide', json={'stage': 0, 'option': 1, 'version': state['version']})
+    assert stale.status_code == 409
+    state = stale.get_json()['state']
+    assert [decision['seq'] for decision in state['decisions']] == [state['version']] or state['status'] == 'completed'
+    assert third.get(f'/teams/{exercise_id}/state.json', headers={'If-None-Match': etag}).status_code == 200
+
+    # Everyone drops their roles and the team plays to the end
+    for client in (lead, comms):
+        client.post(f'/teams/{exercise_id}/roles', json={'roles': []})
+    state = third.get(f'/teams/{exercise_id}/state.json').get_json()
+    for _ in range(20):
+        if state['status'] == 'completed':
+            break
+        state = third.post(f'/teams/{exercise_id}/decide',
+                           json={'stage': state['stage'], 'option': 0, 'version': state['version']}).get_json()
+    assert state['status'] == 'completed' and state['results_url']
+
+    with uncached_app.app_context():
+        exercise = db.session.get(TeamExercise, exercise_id)
+        sessions = TrainingSession.query.filter(TrainingSession.session_data.isnot(None),
+                                                TrainingSession.status == 'completed',
+                                                TrainingSession.completed_at == exercise.completed_at).all()
+        assert len(sessions) == 3 and {session.score for session in sessions} == {exercise.score}
+        assert json.loads(sessions[0].session_data)['team_exercise'] == exercise_id
+    assert lead.get(f'/teams/{exercise_id}').status_code == 302  # On to the results page
+
+
+# ========================
+# Read models
+# ========================
+@pytest.mark.parametrize('name, load_orm, load_projection', [
+    ('completed sessions',
+     lambda: [(s, s.user.username, s.scenario.title)
+              for s in TrainingSession.query.filter_by(status='completed').all()],
+     read_models.completed_session_rows),
+    ('users',
+     lambda: [(u, u.get_completed_scenarios_count(), u.get_started_sessions_count())
+              for u in User.query.order_by(User.created_at.desc()).all()],
+     read_models.user_rows),
+])
+def test_read_model_memory(benchmark, uncached_app, name, load_orm, load_projection):
+    """Projections must keep well under the memory the same rows cost as ORM objects"""
+    with uncached_app.app_context():
+        # Warm SQLAlchemy's statement cache so only the rows are measured
+        load_orm(), load_projection()
+        # Check out the connection first - the pool's checkout bookkeeping isn't rows either
+        db.session.remove()
+        db.session.connection()
+        with PeakMemory() as orm:
+            rows = load_orm()
+        del rows
+        db.session.remove()
+        db.session.connection()
+        with PeakMemory() as projection:
+            rows = load_projection()
+        row_count = len(rows)
+        del rows
+
+        benchmark.group = f'read_models: {name}'
+        benchmark.extra_info.update(orm_peak_bytes=orm.peak, projection_peak_bytes=projection.peak)
+        # A few dozen rows are dominated by fixed result-set overhead
+        ratio = 0.75 if row_count >= 100 else 1.0
+        assert projection.peak < ratio * orm.peak, (
+            f'{name}: {row_count} projections peaked at {projection.peak} bytes vs {orm.peak} for ORM objects')
+        benchmark(load_projection)
+
+
+# ========================
+# Compressed JSON columns
+# ========================
+def _decision_log(decisions):
+    return json.dumps({'decisions': [
+        {'decision': {'stage': i, 'option': i % 4, 'points': 25}, 'recorded_at': f'2026-10-19T12:00:{i:02d}.123456'}
+        for i in range(decisions)]}, separators=(',', ':'))
+
+
+with open(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'example_scenario.json'), encoding='utf-8') as f:
+    JSON_DOCUMENTS = {'example_scenario': f.read(), 'decision_log': _decision_log(8)}
+
+
+@pytest.mark.parametrize('document', list(JSON_DOCUMENTS))
+@pytest.mark.parametrize('operation', ['encode', 'decode'])
+def test_json_column_codec(benchmark, document, operation):
+    text = JSON_DOCUMENTS[document]
+    encoded = compact_json.encode(text)
+    assert compact_json.is_encoded(encoded)
+    assert compact_json.decode(encoded) == text
+    assert compact_json.decode(text) == text  # Legacy rows read back unchanged
+    assert len(encoded) < len(text.encode('utf-8')) / 2
+
+    benchmark.group = 'compact_json'
+    benchmark.extra_info.update(text_bytes=len(text.encode('utf-8')), stored_bytes=len(encoded))
+    if operation == 'encode':
+        benchmark(compact_json.encode, text)
+    else:
+        benchmark(compact_json.decode, encoded)
+
+
+def test_json_column_storage(benchmark, uncached_app):
+    """Bytes scenario_content takes in the database, and the cost of loading the whole library"""
+    with uncached_app.app_context():
+        table = Scenario.__table__
+        stored = db.session.execute(db.select(db.func.sum(db.func.length(
+            db.type_coerce(table.c.scenario_content, db.LargeBinary))))).scalar()
+        texts = db.session.execute(db.select(Scenario.scenario_content)).scalars().all()
+        text_bytes = sum(len(text.encode('utf-8')) for text in texts)
+        assert all(text.startswith('{') for text in texts)
+        assert stored < text_bytes / 2
+
+        benchmark.group = 'compact_json'
+        benchmark.extra_info.update(text_bytes=text_bytes, stored_bytes=stored, ratio=round(stored / text_bytes, 3))
+        benchmark(lambda: db.session.execute(db.select(Scenario.scenario_content)).scalars().all())
+
+
+# ========================
+# Model methods
+# ========================
+def test_user_get_average_score(benchmark, uncached_app, count_queries):
+    with uncached_app.app_context():
+        user = User.query.filter_by(username='trainee000004').one()
+
+        benchmark.group = 'User.get_average_score'
+        assert_budget('User.get_average_score', uncached_app,
+                      run_and_count(count_queries, user.get_average_score))
+        benchmark(user.get_average_score)
+
+
+def test_scenario_update_average_score(benchmark, uncached_app, count_queries):
+    with uncached_app.app_context():
+        scenario = db.session.get(Scenario, 1)
+
+        benchmark.group = 'Scenario.update_average_score'
+        assert_budget('Scenario.update_average_score', uncached_app,
+                      run_and_count(count_queries, scenario.update_average_score))
+        benchmark(scenario.update_average_score)
+        db.session.rollback()
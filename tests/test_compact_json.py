@@ -0,0 +1,68 @@
+"""Compressed JSON columns (compact_json.py)"""
+
+import json
+import zlib
+
+import pytest
+
+import compact_json
+from compact_json import RAW, ZLIB, ZSTD, ZDICT, MIN_COMPRESS_BYTES, decode, encode, is_encoded
+from models import db, Scenario
+
+DOCUMENT = json.dumps({
+    'intro': 'Ransomware on the file server – “urgent”',
+    'stages': [{'stage': 'detection', 'content': 'Time is critical.', 'question': 'What do you do?',
+                'options': [{'text': 'Isolate the host', 'points': 30, 'next': 'END',
+                             'metrics': {'detection': 10, 'containment': 20}}]}],
+}, indent=2, ensure_ascii=False)
+
+
+def test_legacy_text_reads_back_unchanged():
+    assert decode(DOCUMENT) == DOCUMENT
+    assert not is_encoded(DOCUMENT.encode('utf-8'))
+    assert decode(DOCUMENT.encode('utf-8')) == DOCUMENT  # Text left in a binary column
+    assert decode(memoryview(b'{"decisions": []}')) == '{"decisions": []}'
+
+
+def test_short_values_are_stored_raw():
+    text = '{"decisions": []}'
+    assert len(text) < MIN_COMPRESS_BYTES
+    value = encode(text)
+    assert value == bytes((RAW,)) + text.encode('utf-8')
+    assert is_encoded(value) and decode(value) == text
+    assert decode(encode('')) == ''
+
+
+def test_zlib_envelope_round_trips_exactly():
+    value = encode(DOCUMENT, codec=ZLIB)
+    assert value[0] == ZLIB and len(value) < len(DOCUMENT.encode('utf-8'))
+    assert decode(value) == DOCUMENT
+    assert decode(bytearray(value)) == DOCUMENT
+
+    # The format is raw deflate primed with ZDICT - values written by any level read back
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS, 9, zlib.Z_DEFAULT_STRATEGY, ZDICT)
+    assert decode(bytes((ZLIB,)) + compressor.compress(DOCUMENT.encode('utf-8')) + compressor.flush()) == DOCUMENT
+
+
+def test_zstd_envelope():
+    if compact_json.zstandard is None:
+        with pytest.raises(RuntimeError, match='zstandard'):
+            decode(bytes((ZSTD,)) + b'\x28\xb5\x2f\xfd')
+        return
+    value = encode(DOCUMENT, codec=ZSTD)
+    assert value[0] == ZSTD and decode(value) == DOCUMENT
+
+
+def test_column_reads_legacy_and_encoded_rows(app):
+    with app.app_context():
+        legacy = '{"intro": "Saved before compression", "stages": []}'
+        db.session.execute(db.text('UPDATE scenarios SET scenario_content = :text WHERE id = 1'), {'text': legacy})
+        db.session.commit()
+        assert db.session.get(Scenario, 1).scenario_content == legacy
+
+        db.session.get(Scenario, 2).scenario_content = DOCUMENT
+        db.session.commit()
+        stored = db.session.execute(db.text('SELECT scenario_content FROM scenarios WHERE id = 2')).scalar()
+        assert is_encoded(stored) and stored[0] == ZLIB
+        db.session.expire_all()
+        assert db.session.get(Scenario, 2).scenario_content == DOCUMENT
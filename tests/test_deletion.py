@@ -0,0 +1,109 @@
+"""Chunked user and scenario deletes (deletion.py)"""
+
+import json
+
+from werkzeug.security import generate_password_hash
+
+from conftest import login, PASSWORD
+from models import (db, User, Scenario, Cohort, CohortRollup, LeaderboardEntry, SessionSummary,
+                    ScenarioPublication, TrainingSession)
+
+
+def _references(target, row_id):
+    """{table: rows} still pointing at `row_id` through an ON DELETE CASCADE key on `target`"""
+    counts = {}
+    for table in db.metadata.sorted_tables:
+        for fk in table.foreign_keys:
+            if fk.column.table.name == target and fk.ondelete == 'CASCADE':
+                counts[table.name] = db.session.execute(
+                    db.select(db.func.count()).select_from(table).where(fk.parent == row_id)).scalar()
+    return counts
+
+
+def _setup_cohort(trainee_name):
+    instructor = User.query.filter_by(username='instructor000').one()
+    trainee = User.query.filter_by(username=trainee_name).one()
+    cohort = Cohort(name='Red team', created_by=instructor.id)
+    db.session.add(cohort)
+    db.session.flush()
+    cohort.add_members([trainee.id])
+    cohort.assign_scenarios([1, 2], instructor.id)
+    db.session.commit()
+    CohortRollup.rebuild(cohort.id)
+    db.session.commit()
+    return trainee.id, cohort.id
+
+
+def test_deleting_a_user_cascades(app):
+    with app.app_context():
+        assert db.session.execute(db.text('PRAGMA foreign_keys')).scalar() == 1
+        user_id, cohort_id = _setup_cohort('trainee000002')
+        SessionSummary.add([dict({name: 1 for name in SessionSummary.TOTALS}, user_id=user_id, scenario_id=1,
+                                 best_score=50, best_score_at=None, last_completed_at=None)])
+        db.session.commit()
+        before = _references('users', user_id)
+        assert before['training_sessions'] and before['cohort_members'] and before['session_summaries']
+        assert sum(rollup.sessions_completed for rollup in CohortRollup.query.filter_by(cohort_id=cohort_id))
+
+    client = login(app.test_client(), 'instructor000')
+    response = client.post(f'/admin/users/{user_id}/delete')
+    assert response.status_code == 200, response.get_json()
+
+    with app.app_context():
+        assert db.session.get(User, user_id) is None
+        assert set(_references('users', user_id).values()) == {0}
+        assert not LeaderboardEntry.query.filter_by(user_id=user_id).count()
+        assert db.session.execute(db.text('PRAGMA foreign_key_check')).all() == []
+        # The cohort's totals no longer include the user's sessions
+        assert all(rollup.sessions_completed == 0 for rollup in CohortRollup.query.filter_by(cohort_id=cohort_id))
+
+
+def test_deleting_a_scenario_cascades(app):
+    with app.app_context():
+        _user_id, cohort_id = _setup_cohort('trainee000003')
+        before = _references('scenarios', 1)
+        assert before['training_sessions'] and before['cohort_assignments'] and before['cohort_rollups']
+        assert ScenarioPublication.query.filter_by(scenario_id=1).count()
+
+    client = login(app.test_client(), 'instructor000')
+    response = client.post('/admin/scenarios/1/delete')
+    assert response.status_code == 200, response.get_json()
+
+    with app.app_context():
+        assert db.session.get(Scenario, 1) is None
+        assert set(_references('scenarios', 1).values()) == {0}
+        assert not LeaderboardEntry.query.filter_by(scenario_id=1).count()
+        assert db.session.execute(db.text('PRAGMA foreign_key_check')).all() == []
+        assert db.session.get(Cohort, cohort_id).assignments.count() == 1
+
+
+def test_users_who_own_content_are_skipped(app):
+    with app.app_context():
+        owner = User(username='instructor900', email='i900@example.com', role='instructor',
+                     password_hash=generate_password_hash(PASSWORD))
+        db.session.add(owner)
+        db.session.flush()
+        db.session.add(Cohort(name='Purple team', created_by=owner.id))
+        db.session.commit()
+        owner_id = owner.id
+        author_id = Scenario.query.first().created_by
+        sessions = TrainingSession.query.filter_by(user_id=author_id).count()
+
+    client = login(app.test_client(), 'instructor000')
+    response = client.post(f'/admin/users/{owner_id}/delete')
+    assert response.status_code == 409
+    assert 'created cohorts' in response.get_json()['error']
+
+    login(client, 'instructor900')
+    response = client.post(f'/admin/users/{author_id}/delete')
+    assert response.status_code == 409
+    assert 'created scenarios' in response.get_json()['error']
+
+    response = client.post('/admin/bulk-delete', json={'kind': 'users', 'ids': [author_id, 999999]})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line['status'] for line in lines] == ['skipped', 'missing', 'done']
+    assert (lines[-1]['skipped'], lines[-1]['missing'], lines[-1]['deleted']) == (1, 1, 0)
+
+    with app.app_context():
+        assert db.session.get(User, owner_id) and db.session.get(User, author_id)
+        assert TrainingSession.query.filter_by(user_id=author_id).count() == sessions
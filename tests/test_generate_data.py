@@ -0,0 +1,29 @@
+"""Synthetic data generator (scripts/generate_data.py)"""
+
+from argparse import Namespace
+from datetime import datetime
+
+from app import create_app
+from models import db, Scenario, TrainingSession
+from conftest import PASSWORD, DATA_SIZES
+from generate_data import generate
+
+
+def _generated_rows(now):
+    app = create_app('testing')
+    with app.app_context():
+        generate(Namespace(password=PASSWORD, seed=7, batch_size=5000, now=now, **DATA_SIZES['small']))
+        rows = {table.name: db.session.execute(table.select().order_by(table.c.id)).all()
+                for table in (Scenario.__table__, TrainingSession.__table__)}
+        db.session.remove()
+        db.drop_all()
+    return rows
+
+
+def test_same_seed_and_now_give_same_data():
+    now = datetime(2026, 1, 1)
+    first, second = _generated_rows(now), _generated_rows(now)
+    assert first == second
+    started = [row.started_at for row in first['training_sessions']]
+    assert max(started) <= now
+    assert min(started) >= datetime(2025, 1, 1)
@@ -0,0 +1,22 @@
+"""Per-query timing listeners (instrumentation.py)"""
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+
+import instrumentation
+
+
+def test_failed_statements_drop_their_start_time():
+    engine = create_engine('sqlite://')
+    event.listen(engine, 'before_cursor_execute', instrumentation._before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', instrumentation._after_cursor_execute)
+    event.listen(engine, 'handle_error', instrumentation._handle_error)
+
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.exec_driver_sql('SELECT * FROM no_such_table')
+        conn.exec_driver_sql('SELECT 1')
+        # Otherwise each failure leaves a start behind, and the next query is timed from it
+        assert conn.info['query_start'] == []
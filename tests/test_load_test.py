@@ -0,0 +1,49 @@
+"""Load driver helpers (scripts/load_test.py)"""
+
+import load_test
+from load_test import Recorder, percentile
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile(list(range(1, 11)), 90) == 9
+    assert percentile(list(range(1, 11)), 95) == 10
+    assert percentile([7], 50) == 7
+    assert percentile([], 95) == 0.0
+
+
+class ScriptedDriver:
+    """Answers with the given statuses in turn"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+
+    def request(self, method, path, **kwargs):
+        status, headers = self.responses.pop(0)
+        return status, headers, ''
+
+
+def test_rate_limited_requests_are_retried_after_retry_after(monkeypatch):
+    waits = []
+    monkeypatch.setattr(load_test.time, 'sleep', waits.append)
+    recorder = Recorder()
+
+    driver = ScriptedDriver((429, {'Retry-After': '3'}), (429, {}), (302, {'Location': '/done'}))
+    status, location, _body = recorder.timed(driver, 'scenarios.complete', 'POST', '/complete')
+    assert (status, location) == (302, '/done')
+    assert waits == [3, 1]
+    assert recorder.throttled['scenarios.complete'] == 2
+    assert recorder.errors['scenarios.complete'] == 0
+    assert len(recorder.samples['scenarios.complete']) == 1
+
+    driver = ScriptedDriver(*[(429, {'Retry-After': '1'})] * (load_test.THROTTLED_RETRIES + 1))
+    status, _location, _body = recorder.timed(driver, 'auth.login', 'POST', '/auth/login')
+    assert status == 429
+    assert recorder.throttled['auth.login'] == load_test.THROTTLED_RETRIES + 1
+    assert recorder.errors['auth.login'] == 1
+    assert recorder.samples['auth.login'] == []
+    load_test.report(recorder, 1.0)
@@ -0,0 +1,39 @@
+"""Organisation management script (scripts/manage_tenants.py)"""
+
+import re
+from argparse import Namespace
+
+import pytest
+
+import manage_tenants
+import tenancy
+
+
+def _login(client, password):
+    return client.post('/auth/login', headers={'X-Tenant': 'acme'},
+                       data={'username': 'admin', 'password': password}).status_code
+
+
+def test_generated_admin_passwords_are_shown_once(app, tmp_path, capsys):
+    resolver = app.extensions['tenancy']
+    resolver.engines = tenancy.ShardEngines({'local': f'sqlite:///{tmp_path}/{{tenant}}.db'})
+    resolver.header = 'X-Tenant'
+
+    with app.app_context():
+        manage_tenants.create(app, Namespace(slug='acme', name='Acme', shard='local', password=None))
+    password = re.search(r"password is (\S+) ", capsys.readouterr().out).group(1)
+    assert _login(app.test_client(), password) == 302
+
+    with app.app_context():
+        manage_tenants.reset_password(app, Namespace(slug='acme', username='admin', password=None))
+        new_password = re.search(r"password is (\S+) ", capsys.readouterr().out).group(1)
+        manage_tenants.reset_password(app, Namespace(slug='acme', username='admin', password='chosen-one'))
+        assert 'password is' not in capsys.readouterr().out
+        with pytest.raises(tenancy.TenantError):
+            manage_tenants.reset_password(app, Namespace(slug='acme', username='nobody', password='x'))
+        with pytest.raises(tenancy.TenantError):
+            manage_tenants.reset_password(app, Namespace(slug='globex', username='admin', password='x'))
+
+    assert new_password != password
+    assert _login(app.test_client(), new_password) == 200  # Replaced by --password
+    assert _login(app.test_client(), 'chosen-one') == 302
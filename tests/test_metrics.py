@@ -0,0 +1,24 @@
+"""Per-process metric files (metrics.py)"""
+
+import os
+
+import metrics
+
+
+def test_forked_workers_write_their_own_file(tmp_path):
+    """An app built before fork (gunicorn --preload) mustn't share the master's file"""
+    store = metrics.MmapValues(str(tmp_path), set())
+    store.inc_many([('requests', 1.0)])
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            store.inc_many([('requests', 2.0)])
+            os._exit(0 if store.path.endswith(f'metrics_{os.getpid()}.db') else 1)
+        except BaseException:
+            os._exit(2)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert sorted(os.listdir(tmp_path)) == sorted([f'metrics_{os.getpid()}.db', f'metrics_{pid}.db'])
+    assert store.collect(set()) == {'requests': 3.0}
@@ -0,0 +1,24 @@
+"""Worker profiling (profiler.py, /admin/profile)"""
+
+import re
+
+from conftest import login
+
+
+def test_worker_profile_needs_threaded_worker_and_stays_under_timeout(app):
+    app.config.update(PROFILER_ENABLED=True, PROFILER_MAX_SECONDS=10, WORKER_TIMEOUT=0.4)
+    client = login(app.test_client(), 'instructor000')
+
+    # A sync worker (wsgi.multithread false) would only sample the profiling request itself
+    refused = client.get('/admin/profile?seconds=1')
+    assert refused.status_code == 409 and b'--threads' in refused.data
+
+    response = client.get('/admin/profile?seconds=30', environ_overrides={'wsgi.multithread': True})
+    assert response.status_code == 200
+    assert re.match(r'# \d+ samples over 0\.2s', response.get_data(as_text=True))
+
+
+def test_worker_profile_is_instructor_only(app):
+    app.config['PROFILER_ENABLED'] = True
+    client = login(app.test_client(), 'trainee000001')
+    assert client.get('/admin/profile?seconds=0.1', environ_overrides={'wsgi.multithread': True}).status_code != 200
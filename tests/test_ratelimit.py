@@ -0,0 +1,99 @@
+"""Token-bucket admission control (ratelimit.py)"""
+
+import fcntl
+import os
+import threading
+
+import pytest
+
+import ratelimit
+from conftest import login
+from models import db
+
+
+@pytest.fixture(params=['memory', 'shared', 'database'])
+def stores(request, app, tmp_path):
+    """Two handles on one bucket store, as two workers would have"""
+    if request.param == 'memory':
+        store = ratelimit.LocalBuckets()
+        yield store, store
+    elif request.param == 'shared':
+        path = str(tmp_path / 'buckets.bin')
+        yield ratelimit.SharedBuckets(path, 64), ratelimit.SharedBuckets(path, 64)
+    else:
+        with app.app_context():
+            yield ratelimit.DatabaseBuckets(db.engine), ratelimit.DatabaseBuckets(db.engine)
+
+
+def test_buckets_refill_at_their_rate(stores):
+    first, second = stores
+    bucket = [('t:auth.login:user:alice', 2.0, 3.0)]  # 2 tokens a second, burst of 3
+    now = 1_000_000.0
+
+    assert first.take(bucket, now) == [0.0]
+    assert second.take(bucket, now) == [0.0]
+    assert first.take(bucket, now) == [0.0]
+    assert second.take(bucket, now) == pytest.approx([0.5])  # Empty - half a second to the next token
+    assert first.take(bucket, now + 0.25) == pytest.approx([0.25])
+    assert second.take(bucket, now + 0.5) == [0.0]
+    assert first.take(bucket, now + 0.5) == pytest.approx([0.5])
+
+    # A long idle refills only up to the burst
+    later = now + 3600
+    assert [first.take(bucket, later) for _ in range(4)] == [[0.0], [0.0], [0.0], pytest.approx([0.5])]
+
+
+def test_buckets_are_taken_all_or_nothing(stores):
+    first, second = stores
+    roomy, tight = ('t:x:global:', 1.0, 10.0), ('t:x:user:1', 0.1, 1.0)
+    now = 1_000_000.0
+
+    assert first.take([roomy, tight], now) == [0.0, 0.0]
+    waits = second.take([roomy, tight], now)
+    assert waits[1] == pytest.approx(10.0)
+    # The refused request took nothing from the roomy bucket: 9 tokens are left in it
+    assert [first.take([roomy], now) for _ in range(10)][-2:] == [[0.0], pytest.approx([1.0])]
+
+
+def test_forked_workers_lock_the_shared_file_themselves(tmp_path):
+    """A store built before fork (gunicorn --preload) must still exclude sibling workers"""
+    store = ratelimit.SharedBuckets(str(tmp_path / 'buckets.bin'), 64)
+    bucket = [('t:x:user:1', 1.0, 5.0)]
+    store.take(bucket, 1_000_000.0)
+    fcntl.flock(store._fd, fcntl.LOCK_EX)  # The master, mid-take
+
+    pid = os.fork()
+    if pid == 0:
+        taking = threading.Thread(target=store.take, args=(bucket, 1_000_000.0), daemon=True)
+        taking.start()
+        taking.join(0.5)
+        os._exit(1 if not taking.is_alive() else 0)  # Got through the master's lock
+    _, status = os.waitpid(pid, 0)
+    fcntl.flock(store._fd, fcntl.LOCK_UN)
+
+    assert os.waitstatus_to_exitcode(status) == 0
+
+
+def test_refused_posts_get_retry_after(app):
+    limiter = app.extensions['rate_limiter']
+    limiter.limits = {'auth.login': {'user': (0.25, 2)}, 'scenarios.complete': {'user': (0.1, 1)}}
+    client = app.test_client()
+
+    def attempt():
+        return client.post('/auth/login', data={'username': 'Trainee000004', 'password': 'wrong'})
+
+    assert [attempt().status_code for _ in range(2)] == [200, 200]
+    refused = attempt()
+    assert refused.status_code == 429
+    assert refused.headers['Retry-After'] == '4'  # A whole token at 0.25 a second
+    assert refused.headers['Cache-Control'] == 'no-store'
+    # Keyed on the submitted username, not the client
+    assert client.post('/auth/login', data={'username': 'trainee000005', 'password': 'wrong'}).status_code == 200
+
+    login(client, 'trainee000006')
+    session_id = int(client.post('/scenarios/1/start').headers['Location'].rsplit('/', 1)[1])
+    assert client.post(f'/scenarios/session/{session_id}/complete', json={'score': 10}).status_code == 200
+    refused = client.post(f'/scenarios/session/{session_id}/complete', json={'score': 10})
+    assert refused.status_code == 429
+    assert refused.headers['Retry-After'] == '10'
+    assert refused.get_json() == {'error': 'Too many requests', 'retry_after': 10}
@@ -0,0 +1,27 @@
+"""Skill profiles and recommendations (recommender.py)"""
+
+from conftest import login
+from models import db, SkillProfile, User
+from recommender import rebuild_profiles
+
+
+def test_missing_profiles_are_built_once(app):
+    with app.app_context():
+        user_id = User.query.filter_by(username='trainee000001').one().id
+        SkillProfile.query.filter_by(user_id=user_id).delete()
+        db.session.commit()
+
+    client = login(app.test_client(), 'trainee000001')
+    assert client.get('/dashboard').status_code == 200
+    with app.app_context():
+        built = db.session.get(SkillProfile, user_id)
+        assert built.sessions > 0
+        # Another tab built it first: a second build leaves that row alone instead of failing on the key
+        built.sessions = 999
+        db.session.commit()
+        assert rebuild_profiles([user_id], keep_existing=True) == 1
+        db.session.commit()
+        db.session.expire_all()
+        assert db.session.get(SkillProfile, user_id).sessions == 999
+        assert SkillProfile.query.filter_by(user_id=user_id).count() == 1
+    assert client.get('/dashboard').status_code == 200
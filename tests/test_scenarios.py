@@ -0,0 +1,111 @@
+"""Gameplay routes (routes/scenarios.py)"""
+
+import json
+
+from conftest import login
+from models import db, Cohort, CohortRollup, LeaderboardEntry, Scenario, ScenarioVersion, TrainingSession, User
+
+
+def test_completing_twice_is_refused(app):
+    with app.app_context():
+        trainee = User.query.filter_by(username='trainee000001').one()
+        instructor = User.query.filter_by(role='instructor').first()
+        cohort = Cohort(name='Blue team', created_by=instructor.id)
+        db.session.add(cohort)
+        db.session.flush()
+        cohort.add_members([trainee.id])
+        cohort.assign_scenarios([1], instructor.id)
+        db.session.commit()
+        CohortRollup.rebuild(cohort.id)
+        db.session.commit()
+        cohort_id = cohort.id
+
+    client = login(app.test_client(), 'trainee000001')
+    location = client.post('/scenarios/1/start').headers['Location']
+    session_id = int(location.rsplit('/', 1)[1])
+
+    first = client.post(f'/scenarios/session/{session_id}/complete', json={'score': 90, 'metrics': {'detection': 40}})
+    assert first.status_code == 200
+    # A replay from the offline queue with a different score
+    again = client.post(f'/scenarios/session/{session_id}/complete', json={'score': 10, 'metrics': {'detection': 1}})
+    assert again.status_code == 409
+    assert again.get_json()['redirect'].endswith(f'/session/{session_id}/results')
+
+    with app.app_context():
+        session = db.session.get(TrainingSession, session_id)
+        assert (session.score, session.detection_score, session.outcome) == (90, 40, 'success')
+        user_id = User.query.filter_by(username='trainee000001').one().id
+        best = LeaderboardEntry.query.filter_by(user_id=user_id, scenario_id=1).all()
+        assert best and all(entry.score >= 90 for entry in best)
+
+        # The incremental rollup still matches a rebuild from the sessions
+        def rollup():
+            row = db.session.get(CohortRollup, (cohort_id, 1))
+            return row.sessions_completed, row.score_total, row.detection_total
+        maintained = rollup()
+        CohortRollup.rebuild(cohort_id)
+        db.session.commit()
+        assert rollup() == maintained
+
+
+def test_sessions_stay_on_their_version_across_an_edit(app):
+    trainee = login(app.test_client(), 'trainee000001')
+    location = trainee.post('/scenarios/1/start').headers['Location']
+    session_id = int(location.rsplit('/', 1)[1])
+
+    with app.app_context():
+        scenario = db.session.get(Scenario, 1)
+        old_hash, old_content, old_max = scenario.version_hash, scenario.scenario_content, scenario.max_points
+        assert db.session.get(TrainingSession, session_id).version_hash == old_hash
+        content = json.loads(old_content)
+        content['intro'] = 'Edited while a trainee was playing'
+        form = {'title': scenario.title, 'description': scenario.description,
+                'incident_type': scenario.incident_type, 'difficulty_level': scenario.difficulty_level,
+                'estimated_time': scenario.estimated_time, 'max_points': old_max + 10,
+                'scenario_content': json.dumps(content)}
+
+    instructor = login(app.test_client(), 'instructor000')
+    assert instructor.post('/admin/scenarios/1/edit', data=form).status_code == 302
+
+    with app.app_context():
+        scenario = db.session.get(Scenario, 1)
+        new_hash = scenario.version_hash
+        assert new_hash != old_hash and scenario.max_points == old_max + 10
+        assert db.session.get(TrainingSession, session_id).version_hash == old_hash
+        ScenarioVersion.prune()  # An in-progress session still needs the old version
+        db.session.commit()
+        assert db.session.get(ScenarioVersion, old_hash).max_points == old_max
+
+    page = trainee.get(f'/scenarios/session/{session_id}').get_data(as_text=True)
+    assert f'/versions/{old_hash}.json' in page and new_hash not in page
+    assert trainee.get(f'/scenarios/versions/{old_hash}.json').get_data(as_text=True) == old_content
+
+    # Finishing it keeps the old version; the next session plays the new one
+    assert trainee.post(f'/scenarios/session/{session_id}/complete', json={'score': 50}).status_code == 200
+    location = trainee.post('/scenarios/1/start').headers['Location']
+    next_id = int(location.rsplit('/', 1)[1])
+    assert next_id != session_id
+    with app.app_context():
+        assert db.session.get(TrainingSession, session_id).version_hash == old_hash
+        assert db.session.get(TrainingSession, next_id).version_hash == new_hash
+
+
+def test_posted_scores_are_clamped_to_max_points(app):
+    client = login(app.test_client(), 'trainee000002')
+    with app.app_context():
+        TrainingSession.query.filter_by(status='in_progress').update({'status': 'abandoned'})
+        db.session.commit()
+        max_points = db.session.get(Scenario, 1).max_points
+    session_id = int(client.post('/scenarios/1/start').headers['Location'].rsplit('/', 1)[1])
+
+    response = client.post(f'/scenarios/session/{session_id}/complete', json={
+        'score': 10 ** 9, 'metrics': {'detection': 10 ** 12, 'recovery': -5, 'containment': 'lots'}})
+    assert response.status_code == 200
+
+    with app.app_context():
+        session = db.session.get(TrainingSession, session_id)
+        assert session.score == max_points
+        assert (session.detection_score, session.recovery_score, session.containment_score) == (max_points, 0, 0)
+        user_id = session.user_id
+        assert max(entry.score for entry in LeaderboardEntry.query.filter_by(user_id=user_id, scenario_id=1)) \
+            == max_points
@@ -0,0 +1,69 @@
+"""Background maintenance jobs (scheduler.py)"""
+
+from datetime import datetime, timedelta
+
+from conftest import login
+from models import db, LeaderboardEntry, Scenario, SchedulerLock, TrainingSession
+from scheduler import LOCK_NAME, acquire_lease, reap_abandoned, release_lease
+
+
+def test_stats_refresh_keeps_scenario_cache_version(app):
+    with app.app_context():
+        Scenario.query.update({'times_played': 0, 'updated_at': Scenario.updated_at})
+        db.session.commit()
+        version = Scenario.cache_version()
+        edited = dict(db.session.query(Scenario.id, Scenario.updated_at).all())
+        Scenario.refresh_statistics()
+        db.session.commit()
+        assert sum(played for played, in db.session.query(Scenario.times_played)) > 0
+        assert Scenario.cache_version() == version
+        assert dict(db.session.query(Scenario.id, Scenario.updated_at).all()) == edited
+
+
+def test_lease_has_one_holder_until_it_expires(app):
+    now = datetime.utcnow()
+    later = lambda seconds: now + timedelta(seconds=seconds)  # noqa: E731
+    with app.app_context():
+        assert acquire_lease('host:1', 30, now=now)
+        assert not acquire_lease('host:2', 30, now=now)
+        assert acquire_lease('host:1', 30, now=later(20))  # Renewed until now + 50s
+        assert not acquire_lease('host:2', 30, now=later(40))
+        assert db.session.get(SchedulerLock, LOCK_NAME).holder == 'host:1'
+
+        # The leader stopped renewing - the first worker to tick after expiry takes over
+        assert acquire_lease('host:2', 30, now=later(50))
+        assert not acquire_lease('host:1', 30, now=later(51))
+        assert not acquire_lease('host:3', 30, now=later(51))
+        assert SchedulerLock.query.count() == 1
+
+        release_lease('host:1')  # Not the holder - changes nothing
+        assert not acquire_lease('host:1', 30, now=later(60))
+        release_lease('host:2')  # Clean shutdown - no waiting out the lease
+        assert acquire_lease('host:1', 30, now=later(61))
+        assert db.session.get(SchedulerLock, LOCK_NAME).holder == 'host:1'
+
+
+def test_reaped_sessions_are_over(app):
+    client = login(app.test_client(), 'trainee000001')
+    with app.app_context():
+        TrainingSession.query.filter_by(status='in_progress').update({'status': 'abandoned'})  # Start afresh
+        db.session.commit()
+    session_id = int(client.post('/scenarios/1/start').headers['Location'].rsplit('/', 1)[1])
+    with app.app_context():
+        session = db.session.get(TrainingSession, session_id)
+        session.started_at -= timedelta(hours=app.config['SESSION_ABANDON_AFTER_HOURS'] + 1)
+        db.session.commit()
+        assert reap_abandoned(app)['reaped'] == 1
+        entries = LeaderboardEntry.query.count()
+
+    assert client.get(f'/scenarios/session/{session_id}').headers['Location'].endswith('/scenarios/1')
+    submitted = client.post(f'/scenarios/session/{session_id}/submit', json={'decision': {'stage': 0, 'option': 0}})
+    assert submitted.status_code == 409
+    completed = client.post(f'/scenarios/session/{session_id}/complete', json={'score': 90})
+    assert completed.status_code == 409
+    assert completed.get_json()['redirect'].endswith('/scenarios/1')
+
+    with app.app_context():
+        session = db.session.get(TrainingSession, session_id)
+        assert (session.status, session.completed_at) == ('abandoned', None)
+        assert LeaderboardEntry.query.count() == entries
@@ -0,0 +1,56 @@
+"""Scenario search (search.py)"""
+
+import json
+from argparse import Namespace
+
+import pytest
+
+import search
+from app import create_app
+from conftest import PASSWORD, DATA_SIZES
+from generate_data import generate
+from models import db, Scenario, User
+from search import search_scenarios
+
+
+@pytest.fixture(params=['fts5', 'like'])
+def search_app(request, monkeypatch):
+    """The small data set searched with FTS5, and as on a SQLite built without it"""
+    if request.param == 'like':
+        monkeypatch.setattr(search, 'FTS5_DDL', search.FTS5_DDL.replace('USING fts5', 'USING no_such_module'))
+    app = create_app('testing')
+    with app.app_context():
+        generate(Namespace(password=PASSWORD, seed=42, batch_size=5000, **DATA_SIZES['small']))
+        assert search._backend() == request.param
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def _found(query):
+    return [result.scenario.title for result in search_scenarios(query).results]
+
+
+def test_stage_text_is_searched_on_every_backend(search_app):
+    content = {'intro': 'A quiet night shift', 'stages': [
+        {'stage': 'detection', 'content': 'The zebrafish dashboard lights up', 'question': 'What do you do?',
+         'options': [{'text': 'Page the on-call engineer', 'points': 10}]}]}
+    with search_app.app_context():
+        scenario = Scenario(title='Night shift', description='An alert after hours', incident_type='phishing',
+                            created_by=User.query.first().id, scenario_content=json.dumps(content))
+        db.session.add(scenario)
+        db.session.commit()
+        assert _found('zebrafish') == ['Night shift']
+        assert _found('night on-call') == ['Night shift']
+
+        content['stages'][0]['content'] = 'The dashboard lights up'
+        scenario.scenario_content = json.dumps(content)
+        db.session.commit()
+        assert _found('zebrafish') == []
+
+        assert search.rebuild_index() == Scenario.query.count()
+        assert _found('on-call') == ['Night shift']
+        db.session.delete(scenario)
+        db.session.commit()
+        assert _found('on-call') == []
@@ -0,0 +1,82 @@
+"""Team exercises (teams.py)"""
+
+import teams
+from conftest import login
+from models import db, TeamExercise, TeamMember
+
+
+def _start(app, *trainees):
+    """A team exercise on scenario 1 led by the first trainee; the others join. Returns (id, code, clients)"""
+    clients = [login(app.test_client(), f'trainee{n:06d}') for n in trainees]
+    exercise_id = int(clients[0].post('/teams/start/1').headers['Location'].rsplit('/', 1)[1])
+    code = clients[0].get(f'/teams/{exercise_id}/state.json').get_json()['join_code']
+    for client in clients[1:]:
+        assert client.post('/teams/join', data={'code': code}).status_code == 302
+    return exercise_id, code, clients
+
+
+def test_lost_compare_and_swap_returns_409_with_state(app, monkeypatch):
+    exercise_id, _code, (lead, mate) = _start(app, 1, 2)
+    version = lead.get(f'/teams/{exercise_id}/state.json').get_json()['version']
+
+    # A teammate commits between the request reading the exercise and writing it
+    play, raced = teams._play, []
+
+    def teammate_first(version_hash):
+        if not raced:
+            raced.append(True)
+            with db.engine.begin() as connection:
+                connection.execute(db.update(TeamExercise).where(TeamExercise.id == exercise_id)
+                                   .values(version=TeamExercise.version + 1))
+        return play(version_hash)
+
+    monkeypatch.setattr(teams, '_play', teammate_first)
+    response = lead.post(f'/teams/{exercise_id}/decide', json={'stage': 0, 'option': 0, 'version': version})
+    monkeypatch.undo()
+
+    assert response.status_code == 409
+    body = response.get_json()
+    assert body['error'] == 'A teammate changed the exercise first'
+    assert body['state']['version'] == version + 1
+    assert (body['state']['stage'], body['state']['decisions']) == (0, [])
+    with app.app_context():
+        assert db.session.get(TeamExercise, exercise_id).version == version + 1
+
+    # Sent again with the version from the 409, it goes through
+    decided = mate.post(f'/teams/{exercise_id}/decide', json={'stage': 0, 'option': 0, 'version': version + 1})
+    assert decided.status_code == 200
+    assert [d['seq'] for d in decided.get_json()['decisions']] == [version + 2]
+
+
+def test_compare_and_swap_retries_run_out(app, monkeypatch):
+    exercise_id, code, _clients = _start(app, 1)
+    client = login(app.test_client(), 'trainee000003')
+    attempts = []
+
+    def always_lost(exercise_id, version, **values):
+        attempts.append(version)
+        return False
+
+    monkeypatch.setattr(TeamExercise, 'compare_and_swap', always_lost)
+    response = client.post('/teams/join', data={'code': code}, follow_redirects=True)
+    monkeypatch.undo()
+    assert 'The team is busy' in response.get_data(as_text=True)
+    assert len(attempts) == app.config['TEAM_CAS_RETRIES']
+    with app.app_context():
+        assert TeamMember.query.filter_by(exercise_id=exercise_id).count() == 1
+
+
+def test_join_stops_at_team_max_members(app):
+    app.config['TEAM_MAX_MEMBERS'] = 3
+    exercise_id, code, (lead, *_) = _start(app, 1, 2, 3)
+
+    late = login(app.test_client(), 'trainee000004')
+    response = late.post('/teams/join', data={'code': code}, follow_redirects=True)
+    assert 'That team is full' in response.get_data(as_text=True)
+    assert late.get(f'/teams/{exercise_id}/state.json').status_code == 404
+
+    # Joining again as a member is still fine when the team is full
+    assert lead.post('/teams/join', data={'code': code}).headers['Location'].endswith(f'/teams/{exercise_id}')
+    with app.app_context():
+        assert TeamMember.query.filter_by(exercise_id=exercise_id).count() == 3
+        assert db.session.get(TeamExercise, exercise_id).version == 2  # Two joins, nothing else